@@ -0,0 +1,196 @@
+"""
+Acoustic stage
+==============
+Runs flow matching + HiFiGAN on a worker thread so that the LLM can decode the
+next sentences while the previous ones are turned into audio.
+
+Finished token sequences are queued with ``submit``. The worker drains the
+queue, groups jobs into length buckets, runs the flow decoder per utterance and
+the vocoder once per bucket, and resolves each job's future with its audio.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import torch
+
+from scripts.cv2.engine import Engine
+
+
+@dataclass
+class AcousticJob:
+    tokens: List[int]
+    model_input: Dict[str, torch.Tensor]
+    future: Future
+
+
+class AcousticStage:
+    def __init__(
+        self,
+        engine: Engine,
+        max_batch_size: int = 4,
+        bucket_tokens: int = 50,
+        max_wait_ms: float = 10.0,
+    ):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.bucket_tokens = bucket_tokens
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.jobs_done = 0
+        self._queue: "queue.Queue[AcousticJob]" = queue.Queue()
+        self._stream = (
+            torch.cuda.Stream(device=engine.device)
+            if engine.device.type == "cuda"
+            else None
+        )
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="acoustic", daemon=True)
+        self._thread.start()
+
+    def submit(self, tokens: List[int], model_input: Dict[str, torch.Tensor]) -> Future:
+        """Queue one token sequence; the future resolves to (1, N) audio."""
+        if self._closed:
+            raise RuntimeError("AcousticStage is closed")
+        future: Future = Future()
+        self._queue.put(AcousticJob(tokens, model_input, future))
+        return future
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _drain(self, first: AcousticJob) -> Tuple[List[AcousticJob], bool]:
+        """Collect what is queued, waiting up to ``max_wait_ms`` for more."""
+        jobs = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while True:
+            timeout = deadline - time.perf_counter()
+            try:
+                job = self._queue.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                return jobs, False
+            if job is None:
+                return jobs, True
+            jobs.append(job)
+
+    def _buckets(self, jobs: List[AcousticJob]) -> List[List[AcousticJob]]:
+        buckets: Dict[int, List[AcousticJob]] = {}
+        for job in jobs:
+            buckets.setdefault(len(job.tokens) // self.bucket_tokens, []).append(job)
+
+        batches = []
+        for key in sorted(buckets):
+            bucket = buckets[key]
+            for i in range(0, len(bucket), self.max_batch_size):
+                batches.append(bucket[i : i + self.max_batch_size])
+        return batches
+
+    def _synthesize(self, batch: List[AcousticJob]) -> List[torch.Tensor]:
+        mels = [self.engine.token2mel(j.tokens, j.model_input) for j in batch]
+        return self.engine.mel2wav(mels)
+
+    def _synthesize_on_stream(self, batch: List[AcousticJob]) -> List[torch.Tensor]:
+        """``_synthesize`` on the side stream, ordered against the default stream
+        in both directions."""
+        default = torch.cuda.current_stream(self.engine.device)
+        # The model inputs were written on the default stream (frontend, LLM)
+        self._stream.wait_stream(default)
+        for job in batch:
+            for t in job.model_input.values():
+                if isinstance(t, torch.Tensor) and t.is_cuda:
+                    # Keep the allocator from handing their memory to the
+                    # default stream while side stream kernels may still read it
+                    t.record_stream(self._stream)
+        with torch.cuda.stream(self._stream):
+            wavs = self._synthesize(batch)
+        # Consumers use the audio on the default stream
+        default.wait_stream(self._stream)
+        for wav in wavs:
+            if wav.is_cuda:
+                wav.record_stream(default)
+        return wavs
+
+    def _process(self, batch: List[AcousticJob]):
+        try:
+            if self._stream is None:
+                wavs = self._synthesize(batch)
+            else:
+                wavs = self._synthesize_on_stream(batch)
+        except Exception as e:
+            for job in batch:
+                job.future.set_exception(e)
+            return
+        for job, wav in zip(batch, wavs):
+            job.future.set_result(wav)
+        self.batches += 1
+        self.jobs_done += len(batch)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            jobs, stop = self._drain(first)
+            jobs = [j for j in jobs if j.future.set_running_or_notify_cancel()]
+
+            for batch in self._buckets(jobs):
+                self._process(batch)
+
+
+def pipeline(
+    engine: Engine,
+    acoustic: AcousticStage,
+    texts: List[str],
+    prompt_text: str,
+    prompt_speech_16k: torch.Tensor,
+    seeds: Optional[Sequence[int]] = None,
+) -> Iterator[Tuple[torch.Tensor, float, List[int]]]:
+    """Synthesize ``texts`` in order, yielding ``(audio, seconds, tokens)`` for
+    each, ``tokens`` being the speech tokens of all its chunks.
+
+    The prompt features are computed once. LLM decode of a text starts as soon
+    as the previous one has been handed to the acoustic stage; results are
+    still yielded in input order. With ``seeds``, the RNG is seeded before the
+    decode of every text (the vocoder thread may still draw from it meanwhile).
+    """
+    pending = deque()
+
+    def collect():
+        futures, t0, tokens = pending.popleft()
+        wav = torch.cat([f.result() for f in futures], dim=-1)
+        return wav, time.perf_counter() - t0, tokens
+
+    features = engine.prompt_features(prompt_text, prompt_speech_16k)
+    for idx, text in enumerate(texts):
+        t0 = time.perf_counter()
+        if seeds is not None:
+            torch.manual_seed(seeds[idx])
+        futures, tokens = [], []
+        for model_input in engine.frontend(
+            text, prompt_text, prompt_speech_16k, features
+        ):
+            chunk_tokens = engine.generate_tokens(model_input)
+            futures.append(acoustic.submit(chunk_tokens, model_input))
+            tokens.extend(chunk_tokens)
+        pending.append((futures, t0, tokens))
+        while pending and all(f.done() for f in pending[0][0]):
+            yield collect()
+
+    while pending:
+        yield collect()
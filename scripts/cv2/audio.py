@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Silence trimming
+================
+Frame-energy trimmer that finds the leading and trailing speech boundaries in
+one pass over a framed view of the signal, for a whole batch of waveforms at
+once. It replaces the forward + reversed ``torchaudio.functional.vad`` pair.
+
+- Frames are active when their RMS is within ``rel_db`` of the loudest frame of
+  the same waveform and above ``floor_db`` dBFS.
+- Optionally, frames with strong spectral flux count as active too, which keeps
+  soft onsets (fricatives, breathy starts) that energy alone misses.
+- A boundary needs ``min_speech_ms`` of consecutive active frames, so isolated
+  clicks and breath noise are not taken for speech.
+- ``pad_ms`` of context is kept on both sides, so soft onsets and decays just
+  under the threshold are not clipped.
+
+Benchmark against the VAD on the prompt set:
+    python -m scripts.cv2.audio --wav_dir prompts/wav
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+import torchaudio
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+
+def _frame_params(sr: int, frame_ms: float, hop_ms: float) -> Tuple[int, int]:
+    return int(sr * frame_ms / 1000), int(sr * hop_ms / 1000)
+
+
+def frame_db(wav: torch.Tensor, frame_len: int, hop: int) -> torch.Tensor:
+    """RMS level in dBFS of every frame; (B, T) -> (B, F)."""
+    if wav.shape[-1] < frame_len:
+        wav = torch.nn.functional.pad(wav, (0, frame_len - wav.shape[-1]))
+    frames = wav.unfold(-1, frame_len, hop)
+    rms = frames.pow(2).mean(dim=-1).sqrt()
+    return 20 * torch.log10(rms.clamp_min(1e-10))
+
+
+def spectral_flux(wav: torch.Tensor, frame_len: int, hop: int) -> torch.Tensor:
+    """Positive spectral flux per frame, normalized per waveform to 0..1."""
+    if wav.shape[-1] < frame_len:
+        wav = torch.nn.functional.pad(wav, (0, frame_len - wav.shape[-1]))
+    n_fft = 1 << (frame_len - 1).bit_length()
+    # Pad so the STFT frames start on the same samples as the energy frames
+    wav = torch.nn.functional.pad(wav, (0, n_fft - frame_len))
+    spec = torch.stft(
+        wav,
+        n_fft=n_fft,
+        hop_length=hop,
+        win_length=frame_len,
+        window=torch.hann_window(frame_len, device=wav.device),
+        center=False,
+        return_complex=True,
+    ).abs()
+    flux = (spec[..., 1:] - spec[..., :-1]).clamp_min(0).sum(dim=1)
+    flux = torch.nn.functional.pad(flux, (1, 0))
+    return flux / flux.amax(dim=-1, keepdim=True).clamp_min(1e-10)
+
+
+def active_frames(
+    wav: torch.Tensor,
+    sr: int,
+    frame_ms: float = 25.0,
+    hop_ms: float = 10.0,
+    rel_db: float = -30.0,
+    floor_db: float = -55.0,
+    flux_threshold: Optional[float] = None,
+    lengths: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    """Boolean (B, F) speech decision per frame."""
+    frame_len, hop = _frame_params(sr, frame_ms, hop_ms)
+    db = frame_db(wav, frame_len, hop)
+    if lengths is not None:
+        # Frames that reach into the padding of shorter waveforms never count
+        n_frames = ((lengths - frame_len) // hop + 1).clamp_min(1)
+        valid = torch.arange(db.shape[-1], device=db.device)[None] < n_frames[:, None]
+        db = db.masked_fill(~valid, -200.0)
+
+    peak = db.amax(dim=-1, keepdim=True)
+    active = (db > peak + rel_db) & (db > floor_db)
+    if flux_threshold is not None:
+        flux = spectral_flux(wav, frame_len, hop)[..., : db.shape[-1]]
+        active |= (flux > flux_threshold) & (db > floor_db)
+    return active
+
+
+def find_bounds(
+    wav: torch.Tensor,
+    sr: int,
+    frame_ms: float = 25.0,
+    hop_ms: float = 10.0,
+    rel_db: float = -30.0,
+    floor_db: float = -55.0,
+    min_speech_ms: float = 100.0,
+    pad_ms: float = 100.0,
+    flux_threshold: Optional[float] = None,
+    lengths: Optional[torch.Tensor] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Sample ``(start, end)`` of the speech region of every row of ``wav`` (B, T).
+
+    Rows without speech get ``start == end == 0``.
+    """
+    if lengths is None:
+        lengths = torch.full((wav.shape[0],), wav.shape[-1], device=wav.device)
+    frame_len, hop = _frame_params(sr, frame_ms, hop_ms)
+    active = active_frames(
+        wav, sr, frame_ms, hop_ms, rel_db, floor_db, flux_threshold, lengths
+    )
+
+    # A run of k active frames marks speech; take the first and last such run
+    k = max(1, min(int(min_speech_ms / hop_ms), active.shape[-1]))
+    runs = active.unfold(-1, k, 1).all(dim=-1)
+    has_speech = runs.any(dim=-1)
+    first = runs.int().argmax(dim=-1)
+    last = runs.shape[-1] - 1 - runs.flip(-1).int().argmax(dim=-1) + k - 1
+
+    pad = int(sr * pad_ms / 1000)
+    start = (first * hop - pad).clamp_min(0)
+    end = torch.minimum(last * hop + frame_len + pad, lengths)
+    zeros = torch.zeros_like(start)
+    return torch.where(has_speech, start, zeros), torch.where(has_speech, end, zeros)
+
+
+def trim_batch(wavs: List[torch.Tensor], sr: int, **kwargs) -> List[torch.Tensor]:
+    """Trim a list of (C, T_i) waveforms with one batched boundary search."""
+    lengths = torch.tensor([w.shape[-1] for w in wavs])
+    mono = torch.nn.utils.rnn.pad_sequence(
+        [w.mean(dim=0) for w in wavs], batch_first=True
+    )
+    starts, ends = find_bounds(mono, sr, lengths=lengths, **kwargs)
+    return [w[..., s:e] for w, s, e in zip(wavs, starts.tolist(), ends.tolist())]
+
+
+def trim_wav(wav: torch.Tensor, sr: int, **kwargs) -> torch.Tensor:
+    """Cut leading and trailing silence of one (C, T) waveform."""
+    return trim_batch([wav], sr, **kwargs)[0]
+
+
+def vad_trim(wav: torch.Tensor, sr: int, trigger_level: float = 7.0) -> torch.Tensor:
+    """The previous trimmer: VAD on the signal, then on its reverse."""
+    trimmed = torchaudio.functional.vad(wav, sr, trigger_level=trigger_level)
+    if trimmed.shape[-1] > 0:
+        trimmed = torchaudio.functional.vad(
+            trimmed.flip(-1), sr, trigger_level=trigger_level
+        ).flip(-1)
+    return trimmed
+
+
+def vad_bounds(wav: torch.Tensor, sr: int, trigger_level: float = 7.0) -> Tuple[int, int]:
+    """Sample ``(start, end)`` that ``vad_trim`` keeps."""
+    head = torchaudio.functional.vad(wav, sr, trigger_level=trigger_level)
+    start = wav.shape[-1] - head.shape[-1]
+    if head.shape[-1] == 0:
+        return start, start
+    kept = torchaudio.functional.vad(head.flip(-1), sr, trigger_level=trigger_level)
+    return start, start + kept.shape[-1]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--wav_dir", type=Path, default=Path("prompts/wav"))
+    ap.add_argument("--sr", type=int, default=16000)
+    ap.add_argument("--repeats", type=int, default=5)
+    ap.add_argument("--flux_threshold", type=float, default=None)
+    args = ap.parse_args()
+
+    wavs = []
+    for path in sorted(args.wav_dir.glob("*.wav")):
+        wav, sr = torchaudio.load(path)
+        if sr != args.sr:
+            wav = torchaudio.functional.resample(wav, sr, args.sr)
+        wavs.append(wav)
+    logger.info("%d prompts from %s", len(wavs), args.wav_dir)
+
+    def timed(fn):
+        best = float("inf")
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            out = fn()
+            best = min(best, time.perf_counter() - t0)
+        return out, best
+
+    _, t_vad = timed(lambda: [vad_trim(w, args.sr) for w in wavs])
+    _, t_single = timed(
+        lambda: [
+            trim_wav(w, args.sr, flux_threshold=args.flux_threshold) for w in wavs
+        ]
+    )
+    _, t_batch = timed(
+        lambda: trim_batch(wavs, args.sr, flux_threshold=args.flux_threshold)
+    )
+
+    lengths = torch.tensor([w.shape[-1] for w in wavs])
+    mono = torch.nn.utils.rnn.pad_sequence(
+        [w.mean(dim=0) for w in wavs], batch_first=True
+    )
+    starts, ends = find_bounds(
+        mono, args.sr, flux_threshold=args.flux_threshold, lengths=lengths
+    )
+    diffs = []
+    for w, s, e in zip(wavs, starts.tolist(), ends.tolist()):
+        r_start, r_end = vad_bounds(w, args.sr)
+        diffs.append((1000 * (s - r_start) / args.sr, 1000 * (e - r_end) / args.sr))
+    diffs = np.abs(np.array(diffs))
+
+    total_s = sum(w.shape[-1] for w in wavs) / args.sr
+    logger.info(f"audio: {total_s:.1f}s")
+    logger.info(f"vad x2   : {t_vad * 1000:8.1f} ms")
+    logger.info(f"energy   : {t_single * 1000:8.1f} ms  ({t_vad / t_single:.1f}x)")
+    logger.info(f"batched  : {t_batch * 1000:8.1f} ms  ({t_vad / t_batch:.1f}x)")
+    logger.info(
+        "boundary |diff| vs vad  start: median %.0f ms, p90 %.0f ms  "
+        "end: median %.0f ms, p90 %.0f ms",
+        np.median(diffs[:, 0]),
+        np.percentile(diffs[:, 0], 90),
+        np.median(diffs[:, 1]),
+        np.percentile(diffs[:, 1], 90),
+    )
+
+
+if __name__ == "__main__":
+    main()
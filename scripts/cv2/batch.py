@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+CosyVoice 2 + LoRA batch inference from a job manifest
+======================================================
+Synthesize many rows for many speakers with one model load. The manifest is a
+TSV (with header) or JSONL file with the columns
+
+    id  text  prompt_id  [out_path]
+
+Prompt ``<prompt_id>`` is read from ``<prompt_dir>/wav/<prompt_id>.wav`` and
+``<prompt_dir>/trans/<prompt_id>.txt``. ``out_path`` (default: ``id``) is
+relative to ``--out_dir``; its extension, if any, must match ``--out_format``.
+Rows are grouped by prompt so each
+prompt's features are extracted once and its KV prefix stays cached, and each
+group runs through the continuous-batching scheduler with the acoustic stage.
+
+A results manifest with per-row timing is written next to the audio.
+
+Usage:
+    python -m scripts.cv2.batch \
+        --base_model pretrained_models/CosyVoice2-0.5B \
+        --lora_dir lora_weights/UtterTune-CosyVoice2-ja-JSUTJVS \
+        --jobs jobs.tsv \
+        --out_dir wavs_out/batch
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import time
+from dataclasses import asdict, dataclass, fields
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import torch
+
+from scripts.cv2.acoustic import AcousticStage
+from scripts.cv2.engine import Engine
+from scripts.cv2.phon import parse_phon
+from scripts.cv2.prefix_cache import PrefixCache, adapter_fingerprint
+from scripts.cv2.scheduler import ContinuousBatchScheduler
+from scripts.cv2.writer import EXTENSIONS, AudioWriter
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+PROMPT_SAMPLE_RATE = 16000
+COLUMNS = ["id", "text", "prompt_id", "out_path"]
+
+
+@dataclass
+class Job:
+    id: str
+    text: str
+    prompt_id: str
+    out_path: Optional[str] = None
+
+
+@dataclass
+class JobResult:
+    id: str
+    prompt_id: str
+    out_path: str
+    audio_s: float = 0.0
+    synth_s: float = 0.0
+    rtf: float = 0.0
+    status: str = "ok"
+
+
+def read_jobs(path: Path) -> List[Job]:
+    if path.suffix == ".jsonl":
+        with path.open(encoding="utf-8") as f:
+            rows = [json.loads(ln) for ln in f if ln.strip()]
+    else:
+        with path.open(encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f, delimiter="\t"))
+
+    jobs = []
+    for n, row in enumerate(rows, start=1):
+        missing = [c for c in COLUMNS[:3] if not row.get(c)]
+        if missing:
+            raise ValueError(f"{path} row {n}: missing {', '.join(missing)}")
+        job = Job(**{c: row.get(c) or None for c in COLUMNS})
+        try:
+            parse_phon(job.text)
+        except ValueError as e:
+            raise ValueError(f"{path} row {n} ({job.id}): {e}") from e
+        jobs.append(job)
+    return jobs
+
+
+def output_key(job: Job, ext: str) -> str:
+    """Writer key of ``job``: its ``out_path`` (or id) without the ``.<ext>``."""
+    path = Path(job.out_path or job.id)
+    if path.is_absolute() or ".." in path.parts:
+        raise ValueError(
+            f"{job.id}: output path {str(path)!r} must stay inside --out_dir"
+        )
+    if path.suffix == f".{ext}":
+        path = path.with_suffix("")
+    elif path.suffix[1:] in EXTENSIONS.values():
+        raise ValueError(
+            f"{job.id}: output path {str(path)!r} does not match --out_format {ext}"
+        )
+    return str(path)
+
+
+def output_keys(jobs: List[Job], ext: str) -> Dict[str, str]:
+    """Writer key per job id; fails before synthesis on invalid or shared paths."""
+    keys: Dict[str, str] = {}
+    owners: Dict[str, str] = {}
+    for job in jobs:
+        key = output_key(job, ext)
+        if key in owners:
+            raise ValueError(f"{job.id} and {owners[key]} both write {key}.{ext}")
+        keys[job.id] = key
+        owners[key] = job.id
+    return keys
+
+
+def group_by_prompt(jobs: List[Job]) -> Dict[str, List[Job]]:
+    """Jobs per prompt id, in order of first appearance."""
+    groups: Dict[str, List[Job]] = {}
+    for job in jobs:
+        groups.setdefault(job.prompt_id, []).append(job)
+    return groups
+
+
+def write_results(path: Path, results: List[JobResult]):
+    rows = [asdict(r) for r in results]
+    fieldnames = [f.name for f in fields(JobResult)]
+    if path.suffix == ".jsonl":
+        with path.open("w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    else:
+        with path.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter="\t")
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+async def run_group(
+    scheduler: ContinuousBatchScheduler,
+    writer: AudioWriter,
+    jobs: List[Job],
+    keys: Dict[str, str],
+    prompt_text: str,
+    prompt_speech_16k: torch.Tensor,
+) -> List[JobResult]:
+    engine = scheduler.engine
+    loop = asyncio.get_running_loop()
+    features = await scheduler.prompt_features(prompt_text, prompt_speech_16k)
+
+    async def run(job: Job) -> JobResult:
+        key = keys[job.id]
+        result = JobResult(job.id, job.prompt_id, str(writer.path_for(key)))
+        t0 = time.perf_counter()
+        try:
+            wav = await scheduler.synthesize(
+                job.text, prompt_text, prompt_speech_16k, features
+            )
+        except Exception as e:
+            result.status = f"error: {e}"
+            logger.warning("%s failed: %s", job.id, e)
+            return result
+
+        result.synth_s = round(time.perf_counter() - t0, 3)
+        result.audio_s = round(wav.shape[-1] / engine.cv2.sample_rate, 3)
+        result.rtf = round(result.synth_s / max(result.audio_s, 1e-9), 3)
+        # write blocks while the writer queue is full: wait off the event loop
+        await loop.run_in_executor(
+            None,
+            writer.write,
+            key,
+            wav,
+            engine.cv2.sample_rate,
+            {"id": job.id, "text": job.text},
+        )
+        return result
+
+    return await asyncio.gather(*(run(job) for job in jobs))
+
+
+async def run_jobs(
+    engine: Engine, jobs: List[Job], keys: Dict[str, str], args
+) -> List[JobResult]:
+    from scripts.cv2.infer import load_wav, trim_wav
+
+    acoustic = AcousticStage(engine, max_batch_size=args.acoustic_batch_size)
+    scheduler = ContinuousBatchScheduler(
+        engine, max_batch_size=args.max_batch_size, acoustic=acoustic
+    )
+    writer = AudioWriter(
+        args.out_dir, fmt=args.out_format, num_workers=args.writer_threads
+    )
+    scheduler.start()
+
+    results: List[JobResult] = []
+    try:
+        for prompt_id, group in group_by_prompt(jobs).items():
+            wav_path = args.prompt_dir / "wav" / f"{prompt_id}.wav"
+            trans_path = args.prompt_dir / "trans" / f"{prompt_id}.txt"
+            if not wav_path.is_file() or not trans_path.is_file():
+                logger.warning(
+                    "prompt %s not found under %s", prompt_id, args.prompt_dir
+                )
+                results.extend(
+                    JobResult(j.id, prompt_id, "", status="error: prompt not found")
+                    for j in group
+                )
+                continue
+
+            prompt_speech_16k = trim_wav(
+                load_wav(wav_path, PROMPT_SAMPLE_RATE), PROMPT_SAMPLE_RATE
+            )
+            prompt_text = trans_path.read_text("utf-8").strip()
+
+            t0 = time.perf_counter()
+            results.extend(
+                await run_group(
+                    scheduler, writer, group, keys, prompt_text, prompt_speech_16k
+                )
+            )
+            logger.info(
+                f"[{prompt_id}] {len(group)} rows in {time.perf_counter() - t0:.2f}s"
+            )
+    finally:
+        await scheduler.stop()
+        acoustic.close()
+        writer.close()
+    return results
+
+
+def main():
+    from scripts.cv2.infer import load_model
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base_model", type=str, required=True)
+    ap.add_argument("--lora_dir", type=Path, default=None)
+    ap.add_argument(
+        "--snapshot", type=Path, default=None, help="scripts.cv2.snapshot directory"
+    )
+    ap.add_argument("--jobs", type=Path, required=True, help="TSV or JSONL manifest")
+    ap.add_argument("--prompt_dir", type=Path, default=Path("prompts"))
+    ap.add_argument("--out_dir", type=Path, default=Path("wavs_out/batch"))
+    ap.add_argument("--out_format", choices=["wav", "flac", "opus"], default="wav")
+    ap.add_argument(
+        "--results", type=Path, default=None, help="Default: <out_dir>/results.tsv"
+    )
+    ap.add_argument("--max_batch_size", type=int, default=8)
+    ap.add_argument("--acoustic_batch_size", type=int, default=4)
+    ap.add_argument("--prefix_cache_mb", type=int, default=512)
+    ap.add_argument("--writer_threads", type=int, default=4)
+    ap.add_argument("--cpu", action="store_true")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    jobs = read_jobs(args.jobs)
+    keys = output_keys(jobs, EXTENSIONS[args.out_format])
+    logger.info(
+        "%d rows, %d prompts from %s",
+        len(jobs),
+        len(group_by_prompt(jobs)),
+        args.jobs,
+    )
+
+    device = torch.device(
+        "cpu" if args.cpu or not torch.cuda.is_available() else "cuda"
+    )
+    torch.manual_seed(args.seed)
+
+    if args.snapshot is not None:
+        from scripts.cv2.snapshot import load_snapshot, read_meta
+
+        cv2 = load_snapshot(args.snapshot, device)
+        adapter_id = read_meta(args.snapshot)["adapter"]
+    else:
+        cv2 = load_model(args.base_model, args.lora_dir, device)
+        adapter_id = adapter_fingerprint(args.lora_dir)
+
+    engine = Engine(
+        cv2,
+        prefix_cache=PrefixCache(max_bytes=args.prefix_cache_mb << 20),
+        adapter_id=adapter_id,
+    )
+
+    t0 = time.perf_counter()
+    results = asyncio.run(run_jobs(engine, jobs, keys, args))
+    wall = time.perf_counter() - t0
+
+    results_path = args.results or args.out_dir / "results.tsv"
+    write_results(results_path, results)
+
+    n_ok = sum(r.status == "ok" for r in results)
+    audio_s = sum(r.audio_s for r in results)
+    logger.info(
+        f"{n_ok}/{len(results)} rows ok, {audio_s:.1f}s audio in {wall:.1f}s "
+        f"(RTF {wall / max(audio_s, 1e-9):.3f})"
+    )
+    logger.info("Prefix cache: %s", engine.prefix_cache.stats())
+    logger.info("Decode stops: %s", dict(engine.stop_counts))
+    logger.info(f"results → {results_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Batched decode KV cache
+=======================
+One preallocated key and value tensor per layer, shared by all requests that
+decode together. Each request owns a row (slot) and its cache is right-aligned
+so every row writes its next token at the same column:
+
+    row 0  . . . k k k k k | new
+    row 1  k k k k k k k k | new
+    row 2  . . . . . k k k | new
+                             ^ length
+
+Attention writes the new keys and values into that column in place, so a
+decode step costs O(new token) instead of re-padding and concatenating every
+request's cache. The rows are rebuilt (``BatchKV.build``) only when requests
+join or leave, and the columns grow geometrically when they run out.
+"""
+
+from __future__ import annotations
+
+from typing import List, Sequence, Tuple
+
+import torch
+
+from scripts.cv2.prefix_cache import KVCache
+
+MIN_GROW_COLUMNS = 64
+
+
+class BatchKV:
+    def __init__(
+        self,
+        keys: List[torch.Tensor],
+        values: List[torch.Tensor],
+        length: int,
+        past_lens: List[int],
+    ):
+        self.keys = keys  # Per layer (B, H, capacity, D)
+        self.values = values
+        self.length = length  # Columns in use; the next token goes here
+        self.past_lens = past_lens  # Tokens cached per row
+
+    @classmethod
+    def build(cls, pasts: Sequence[KVCache], reserve: int = MIN_GROW_COLUMNS):
+        """Copy per-request caches (each (1, H, L_i, D) per layer) into the rows
+        of a new batch with room for ``reserve`` more tokens."""
+        past_lens = [past[0][0].shape[2] for past in pasts]
+        length = max(past_lens)
+        capacity = length + max(reserve, 1)
+
+        keys, values = [], []
+        for layer in range(len(pasts[0])):
+            k0, v0 = pasts[0][layer]
+            k = k0.new_zeros(len(pasts), k0.shape[1], capacity, k0.shape[3])
+            v = v0.new_zeros(len(pasts), v0.shape[1], capacity, v0.shape[3])
+            for row, past in enumerate(pasts):
+                start = length - past_lens[row]
+                k[row, :, start:length] = past[layer][0][0]
+                v[row, :, start:length] = past[layer][1][0]
+            keys.append(k)
+            values.append(v)
+        return cls(keys, values, length, past_lens)
+
+    @property
+    def batch_size(self) -> int:
+        return len(self.past_lens)
+
+    @property
+    def capacity(self) -> int:
+        return self.keys[0].shape[2]
+
+    def row(self, i: int) -> KVCache:
+        """Views of row ``i`` as a legacy cache; copy before the batch is reused."""
+        start = self.length - self.past_lens[i]
+        return tuple(
+            (k[i : i + 1, :, start : self.length], v[i : i + 1, :, start : self.length])
+            for k, v in zip(self.keys, self.values)
+        )
+
+    def reserve(self, n_columns: int):
+        """Make room for ``n_columns`` more tokens, growing by at least half."""
+        if self.length + n_columns <= self.capacity:
+            return
+        extra = max(n_columns, self.capacity // 2, MIN_GROW_COLUMNS)
+        for layer in range(len(self.keys)):
+            k, v = self.keys[layer], self.values[layer]
+            self.keys[layer] = torch.nn.functional.pad(k, (0, 0, 0, extra))
+            self.values[layer] = torch.nn.functional.pad(v, (0, 0, 0, extra))
+
+    def write(
+        self, layer: int, key: torch.Tensor, value: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Store one token's (B, H, 1, D) key/value at column ``length`` and
+        return the keys/values to attend over."""
+        end = self.length + key.shape[2]
+        self.keys[layer][:, :, self.length : end] = key
+        self.values[layer][:, :, self.length : end] = value
+        return self.keys[layer][:, :, :end], self.values[layer][:, :, :end]
+
+    def advance(self, n: int = 1):
+        self.length += n
+        self.past_lens = [p + n for p in self.past_lens]
+
+    def attention_mask(self, device) -> torch.Tensor:
+        """(B, length + 1) mask over the cached columns plus the new token."""
+        mask = torch.zeros(
+            self.batch_size, self.length + 1, dtype=torch.long, device=device
+        )
+        for i, n in enumerate(self.past_lens):
+            mask[i, self.length - n :] = 1
+        return mask
+
+    def position_ids(self, device) -> torch.Tensor:
+        """(B, 1) position of the new token of every row (ignores the padding)."""
+        return torch.tensor(
+            [[n] for n in self.past_lens], dtype=torch.long, device=device
+        )
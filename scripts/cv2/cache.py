@@ -0,0 +1,209 @@
+"""
+Synthesis result cache
+======================
+Content-addressed cache in front of synthesis. The key covers everything that
+changes the output:
+
+- the sentence, with only the outer whitespace stripped as the frontend does;
+  any other rewrite (NFKC, collapsing spaces, spaces around PHON spans) can
+  change the tokens, and inputs that tokenize differently must not share a key
+- the prompt (transcription + trimmed 16 kHz waveform)
+- the adapter fingerprint
+- the seed and the sampling/engine parameters (including the device, the torch
+  thread count and the content hash of an ONNX LLM export)
+
+A miss is synthesized with the RNG seeded from its key (``key_seed``), so what
+it produces does not depend on which sentences were synthesized, or served
+from the cache, before it. A hit is then exactly what a rerun would produce only
+where sampling is reproducible for a seed, i.e. on the CPU (a different thread
+count changes float reductions, hence its place in the key). CUDA kernels are
+not deterministic: there a hit is one valid sample for its seed, not
+necessarily the one a rerun would draw, and ``infer.py`` warns about it.
+
+Hits are served from an in-memory LRU first, then from an on-disk LRU; both are
+bounded by size. Stored results are the audio and, when available (staged
+engine), the speech tokens of all its chunks.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+
+
+@dataclass
+class CachedResult:
+    wav: torch.Tensor  # (1, T) float32
+    sample_rate: int
+    tokens: Optional[List[int]] = None
+
+    @property
+    def nbytes(self) -> int:
+        return self.wav.numel() * self.wav.element_size() + 8 * len(self.tokens or [])
+
+
+def normalize_text(text: str) -> str:
+    """The text as the frontend sees it first: only the outer whitespace goes."""
+    return text.strip()
+
+
+def prompt_hash(prompt_text: str, prompt_speech_16k: torch.Tensor) -> str:
+    h = hashlib.sha256(normalize_text(prompt_text).encode("utf-8"))
+    h.update(prompt_speech_16k.detach().cpu().float().contiguous().numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+def cache_key(
+    text: str, prompt: str, adapter: str, seed: int, params: Optional[Dict] = None
+) -> str:
+    """``prompt`` is a ``prompt_hash``; ``params`` must be JSON-serializable."""
+    payload = json.dumps(
+        {
+            "text": normalize_text(text),
+            "prompt": prompt,
+            "adapter": adapter,
+            "seed": seed,
+            "params": params or {},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def key_seed(key: str) -> int:
+    """RNG seed for synthesizing the result of ``key``."""
+    return int(key[:8], 16)
+
+
+class ResultCache:
+    def __init__(
+        self,
+        disk_dir: Optional[Path] = None,
+        memory_bytes: int = 256 << 20,
+        disk_bytes: int = 10 << 30,
+    ):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._memory_used = 0
+
+        self.disk_dir = Path(disk_dir) if disk_dir is not None else None
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> file size
+        self._disk_used = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            # Rebuild the LRU order from modification times (touched on hits)
+            files = sorted(
+                self.disk_dir.glob("*/*.npz"), key=lambda p: p.stat().st_mtime
+            )
+            for path in files:
+                size = path.stat().st_size
+                self._disk[path.stem] = size
+                self._disk_used += size
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.npz"
+
+    def __contains__(self, key: str) -> bool:
+        """Membership without touching the LRU order or the hit counters."""
+        return key in self._memory or key in self._disk
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        result = self._memory.get(key)
+        if result is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return result
+
+        if key in self._disk:
+            path = self._path(key)
+            try:
+                result = self._load(path)
+            except (OSError, ValueError, KeyError):
+                # Removed or truncated behind our back: treat as a miss
+                self._disk_used -= self._disk.pop(key)
+            else:
+                os.utime(path)
+                self._disk.move_to_end(key)
+                self._remember(key, result)
+                self.disk_hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: CachedResult):
+        self._remember(key, result)
+        if self.disk_dir is None or key in self._disk:
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        buf = io.BytesIO()
+        np.savez(
+            buf,
+            wav=result.wav.detach().cpu().numpy().astype(np.float32),
+            sample_rate=np.int64(result.sample_rate),
+            tokens=np.asarray(
+                result.tokens if result.tokens is not None else [-1], dtype=np.int64
+            ),
+        )
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_bytes(buf.getvalue())
+        os.replace(tmp_path, path)
+
+        size = path.stat().st_size
+        self._disk[key] = size
+        self._disk_used += size
+        while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+            old_key, old_size = self._disk.popitem(last=False)
+            self._path(old_key).unlink(missing_ok=True)
+            self._disk_used -= old_size
+
+    def _remember(self, key: str, result: CachedResult):
+        if result.nbytes > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_used -= self._memory.pop(key).nbytes
+        self._memory[key] = result
+        self._memory_used += result.nbytes
+        while self._memory_used > self.memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_used -= old.nbytes
+
+    @staticmethod
+    def _load(path: Path) -> CachedResult:
+        with np.load(path) as data:
+            tokens = data["tokens"].tolist()
+            return CachedResult(
+                wav=torch.from_numpy(data["wav"]),
+                sample_rate=int(data["sample_rate"]),
+                tokens=None if tokens == [-1] else tokens,
+            )
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            ),
+            "memory_mb": self._memory_used / (1 << 20),
+            "disk_mb": self._disk_used / (1 << 20),
+            "disk_entries": len(self._disk),
+        }
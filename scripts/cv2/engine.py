@@ -0,0 +1,416 @@
+"""
+UtterTune inference engine
+==========================
+The non-streaming ``CosyVoice2.inference_zero_shot`` path split into explicit
+stages that can be scheduled independently:
+
+1. **frontend**: text normalization/splitting and prompt features
+   (``CosyVoiceFrontEnd.frontend_zero_shot``)
+2. **prefill**: LLM input assembly and the first forward pass
+   (``Qwen2LM.inference`` steps 1-4)
+3. **decode**: one speech token per step, for one request or for a batch of
+   requests sharing one preallocated KV cache (``scripts.cv2.batch_cache``)
+4. **token2wav**: flow matching + HiFiGAN (``CosyVoice2Model.token2wav``)
+
+The LLM is used as loaded by ``scripts.cv2.infer.load_model``, so the UtterTune
+LoRA and the PHON embedding rows are applied. With a ``PrefixCache`` the
+``sos_eos`` + prompt text part of the prefill is computed once per prompt.
+
+``DecodeGuards`` (``scripts.cv2.guards``) end decode early instead of trimming
+runaway audio afterwards: a speech token budget from the text length, and
+detection of repeating or low-diversity token streams.
+
+Every stage is wrapped in a ``scripts.cv2.trace`` span (no-ops unless tracing
+is enabled).
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import torch
+from transformers import Cache, DynamicCache
+
+from scripts.cv2.batch_cache import BatchKV
+from scripts.cv2.guards import DecodeGuards, LoopDetector
+from scripts.cv2.prefix_cache import KVCache, PrefixCache, prompt_hash
+from scripts.cv2.trace import tracer
+
+@dataclass
+class DecodeState:
+    """Decode progress of one text chunk."""
+
+    model_input: Dict[str, torch.Tensor]
+    past: Optional[KVCache]  # None while the cache is a row of the engine's batch
+    next_input: torch.Tensor  # (1, 1, D) embedding fed at the next step
+    min_len: int
+    max_len: int
+    tokens: List[int] = field(default_factory=list)
+    step: int = 0
+    done: bool = False
+    stop_reason: str = ""
+    budget_limited: bool = False  # max_len comes from the guard budget
+    loops: Optional[LoopDetector] = field(default=None, repr=False)
+
+
+class _BatchCache(Cache):
+    """``transformers`` face of a ``BatchKV``: attention writes in place."""
+
+    def __init__(self, kv: BatchKV):
+        super().__init__()
+        self.kv = kv
+
+    def update(self, key_states, value_states, layer_idx, cache_kwargs=None):
+        return self.kv.write(layer_idx, key_states, value_states)
+
+    def get_seq_length(self, layer_idx: Optional[int] = 0) -> int:
+        return self.kv.length
+
+    def get_max_cache_shape(self) -> Optional[int]:
+        return None
+
+
+def qwen_model(llm):
+    """The Qwen2 decoder stack (without the LM head) inside ``Qwen2LM``."""
+    return llm.llm.model.model
+
+
+class Engine:
+    def __init__(
+        self,
+        cv2,
+        sampling: int = 25,
+        max_token_text_ratio: float = 20,
+        min_token_text_ratio: float = 2,
+        prefix_cache: Optional[PrefixCache] = None,
+        adapter_id: str = "base",
+        guards: Optional[DecodeGuards] = DecodeGuards(),
+        greedy: bool = False,
+    ):
+        self.cv2 = cv2
+        self.llm = cv2.model.llm
+        self.device = cv2.model.device
+        self.sampling = sampling
+        self.max_token_text_ratio = max_token_text_ratio
+        self.min_token_text_ratio = min_token_text_ratio
+        self.prefix_cache = prefix_cache
+        self.adapter_id = adapter_id
+        self.guards = guards
+        # Argmax over speech tokens + EOS instead of ras_sampling (which ignores
+        # top_k and always draws from the top-p nucleus): deterministic, so
+        # models can be compared token for token
+        self.greedy = greedy
+        self.stop_counts: Counter = Counter()
+        # Rows of the batch KV cache, in the order of the last decode_step
+        self._batch: Optional[BatchKV] = None
+        self._batch_states: List[DecodeState] = []
+
+    # 1. frontend
+    def prompt_features(
+        self, prompt_text: str, prompt_speech_16k: torch.Tensor
+    ) -> Dict[str, torch.Tensor]:
+        """The prompt part of a model input, computed once per speaker prompt
+        (speech tokens, speaker embedding and mel of the prompt wav)."""
+        frontend = self.cv2.frontend
+        with tracer.span("frontend.prompt"):
+            prompt_text = frontend.text_normalize(prompt_text, split=False)
+            model_input = frontend.frontend_zero_shot(
+                "", prompt_text, prompt_speech_16k, self.cv2.sample_rate, ""
+            )
+        del model_input["text"], model_input["text_len"]
+        return model_input
+
+    def frontend(
+        self,
+        text: str,
+        prompt_text: str,
+        prompt_speech_16k: torch.Tensor,
+        prompt_features: Optional[Dict[str, torch.Tensor]] = None,
+    ) -> List[Dict[str, torch.Tensor]]:
+        frontend = self.cv2.frontend
+        if prompt_features is None:
+            prompt_features = self.prompt_features(prompt_text, prompt_speech_16k)
+
+        model_inputs = []
+        with tracer.span("frontend.text"):
+            for chunk in frontend.text_normalize(text, split=True):
+                text_token, text_token_len = frontend._extract_text_token(chunk)
+                model_inputs.append(
+                    dict(
+                        prompt_features,
+                        text=text_token,
+                        text_len=text_token_len,
+                        tts_text=chunk,
+                    )
+                )
+        return model_inputs
+
+    # 2. prefill
+    def build_lm_input(self, model_input: Dict[str, torch.Tensor]):
+        """Returns ``(lm_input, min_len, max_len)`` exactly as ``Qwen2LM.inference``."""
+        llm = self.llm
+        text = model_input["text"].to(self.device)
+        prompt_text = model_input["prompt_text"].to(self.device)
+        prompt_speech_token = model_input["llm_prompt_speech_token"].to(self.device)
+
+        text_emb = qwen_model(llm).embed_tokens(torch.concat([prompt_text, text], dim=1))
+        sos_eos_emb = llm.llm_embedding.weight[llm.sos_eos].reshape(1, 1, -1)
+        task_id_emb = llm.llm_embedding.weight[llm.task_id].reshape(1, 1, -1)
+        if prompt_speech_token.shape[1] != 0:
+            prompt_speech_token_emb = llm.speech_embedding(prompt_speech_token)
+        else:
+            prompt_speech_token_emb = torch.zeros(
+                1, 0, llm.llm_input_size, dtype=text_emb.dtype, device=self.device
+            )
+        lm_input = torch.concat(
+            [sos_eos_emb, text_emb, task_id_emb, prompt_speech_token_emb], dim=1
+        )
+
+        min_len = int(text.shape[1] * self.min_token_text_ratio)
+        max_len = int(text.shape[1] * self.max_token_text_ratio)
+        return lm_input, min_len, max_len
+
+    def _budget(self, model_input: Dict[str, torch.Tensor]) -> Optional[int]:
+        if self.guards is None or "tts_text" not in model_input:
+            return None
+        return self.guards.budget(model_input["tts_text"])
+
+    def _prefix(self, model_input: Dict[str, torch.Tensor], lm_input: torch.Tensor):
+        """Cached KV of ``sos_eos`` + prompt text and its length (or ``None, 0``).
+
+        The prompt speech tokens come after the target text in the LLM input,
+        so this is the longest prefix shared by all sentences of one prompt.
+        """
+        prompt_text = model_input["prompt_text"]
+        if self.prefix_cache is None or prompt_text.shape[1] == 0:
+            return None, 0
+
+        n_prefix = 1 + prompt_text.shape[1]
+        key = (self.adapter_id, prompt_hash(prompt_text))
+        past = self.prefix_cache.get(key)
+        if past is None:
+            out = qwen_model(self.llm)(
+                inputs_embeds=lm_input[:, :n_prefix],
+                use_cache=True,
+                past_key_values=DynamicCache(),
+            )
+            past = out.past_key_values.to_legacy_cache()
+            self.prefix_cache.put(key, past)
+        return past, n_prefix
+
+    @torch.inference_mode()
+    def prefill(self, model_input: Dict[str, torch.Tensor]) -> DecodeState:
+        lm_input, min_len, max_len = self.build_lm_input(model_input)
+        prefix, n_prefix = self._prefix(model_input, lm_input)
+
+        # DynamicCache appends with torch.cat, so the cached tensors are never
+        # written to and can be shared between requests
+        past = DynamicCache() if prefix is None else DynamicCache.from_legacy_cache(prefix)
+        with tracer.span("llm.prefill", tokens=lm_input.shape[1], cached=n_prefix):
+            out = qwen_model(self.llm)(
+                inputs_embeds=lm_input[:, n_prefix:],
+                use_cache=True,
+                past_key_values=past,
+            )
+        budget = self._budget(model_input)
+        state = DecodeState(
+            model_input=model_input,
+            past=out.past_key_values.to_legacy_cache(),
+            next_input=lm_input[:, -1:],
+            min_len=min_len,
+            max_len=max_len if budget is None else min(max_len, budget),
+            budget_limited=budget is not None and budget < max_len,
+            loops=LoopDetector(self.guards) if self.guards is not None else None,
+        )
+        self._sample(state, out.last_hidden_state[:, -1])
+        return state
+
+    # 3. decode
+    def _sample(self, state: DecodeState, hidden: torch.Tensor):
+        """Pick the next token from ``hidden`` (1, D) and advance ``state``."""
+        llm = self.llm
+        logp = llm.llm_decoder(hidden).log_softmax(dim=-1)
+        if self.greedy:
+            n_ids = llm.speech_token_size + (state.step >= state.min_len)
+            top_id = int(logp[0, :n_ids].argmax())
+        else:
+            top_id = int(
+                llm.sampling_ids(
+                    logp.squeeze(dim=0),
+                    state.tokens,
+                    self.sampling,
+                    ignore_eos=state.step < state.min_len,
+                )
+            )
+        state.step += 1
+
+        if top_id == llm.speech_token_size:
+            self._stop(state, "eos")
+            return
+        if top_id < llm.speech_token_size:
+            state.tokens.append(top_id)
+            state.next_input = llm.speech_embedding.weight[top_id].reshape(1, 1, -1)
+            if state.loops is not None:
+                loop = state.loops.push(state.tokens)
+                if loop:
+                    del state.tokens[state.loops.loop_start(loop, len(state.tokens)) :]
+                    self._stop(state, loop)
+                    return
+        # Ids above speech_token_size are fill tokens: keep the previous input
+
+        if state.step >= state.max_len:
+            self._stop(state, "budget" if state.budget_limited else "max_len")
+
+    def _stop(self, state: DecodeState, reason: str):
+        state.done = True
+        state.stop_reason = reason
+        state.loops = None
+        self.stop_counts[reason] += 1
+
+    @torch.inference_mode()
+    def decode_step(self, states: List[DecodeState]):
+        """Advance every state by one token in a single batched forward.
+
+        The states share one ``BatchKV``, rebuilt only when the set of unfinished
+        states differs from the previous step. Rows are right-aligned, so
+        shorter caches are left-padded and masked out; positions are passed
+        explicitly so padding does not shift them.
+        """
+        states = [s for s in states if not s.done]
+        if not states:
+            self._release()
+            return
+        with tracer.span("llm.decode", batch=len(states)):
+            self._decode_step(states)
+        if all(s.done for s in states):
+            self._release()
+
+    def _join(self, states: List[DecodeState]) -> BatchKV:
+        """The batch cache with ``states`` as its rows, in order. Copies the
+        caches only when requests joined or left since the last step."""
+        if self._batch is not None and list(map(id, states)) == list(
+            map(id, self._batch_states)
+        ):
+            return self._batch
+
+        rows = {id(s): i for i, s in enumerate(self._batch_states)}
+        pasts = [
+            self._batch.row(rows[id(s)]) if s.past is None else s.past for s in states
+        ]
+        # Requests dropped before they finished take their cache with them
+        joined = set(map(id, states))
+        for i, s in enumerate(self._batch_states):
+            if id(s) not in joined and not s.done:
+                s.past = tuple((k.clone(), v.clone()) for k, v in self._batch.row(i))
+
+        with tracer.span("llm.kv_rebuild", batch=len(states)):
+            self._batch = BatchKV.build(pasts)
+        self._batch_states = list(states)
+        for s in states:
+            s.past = None
+        return self._batch
+
+    def _release(self):
+        self._batch = None
+        self._batch_states = []
+
+    def _decode_step(self, states: List[DecodeState]):
+        kv = self._join(states)
+        kv.reserve(1)
+        out = qwen_model(self.llm)(
+            inputs_embeds=torch.cat([s.next_input for s in states]),
+            attention_mask=kv.attention_mask(self.device),
+            position_ids=kv.position_ids(self.device),
+            cache_position=torch.tensor([kv.length], device=self.device),
+            past_key_values=_BatchCache(kv),
+            use_cache=True,
+        )
+        kv.advance()
+        for i, s in enumerate(states):
+            self._sample(s, out.last_hidden_state[i : i + 1, -1])
+
+    @torch.inference_mode()
+    def generate_tokens(self, model_input: Dict[str, torch.Tensor]) -> List[int]:
+        state = self.prefill(model_input)
+        while not state.done:
+            self.decode_step([state])
+        return state.tokens
+
+    # 4. token2wav
+    @torch.inference_mode()
+    def token2mel(
+        self, tokens: List[int], model_input: Dict[str, torch.Tensor]
+    ) -> torch.Tensor:
+        """Flow matching for one utterance; returns a (1, 80, T) mel.
+
+        CosyVoice's flow decoder only takes a batch of one, so this is not batched.
+        """
+        flow = self.cv2.model.flow
+        device = self.device
+        token = torch.tensor([tokens], dtype=torch.int32, device=device)
+        prompt_token = model_input["flow_prompt_speech_token"].to(device)
+        prompt_feat = model_input["prompt_speech_feat"].to(device)
+
+        with tracer.span("flow", tokens=len(tokens)):
+            tts_mel, _ = flow.inference(
+                token=token,
+                token_len=torch.tensor(
+                    [token.shape[1]], dtype=torch.int32, device=device
+                ),
+                prompt_token=prompt_token,
+                prompt_token_len=torch.tensor(
+                    [prompt_token.shape[1]], dtype=torch.int32, device=device
+                ),
+                prompt_feat=prompt_feat,
+                prompt_feat_len=torch.tensor(
+                    [prompt_feat.shape[1]], dtype=torch.int32, device=device
+                ),
+                embedding=model_input["flow_embedding"].to(device),
+                streaming=False,
+                finalize=True,
+            )
+        return tts_mel
+
+    @torch.inference_mode()
+    def mel2wav(self, mels: List[torch.Tensor]) -> List[torch.Tensor]:
+        """HiFiGAN over a batch of (1, 80, T_i) mels; returns (1, N_i) audio each.
+
+        Shorter mels are padded by repeating their last frame and the padded
+        tail is cut from the output.
+        """
+        hift = self.cv2.model.hift
+        lengths = [m.shape[2] for m in mels]
+        max_len = max(lengths)
+        batch = torch.cat(
+            [
+                torch.nn.functional.pad(m, (0, max_len - m.shape[2]), mode="replicate")
+                for m in mels
+            ]
+        )
+        with tracer.span("hift", batch=len(mels), frames=max_len):
+            speech, _ = hift.inference(
+                speech_feat=batch,
+                cache_source=torch.zeros(1, 1, 0, device=batch.device),
+            )
+        hop = speech.shape[-1] // max_len
+        return [speech[i : i + 1, : n * hop].cpu() for i, n in enumerate(lengths)]
+
+    def token2wav(
+        self, tokens: List[int], model_input: Dict[str, torch.Tensor]
+    ) -> torch.Tensor:
+        return self.mel2wav([self.token2mel(tokens, model_input)])[0]
+
+    def synthesize(
+        self,
+        text: str,
+        prompt_text: str,
+        prompt_speech_16k: torch.Tensor,
+    ) -> torch.Tensor:
+        """All stages for one text; returns (1, T) audio at ``cv2.sample_rate``."""
+        wavs = []
+        for model_input in self.frontend(text, prompt_text, prompt_speech_16k):
+            tokens = self.generate_tokens(model_input)
+            wavs.append(self.token2wav(tokens, model_input))
+        return torch.cat(wavs, dim=-1)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+ONNX export of the UtterTune LLM
+================================
+Merge the LoRA adapter into CosyVoice 2's Qwen2 LLM and export one decode step
+as ``llm_step.onnx``:
+
+    inputs:  inputs_embeds (1, L, D), past_key_{i} / past_value_{i} (1, H, P, Dh)
+    outputs: logp (1, V) speech-token log-probs of the last position,
+             present_key_{i} / present_value_{i} (1, H, P + L, Dh)
+
+The same graph serves prefill (P = 0) and decode (L = 1). Embedding lookups stay
+outside the graph: the expanded text embedding table (with the PHON rows), the
+``sos_eos``/``task_id`` table and the speech token table are saved as ``.npy``
+next to it. ``llm_meta.json`` holds the constants, the fingerprint of the merged
+adapter and a content hash of the exported files. ``scripts.cv2.onnx_llm`` runs
+the decode loop on onnxruntime.
+
+Usage:
+    python -m scripts.cv2.export_onnx \
+        --base_model pretrained_models/CosyVoice2-0.5B \
+        --lora_dir lora_weights/UtterTune-CosyVoice2-ja-JSUTJVS \
+        --out_dir onnx/UtterTune-CosyVoice2-ja-JSUTJVS
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import warnings
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+
+import numpy as np
+import onnx
+import torch
+from transformers import DynamicCache
+
+from scripts.cv2.engine import qwen_model
+from scripts.cv2.onnx_llm import (
+    META_FILE,
+    STEP_FILE,
+    OrtQwen2LM,
+    export_fingerprint,
+    io_names,
+)
+from scripts.cv2.prefix_cache import adapter_fingerprint
+from scripts.cv2.quantize import merge_lora
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+
+class LLMStep(torch.nn.Module):
+    """One Qwen2 forward over new embeddings given the KV cache."""
+
+    def __init__(self, llm):
+        super().__init__()
+        self.model = qwen_model(llm)
+        self.llm_decoder = llm.llm_decoder
+        self.n_layers = self.model.config.num_hidden_layers
+
+    def forward(self, inputs_embeds, *past):
+        past_len = past[0].shape[2]
+        new_len = inputs_embeds.shape[1]
+        cache = DynamicCache.from_legacy_cache(
+            tuple((past[2 * i], past[2 * i + 1]) for i in range(self.n_layers))
+        )
+        position_ids = torch.arange(
+            past_len, past_len + new_len, device=inputs_embeds.device
+        ).unsqueeze(0)
+        out = self.model(
+            inputs_embeds=inputs_embeds,
+            position_ids=position_ids,
+            past_key_values=cache,
+            use_cache=True,
+        )
+        logp = self.llm_decoder(out.last_hidden_state[:, -1]).log_softmax(dim=-1)
+        present = [t for layer in out.past_key_values.to_legacy_cache() for t in layer]
+        return (logp, *present)
+
+
+@torch.inference_mode()
+def export(cv2, out_dir: Path, adapter: str, opset: int = 17) -> dict:
+    """``adapter`` is the ``adapter_fingerprint`` of the LoRA merged into ``cv2``."""
+    llm = merge_lora(cv2).float().cpu().eval()
+    step = LLMStep(llm)
+    config = step.model.config
+    n_kv_heads = config.num_key_value_heads
+    head_dim = config.hidden_size // config.num_attention_heads
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    input_names, output_names = io_names(step.n_layers)
+
+    dummy_embeds = torch.randn(1, 3, config.hidden_size)
+    dummy_past = [
+        torch.randn(1, n_kv_heads, 5, head_dim) for _ in range(2 * step.n_layers)
+    ]
+    dynamic_axes = {"inputs_embeds": {1: "new_len"}}
+    for name in input_names[1:]:
+        dynamic_axes[name] = {2: "past_len"}
+    for name in output_names[1:]:
+        dynamic_axes[name] = {2: "total_len"}
+
+    tmp_path = out_dir / "tmp" / STEP_FILE
+    tmp_path.parent.mkdir(exist_ok=True)
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=torch.jit.TracerWarning)
+        torch.onnx.export(
+            step,
+            (dummy_embeds, *dummy_past),
+            str(tmp_path),
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+
+    # The fp32 weights exceed the 2 GB protobuf limit: keep them in one side file
+    model = onnx.load(str(tmp_path))
+    onnx.save_model(
+        model,
+        str(out_dir / STEP_FILE),
+        save_as_external_data=True,
+        all_tensors_to_one_file=True,
+        location=f"{STEP_FILE}.data",
+    )
+    for f in tmp_path.parent.iterdir():
+        f.unlink()
+    tmp_path.parent.rmdir()
+
+    np.save(out_dir / "embed_tokens.npy", step.model.embed_tokens.weight.numpy())
+    np.save(out_dir / "llm_embedding.npy", llm.llm_embedding.weight.numpy())
+    np.save(out_dir / "speech_embedding.npy", llm.speech_embedding.weight.numpy())
+
+    meta = {
+        "sos_eos": llm.sos_eos,
+        "task_id": llm.task_id,
+        "speech_token_size": llm.speech_token_size,
+        "hidden_size": config.hidden_size,
+        "n_layers": step.n_layers,
+        "n_kv_heads": n_kv_heads,
+        "head_dim": head_dim,
+        "vocab_size": step.model.embed_tokens.weight.shape[0],
+        "opset": opset,
+        "adapter": adapter,
+        "fingerprint": export_fingerprint(out_dir),
+    }
+    (out_dir / META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return meta
+
+
+def verify(cv2, out_dir: Path, n_tokens: int = 8) -> float:
+    """Largest |logp| difference between PyTorch and onnxruntime over a short
+    prefill + decode on random embeddings."""
+    ort_llm = OrtQwen2LM(out_dir)
+    step = LLMStep(cv2.model.llm)
+    embeds = torch.randn(1, n_tokens, ort_llm.meta["hidden_size"])
+
+    with torch.inference_mode():
+        max_diff = 0.0
+        past_pt = [
+            torch.zeros(1, ort_llm.meta["n_kv_heads"], 0, ort_llm.meta["head_dim"])
+        ] * (2 * step.n_layers)
+        past_ort = ort_llm.empty_cache()
+        for x in (embeds[:, :-1], embeds[:, -1:]):
+            logp_pt, *past_pt = step(x, *past_pt)
+            logp_ort, past_ort = ort_llm.step(x.numpy(), past_ort)
+            max_diff = max(max_diff, float(np.abs(logp_pt.numpy() - logp_ort).max()))
+    return max_diff
+
+
+def main():
+    from scripts.cv2.infer import load_model
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base_model", type=str, required=True)
+    ap.add_argument("--lora_dir", type=Path, default=None)
+    ap.add_argument("--out_dir", type=Path, required=True)
+    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument(
+        "--no_verify", action="store_true", help="Skip the PyTorch/onnxruntime check"
+    )
+    args = ap.parse_args()
+
+    cv2 = load_model(args.base_model, args.lora_dir, torch.device("cpu"))
+    meta = export(cv2, args.out_dir, adapter_fingerprint(args.lora_dir), args.opset)
+    logger.info("exported → %s  (%s)", args.out_dir / STEP_FILE, meta)
+
+    if not args.no_verify:
+        logger.info("max |logp| difference: %.2e", verify(cv2, args.out_dir))
+
+
+if __name__ == "__main__":
+    main()
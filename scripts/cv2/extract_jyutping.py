@@ -1,4 +1,5 @@
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import ToJyutping
 from tqdm import tqdm
 import argparse
@@ -7,36 +8,45 @@ Extract the jyutping of each polyphone and
 Save as a txt per each speaker
 """
 
+start_tokens = "<PHON_START>"
+end_tokens = "<PHON_END>"
 
 
-def poly2jyut(text):
-    candidates = ToJyutping.get_jyutping_candidates(text)
+def annotate(text, candidates=False):
+    """Classify each character and pick its reading.
 
-
-    char = []
-    for candidate in candidates:
-        word, jyut = candidate[0], candidate[1]
+    The candidates only tell polyphones apart from other characters; their order
+    does not depend on context, so the reading itself comes from
+    ``get_jyutping_list``. With ``candidates`` a polyphone gets that reading
+    followed by the other candidates, joined by ``|``, to be resolved by
+    ``scripts.cv2.score``.
+    """
+    annotated = []
+    chosen = ToJyutping.get_jyutping_list(text)
+    for (char, jyut), (_, reading) in zip(
+        ToJyutping.get_jyutping_candidates(text), chosen
+    ):
         if len(jyut) > 1:
-            char.append('poly')
+            if candidates:
+                reading = "|".join([reading] + [j for j in jyut if j != reading])
+            annotated.append((char, "poly", reading))
         elif len(jyut) == 1:
-            char.append('mono')
+            annotated.append((char, "mono", reading))
         else:
-            char.append('punc')
+            annotated.append((char, "punc", None))
+
+    return annotated
 
-    start_tokens = "<PHON_START>"
-    end_tokens = "<PHON_END>"
 
-    jyutpings = ToJyutping.get_jyutping_list(text)
+def poly2jyut(text, candidates=False):
     final_text = []
-    for i, jyutping in enumerate(jyutpings):
-        if char[i] == 'poly':
+    for char, kind, jyutping in annotate(text, candidates):
+        if kind == "poly":
             final_text.append(start_tokens)
-            final_text.append(jyutping[1])
+            final_text.append(jyutping)
             final_text.append(end_tokens)
-        elif char[i] == 'mono':
-            final_text.append(jyutping[0])
         else:
-            final_text.append(jyutping[0]) 
+            final_text.append(char)
 
     combined = "".join(final_text)
     result = combined.replace("<PHON_END><PHON_START>", " ")
@@ -44,6 +54,27 @@ def poly2jyut(text):
     return result
 
 
+def process_speaker(speaker_dir, show_progress=True, candidates=False):
+    # Find all .lab files for this speaker
+    lab_files = list(speaker_dir.rglob("*.lab"))
+
+    results = []
+    for lab_file in tqdm(
+        lab_files, desc=f"Processing {speaker_dir.name}", disable=not show_progress
+    ):
+        text = lab_file.read_text(encoding="utf-8")
+        text_poly = poly2jyut(text, candidates)  # your processing function
+        results.append(text_poly)
+
+    # Save transcriptions to trans.txt inside this speaker folder
+    output_path = speaker_dir / "trans.txt"
+    with output_path.open("w", encoding="utf-8") as f:
+        for lab_file, result in zip(lab_files, results):
+            f.write(f"{lab_file.stem}:{result}\n")
+
+    return speaker_dir, len(results)
+
+
 if __name__ == "__main__":
 
     ap = argparse.ArgumentParser()
@@ -53,6 +84,17 @@ if __name__ == "__main__":
         default=Path("data/corpora"),
         help="folder containing jsut/ and jvs/",
     )
+    ap.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="number of speakers processed in parallel (1 = serial)",
+    )
+    ap.add_argument(
+        "--candidates",
+        action="store_true",
+        help="write every reading of a polyphone as a|b for scripts.cv2.score",
+    )
     args = ap.parse_args()
 
     root_path = Path(args.corpus_root)
@@ -60,20 +102,17 @@ if __name__ == "__main__":
     speaker_dirs = [p for p in root_path.iterdir() if p.is_dir()]
     print(f"Speakers found: {len(speaker_dirs)}")
 
-    for speaker_dir in speaker_dirs:
-        # Find all .lab files for this speaker
-        lab_files = list(speaker_dir.rglob("*.lab"))
-        
-        results = []
-        for lab_file in tqdm(lab_files, desc=f"Processing {speaker_dir.name}"):
-            text = lab_file.read_text(encoding="utf-8")
-            text_poly = poly2jyut(text)  # your processing function
-            results.append(text_poly)
-        
-        # Save transcriptions to trans.txt inside this speaker folder
-        output_path = speaker_dir / "trans.txt"
-        with output_path.open("w", encoding="utf-8") as f:
-            for lab_file, result in zip(lab_files, results):
-                f.write(f"{lab_file.stem}:{result}\n")
-
-
+    if args.num_workers > 1:
+        # One task per speaker; every worker writes its own trans.txt
+        with ProcessPoolExecutor(max_workers=args.num_workers) as pool:
+            jobs = pool.map(
+                process_speaker,
+                speaker_dirs,
+                [False] * len(speaker_dirs),
+                [args.candidates] * len(speaker_dirs),
+            )
+            for _ in tqdm(jobs, total=len(speaker_dirs), desc="Speakers"):
+                pass
+    else:
+        for speaker_dir in speaker_dirs:
+            process_speaker(speaker_dir, candidates=args.candidates)
@@ -6,15 +6,19 @@ Produces a one-to-one `.npy` per WAV and writes a helper TSV mapping.
 - The ONNX model is distributed with CosyVoice2-0.5B release assets:
     pretrained_models/CosyVoice2-0.5B/speech_tokenizer_v2.onnx
 - The model expects 24kHz, mono, normalized PCM -1..1.
+- `--int8` uses the INT8 model written next to it by
+  `python -m scripts.cv2.quantize_tokenizer` (check its agreement report first).
 """
 
 import argparse
 from logging import getLogger, StreamHandler, INFO
 from pathlib import Path
+from typing import List, Optional
 
 import numpy as np
 import onnxruntime as ort
 import tqdm
+import torch
 import torchaudio
 import whisper
 
@@ -25,60 +29,104 @@ logger.setLevel(INFO)
 logger.addHandler(handler)
 logger.propagate = False
 
-ap = argparse.ArgumentParser()
-ap.add_argument("--wav_root", type=str, required=True)
-ap.add_argument("--out_dir", type=str, required=True)
-ap.add_argument(
-    "--onnx_path",
-    type=str,
-    required=True,
-    help="speech_tokenizer_v2.onnx from CosyVoice2 release",
-)
-args = ap.parse_args()
-
-# change to Path object
-args.wav_root = Path(args.wav_root)
-args.out_dir = Path(args.out_dir)
-args.onnx_path = Path(args.onnx_path)
-
-option = ort.SessionOptions()
-option.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-providers = ["CPUExecutionProvider"]  # ["CUDAExecutionProvider"]
-sess = ort.InferenceSession(str(args.onnx_path), providers=providers)
-input_name = sess.get_inputs()[0].name  # "audio"
-output_name = sess.get_outputs()[0].name  # "tokens"
-
-args.out_dir.mkdir(parents=True, exist_ok=True)
-manifest_lines = []
-
-for wav in tqdm.tqdm(sorted(args.wav_root.rglob("*.wav"))):
+SAMPLE_RATE = 16000
+MAX_SECONDS = 30
+
+
+def int8_path(onnx_path: Path) -> Path:
+    """Where the INT8 model of ``onnx_path`` is written."""
+    return onnx_path.with_name(f"{onnx_path.stem}.int8.onnx")
+
+
+def load_session(onnx_path: Path, num_threads: int = 0) -> ort.InferenceSession:
+    option = ort.SessionOptions()
+    option.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads > 0:
+        option.intra_op_num_threads = num_threads
+    providers = ["CPUExecutionProvider"]  # ["CUDAExecutionProvider"]
+    return ort.InferenceSession(str(onnx_path), option, providers=providers)
+
+
+def load_audio_16k(wav: Path) -> torch.Tensor:
     audio, sr = torchaudio.load(wav, backend="soundfile")
 
-    if sr != 16000:
-        audio = torchaudio.transforms.Resample(orig_freq=sr, new_freq=16000)(audio)
+    if sr != SAMPLE_RATE:
+        audio = torchaudio.transforms.Resample(orig_freq=sr, new_freq=SAMPLE_RATE)(
+            audio
+        )
 
     if audio.shape[0] > 1:
         audio = audio.mean(dim=0, keepdim=True)
 
-    if audio.shape[1] / 16000 > 30:
+    return audio
+
+
+def tokenizer_inputs(sess: ort.InferenceSession, audio: torch.Tensor) -> dict:
+    feat = whisper.log_mel_spectrogram(audio, n_mels=128)
+    return {
+        sess.get_inputs()[0].name: feat.detach().cpu().numpy(),
+        sess.get_inputs()[1].name: np.array([feat.shape[2]], dtype=np.int32),
+    }
+
+
+def extract_tokens(sess: ort.InferenceSession, wav: Path) -> Optional[List[int]]:
+    """Speech tokens of one file, or None when it is longer than 30 s."""
+    audio = load_audio_16k(wav)
+
+    if audio.shape[1] / SAMPLE_RATE > MAX_SECONDS:
         logger.warning("do not support extract speech token for audio longer than 30s")
-    else:
-        feat = whisper.log_mel_spectrogram(audio, n_mels=128)
-        tokens = (
-            sess.run(
-                None,
-                {
-                    sess.get_inputs()[0].name: feat.detach().cpu().numpy(),
-                    sess.get_inputs()[1].name: np.array(
-                        [feat.shape[2]], dtype=np.int32
-                    ),
-                },
-            )[0]
-            .flatten()
-            .tolist()
-        )
+        return None
+
+    return sess.run(None, tokenizer_inputs(sess, audio))[0].flatten().tolist()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--wav_root", type=str, required=True)
+    ap.add_argument("--out_dir", type=str, required=True)
+    ap.add_argument(
+        "--onnx_path",
+        type=str,
+        required=True,
+        help="speech_tokenizer_v2.onnx from CosyVoice2 release",
+    )
+    ap.add_argument(
+        "--int8",
+        action="store_true",
+        help="Use <onnx_path stem>.int8.onnx from scripts.cv2.quantize_tokenizer",
+    )
+    ap.add_argument(
+        "--threads", type=int, default=0, help="onnxruntime intra-op threads"
+    )
+    args = ap.parse_args()
+
+    # change to Path object
+    args.wav_root = Path(args.wav_root)
+    args.out_dir = Path(args.out_dir)
+    args.onnx_path = Path(args.onnx_path)
+    if args.int8:
+        args.onnx_path = int8_path(args.onnx_path)
+        if not args.onnx_path.is_file():
+            raise FileNotFoundError(
+                f"{args.onnx_path} not found; run scripts.cv2.quantize_tokenizer first"
+            )
+        logger.info("Using the INT8 tokenizer %s", args.onnx_path)
+
+    sess = load_session(args.onnx_path, args.threads)
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_lines = []
+
+    for wav in tqdm.tqdm(sorted(args.wav_root.rglob("*.wav"))):
+        tokens = extract_tokens(sess, wav)
+        if tokens is None:
+            continue
         out = args.out_dir / f"{wav.stem}.npy"
         np.save(out, tokens)
         manifest_lines.append(f"{wav}	{out}")
 
-logger.info("✓", len(manifest_lines), "files →", str(args.out_dir))
+    logger.info("✓ %d files → %s", len(manifest_lines), args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
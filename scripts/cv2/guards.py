@@ -0,0 +1,78 @@
+"""
+Decode guards
+=============
+Stop speech token decode early instead of trimming runaway audio afterwards:
+
+- a speech token budget from the text length (``DecodeGuards.budget``)
+- detection of repeating or low-diversity token streams (``LoopDetector``)
+
+``scripts.cv2.engine`` applies them at every decode step.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import List
+
+from scripts.cv2.phon import PHON_END, PHON_START
+
+TOKEN_RATE = 25  # CosyVoice 2 speech tokens per second
+
+_uncounted_re = re.compile(f"{re.escape(PHON_START)}|{re.escape(PHON_END)}|\\s")
+
+
+@dataclass(frozen=True)
+class DecodeGuards:
+    base_s: float = 5.0  # Budget of infer.py's --trim_out heuristic:
+    chars_per_s: float = 5.0  # 5 s + 1 s per 5 characters
+    max_period: int = 8  # Longest token cycle checked for repetition
+    loop_tokens: int = 50  # A cycle repeating this long (2 s) is a loop
+    diversity_window: int = 75  # Last tokens (3 s) checked for diversity
+    min_distinct: int = 3  # Fewer distinct tokens than this in the window
+
+    def budget(self, text: str) -> int:
+        """Max speech tokens for ``text``; PHON readings count like plain text."""
+        n_chars = len(_uncounted_re.sub("", text))
+        return math.ceil((self.base_s + n_chars / self.chars_per_s) * TOKEN_RATE)
+
+
+class LoopDetector:
+    """Incremental repetition and diversity checks, O(max_period) per token."""
+
+    def __init__(self, guards: DecodeGuards):
+        self.guards = guards
+        self.runs = [0] * (guards.max_period + 1)
+        self.window: deque = deque()
+        self.counts: Counter = Counter()
+
+    def push(self, tokens: List[int]) -> str:
+        """Check the newest token; returns the loop kind or ``""``."""
+        g = self.guards
+        token = tokens[-1]
+        for p in range(1, g.max_period + 1):
+            if len(tokens) > p and tokens[-1 - p] == token:
+                self.runs[p] += 1
+                if self.runs[p] >= g.loop_tokens:
+                    return "repetition"
+            else:
+                self.runs[p] = 0
+
+        self.window.append(token)
+        self.counts[token] += 1
+        if len(self.window) > g.diversity_window:
+            old = self.window.popleft()
+            self.counts[old] -= 1
+            if self.counts[old] == 0:
+                del self.counts[old]
+            if len(self.counts) < g.min_distinct:
+                return "low_diversity"
+        return ""
+
+    def loop_start(self, reason: str, n_tokens: int) -> int:
+        """Where the looping tail begins; one cycle of a repetition is kept."""
+        if reason == "repetition":
+            return n_tokens - max(self.runs)
+        return n_tokens - len(self.window)
@@ -16,11 +16,14 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import os
+import tempfile
 import time
 import warnings
+from contextlib import contextmanager
 from logging import getLogger, StreamHandler, INFO
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Sequence
 
 import huggingface_hub
 import numpy as np
@@ -30,7 +33,19 @@ import torchaudio
 from huggingface_hub import hf_hub_download
 from peft import PeftModel
 
+from scripts.cv2.audio import trim_wav
+from scripts.cv2.cache import (
+    CachedResult,
+    ResultCache,
+    cache_key,
+    key_seed,
+    prompt_hash,
+)
 from scripts.cv2.patch import apply_patch
+from scripts.cv2.phon import parse_phon
+from scripts.cv2.prefix_cache import PrefixCache, adapter_fingerprint
+from scripts.cv2.trace import tracer
+from scripts.cv2.writer import AudioWriter
 
 apply_patch()
 
@@ -56,18 +71,150 @@ def load_wav(path: Path, sr_out: int) -> np.ndarray:
     return wav
 
 
-def trim_wav(wav: torch.Tensor, sr: int, trigger_level: float = 7.0) -> torch.Tensor:
-    # Cut the beginning of the audio signal with VAD
-    trimmed = torchaudio.functional.vad(wav, sr, trigger_level=trigger_level)
+def load_phon_tokenizer(base_model_dir: str):
+    tok = get_qwen_tokenizer(
+        token_path=f"{base_model_dir}/CosyVoice-BlankEN", skip_special_tokens=True
+    )
+
+    # Register new special tokens
+    new_tokens = ["<PHON_START>", "<PHON_END>"]
+    added = tok.tokenizer.add_special_tokens({"additional_special_tokens": new_tokens})
+    logger.info("Number of tokens added: %s", added)
+
+    # Update the meta information on the QwenTokenizer
+    tok.special_tokens["additional_special_tokens"].extend(
+        [
+            t
+            for t in new_tokens
+            if t not in tok.special_tokens["additional_special_tokens"]
+        ]
+    )
+
+    return tok, new_tokens
+
+
+# Argument order of ``CosyVoice2Model.load(llm_model, flow_model, hift_model)``
+_WEIGHT_FILES = ("llm", "flow", "hift")
+
+
+@contextmanager
+def _skip_weights(names: Sequence[str]):
+    """Within the block ``CosyVoice2Model.load`` loads every module as usual
+    except ``names`` (of llm, flow, hift), which keep their constructed weights;
+    their ``.pt`` files are never read.
+
+    Upstream's ``load`` runs unchanged on stand-ins without parameters and empty
+    state dicts, so nothing of it is reimplemented here.
+    """
+    from cosyvoice.cli.model import CosyVoice2Model
+
+    original = CosyVoice2Model.load
+
+    def load(self, *paths, **kwargs):
+        kept = {name: getattr(self, name) for name in names}
+        try:
+            with tempfile.TemporaryDirectory(prefix="uttertune-") as tmp:
+                empty = os.path.join(tmp, "empty.pt")
+                torch.save({}, empty)
+                paths = [
+                    empty if name in names else path
+                    for name, path in zip(_WEIGHT_FILES, paths)
+                ] + list(paths[len(_WEIGHT_FILES) :])
+                for name in names:
+                    setattr(self, name, torch.nn.Module())
+                original(self, *paths, **kwargs)
+        finally:
+            for name, module in kept.items():
+                setattr(self, name, module)
+
+    CosyVoice2Model.load = load
+    try:
+        yield
+    finally:
+        CosyVoice2Model.load = original
+
+
+def load_base_model(
+    base_model_dir: str, skip_weights: Sequence[str] = ()
+) -> CosyVoice2:
+    """The upstream ``CosyVoice2``. The modules in ``skip_weights`` (of llm,
+    flow, hift) keep their constructed weights, for callers that replace them or
+    the whole module; they are not moved to the model's device either."""
+    if not skip_weights:
+        return CosyVoice2(model_dir=base_model_dir, fp16=False)
+    unknown = set(skip_weights) - set(_WEIGHT_FILES)
+    if unknown:
+        raise ValueError(f"Unknown modules in skip_weights: {sorted(unknown)}")
+    with _skip_weights(tuple(skip_weights)):
+        return CosyVoice2(model_dir=base_model_dir, fp16=False)
+
+
+def load_model(
+    base_model_dir: str, lora_dir: Optional[Path], device: torch.device
+) -> CosyVoice2:
+    cv2 = load_base_model(base_model_dir)
+
+    if lora_dir is not None:
+        base_model = cv2.model.llm
+
+        # Expand vocabulary
+        tok, new_tokens = load_phon_tokenizer(base_model_dir)
+        base_model.llm.model.resize_token_embeddings(len(tok.tokenizer))
+        new_ids = tok.tokenizer.convert_tokens_to_ids(new_tokens)
+        w = cv2.model.llm.llm.model.model.embed_tokens.weight
+
+        # Attach LoRA
+        logger.info("Loading LoRA from %s", lora_dir)
 
-    # Cut the end of the voice signal (reverse and VAD again)
-    if trimmed.shape[-1] > 0:
-        trimmed_rev = torchaudio.functional.vad(
-            trimmed.flip(-1), sr, trigger_level=trigger_level
+        # Load LoRA weights
+        hf_model = PeftModel.from_pretrained(
+            base_model,
+            lora_dir,
+            is_trainable=False,
+            torch_dtype=torch.float32,
+        )
+        hf_model.to(device).eval()
+
+        # Load embeddings of the new tokens
+        rows = st.load_file(lora_dir / "embed_patch.safetensors")["embed_rows"].to(
+            device
         )
-        trimmed = trimmed_rev.flip(-1)
 
-    return trimmed
+        with torch.no_grad():
+            hf_model.base_model.llm.model.get_input_embeddings().weight[new_ids] = rows
+
+        cv2.model.llm = hf_model
+        w = cv2.model.llm.llm.model.model.embed_tokens.weight
+        print(w[new_ids])
+        print(f"new ids: {new_ids}")
+
+    return cv2
+
+
+def read_sentences(texts: str) -> List[str]:
+    if Path(texts).is_file():
+        sentences: List[str] = [
+            ln.strip()
+            for ln in Path(texts).read_text("utf-8").splitlines()
+            if ln.strip()
+        ]
+    else:
+        sentences = [s.strip() for s in texts.split("|") if s.strip()]
+
+    # Fail before synthesis starts rather than on a malformed sentence mid-run
+    for idx, sentence in enumerate(sentences):
+        try:
+            parse_phon(sentence)
+        except ValueError as e:
+            raise ValueError(f"Sentence {idx + 1}: {e}") from e
+
+    return sentences
+
+
+def read_prompt_text(prompt_text: str) -> str:
+    if Path(prompt_text).is_file():
+        return Path(prompt_text).read_text("utf_8").strip()
+    return prompt_text
 
 
 def main():
@@ -102,13 +249,84 @@ def main():
         help="Transcription for the prompt wav",
     )
     ap.add_argument("--out_dir", type=Path, default="wavs_out")
+    ap.add_argument("--out_format", choices=["wav", "flac", "opus"], default="wav")
+    ap.add_argument(
+        "--shard_size",
+        type=int,
+        default=0,
+        help="Utterances per tar shard with an offset index (0 = one file each)",
+    )
+    ap.add_argument("--writer_threads", type=int, default=4)
     ap.add_argument("--trim_out", action="store_true", help="Trim synthesized speech")
     ap.add_argument(
         "--cpu", action="store_true", help="Force CPU inference (for debug)"
     )
     ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument(
+        "--int8",
+        action="store_true",
+        help="Merge LoRA and quantize the LLM linears to INT8 (CPU only)",
+    )
+    ap.add_argument(
+        "--snapshot",
+        type=Path,
+        default=None,
+        help="Load a scripts.cv2.snapshot directory instead of --base_model/--lora_dir",
+    )
+    ap.add_argument(
+        "--onnx_llm",
+        type=Path,
+        default=None,
+        help="Run the LLM on onnxruntime from a scripts.cv2.export_onnx directory "
+        "(LoRA already merged; cannot be combined with --lora_dir)",
+    )
+    ap.add_argument(
+        "--engine",
+        choices=["cosyvoice", "uttertune"],
+        default="cosyvoice",
+        help="cosyvoice: inference_zero_shot; uttertune: staged engine with prefix KV cache",
+    )
+    ap.add_argument(
+        "--prefix_cache_mb",
+        type=int,
+        default=512,
+        help="Memory bound of the prompt prefix KV cache (uttertune engine)",
+    )
+    ap.add_argument(
+        "--acoustic_batch_size",
+        type=int,
+        default=4,
+        help="Max utterances per vocoder batch (uttertune engine)",
+    )
+    ap.add_argument(
+        "--no_decode_guards",
+        action="store_true",
+        help="Disable the text-length budget and token-loop stops (uttertune engine)",
+    )
+    ap.add_argument(
+        "--result_cache_mb",
+        type=int,
+        default=0,
+        help="In-memory cache of synthesized sentences (0 = off unless --result_cache_dir)",
+    )
+    ap.add_argument("--result_cache_dir", type=Path, default=None)
+    ap.add_argument("--result_cache_disk_mb", type=int, default=10240)
+    ap.add_argument(
+        "--trace",
+        type=Path,
+        default=None,
+        help="Write per-stage spans as a Chrome trace JSON and log percentiles",
+    )
+    ap.add_argument(
+        "--trace_cuda_sync",
+        action="store_true",
+        help="Synchronize CUDA at span ends (accurate GPU stage times, less overlap)",
+    )
     args = ap.parse_args()
 
+    if args.trace is not None:
+        tracer.enable(cuda_sync=args.trace_cuda_sync)
+
     device = torch.device(
         "cpu" if args.cpu or not torch.cuda.is_available() else "cuda"
     )
@@ -118,105 +336,157 @@ def main():
 
     SAMPLE_RATE = 16000
 
-    cv2 = CosyVoice2(model_dir=args.base_model, fp16=False)
-
-    if args.lora_dir is not None:
-        base_model = cv2.model.llm
-
-        # Expand vocabulary
-        tok = get_qwen_tokenizer(
-            token_path=f"{args.base_model}/CosyVoice-BlankEN", skip_special_tokens=True
-        )
+    adapter_id = adapter_fingerprint(args.lora_dir)
+    if args.onnx_llm is not None:
+        if args.int8 or args.engine != "cosyvoice":
+            raise ValueError("--onnx_llm only works with --engine cosyvoice and fp32")
+        if args.lora_dir is not None:
+            raise ValueError(
+                "--onnx_llm already has its adapter merged; drop --lora_dir"
+            )
+        from scripts.cv2.onnx_llm import load_model as load_onnx_model
+
+        cv2 = load_onnx_model(args.base_model, args.onnx_llm, device)
+        adapter_id = cv2.model.llm.adapter_id
+        logger.info("LLM on onnxruntime from %s", args.onnx_llm)
+    elif args.snapshot is not None:
+        from scripts.cv2.snapshot import load_snapshot, read_meta
 
-        # Register new special tokens
-        new_tokens = ["<PHON_START>", "<PHON_END>"]
-        added = tok.tokenizer.add_special_tokens(
-            {"additional_special_tokens": new_tokens}
-        )
-        logger.info("Number of tokens added: %s", added)
-
-        # Update the meta information on the QwenTokenizer
-        tok.special_tokens["additional_special_tokens"].extend(
-            [
-                t
-                for t in new_tokens
-                if t not in tok.special_tokens["additional_special_tokens"]
-            ]
-        )
-        base_model.llm.model.resize_token_embeddings(len(tok.tokenizer))
-        new_ids = tok.tokenizer.convert_tokens_to_ids(new_tokens)
-        w = cv2.model.llm.llm.model.model.embed_tokens.weight
-
-        # Attach LoRA
-        logger.info("Loading LoRA from %s", args.lora_dir)
-
-        # Load LoRA weights
-        hf_model = PeftModel.from_pretrained(
-            base_model,
-            args.lora_dir,
-            is_trainable=False,
-            torch_dtype=torch.float32,
-        )
-        hf_model.to(device).eval()
-
-        # Load embeddings of the new tokens
-        rows = st.load_file(args.lora_dir / "embed_patch.safetensors")["embed_rows"].to(
-            device
+        t0 = time.perf_counter()
+        cv2 = load_snapshot(args.snapshot, device)
+        adapter_id = read_meta(args.snapshot)["adapter"]
+        logger.info(f"Loaded snapshot {args.snapshot} in {time.perf_counter() - t0:.2f}s")
+    else:
+        cv2 = load_model(args.base_model, args.lora_dir, device)
+
+    if args.int8:
+        if device.type != "cpu":
+            raise ValueError("--int8 requires CPU inference; add --cpu")
+        from scripts.cv2.quantize import quantize_llm
+
+        quantize_llm(cv2)
+        logger.info("Quantized the LLM to INT8")
+
+    engine = acoustic = None
+    if args.engine == "uttertune":
+        from scripts.cv2.acoustic import AcousticStage
+        from scripts.cv2.engine import Engine
+        from scripts.cv2.guards import DecodeGuards
+
+        engine = Engine(
+            cv2,
+            prefix_cache=PrefixCache(max_bytes=args.prefix_cache_mb << 20),
+            adapter_id=adapter_id,
+            guards=None if args.no_decode_guards else DecodeGuards(),
         )
-
-        with torch.no_grad():
-            hf_model.base_model.llm.model.get_input_embeddings().weight[new_ids] = rows
-
-        cv2.model.llm = hf_model
-        w = cv2.model.llm.llm.model.model.embed_tokens.weight
-        print(w[new_ids])
-        print(f"new ids: {new_ids}")
+        acoustic = AcousticStage(engine, max_batch_size=args.acoustic_batch_size)
 
     # I/O
-    out_dir = Path(args.out_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
+    writer = AudioWriter(
+        args.out_dir,
+        fmt=args.out_format,
+        num_workers=args.writer_threads,
+        shard_size=args.shard_size,
+    )
 
-    if Path(args.texts).is_file():
-        sentences: List[str] = [
-            ln.strip()
-            for ln in Path(args.texts).read_text("utf-8").splitlines()
-            if ln.strip()
-        ]
-    else:
-        sentences = [s.strip() for s in args.texts.split("|") if s.strip()]
+    sentences = read_sentences(args.texts)
 
     prompt_speech_16k = load_wav(args.prompt_wav, SAMPLE_RATE)
     prompt_speech_16k = trim_wav(prompt_speech_16k, SAMPLE_RATE)
 
-    if Path(args.prompt_text).is_file():
-        prompt_text = Path(args.prompt_text).read_text("utf_8").strip()
-    else:
-        prompt_text = args.prompt_text
-
-    for idx, sentence in enumerate(sentences):
-        logger.info(f"[ {idx + 1:03d} ] \u270d︎ '{sentence[:30]}...' → synth...")
+    prompt_text = read_prompt_text(args.prompt_text)
 
-        t0 = time.perf_counter()
+    cache = None
+    keys = [str(idx) for idx in range(len(sentences))]
+    if args.result_cache_mb > 0 or args.result_cache_dir is not None:
+        cache = ResultCache(
+            args.result_cache_dir,
+            memory_bytes=args.result_cache_mb << 20,
+            disk_bytes=args.result_cache_disk_mb << 20,
+        )
+        prompt_id = prompt_hash(prompt_text, prompt_speech_16k)
+        if device.type != "cpu":
+            logger.warning(
+                "Result cache on %s: sampling is not bit-reproducible there, so a "
+                "hit is a valid sample for its seed but may differ from a rerun",
+                device.type,
+            )
+        params = {
+            "engine": args.engine,
+            "device": device.type,
+            "threads": torch.get_num_threads(),
+            "int8": args.int8,
+            "onnx_llm": (
+                cv2.model.llm.fingerprint if args.onnx_llm is not None else None
+            ),
+            "decode_guards": args.engine == "uttertune" and not args.no_decode_guards,
+        }
+        keys = [
+            cache_key(sentence, prompt_id, adapter_id, args.seed, params)
+            for sentence in sentences
+        ]
 
-        wav_iter = cv2.inference_zero_shot(
-            tts_text=sentence,
-            prompt_text=prompt_text,
-            prompt_speech_16k=prompt_speech_16k,
+    pending = {}
+    if engine is not None:
+        from scripts.cv2.acoustic import pipeline
+
+        # Only sentences not cached yet go through the pipeline, each once
+        for sentence, key in zip(sentences, keys):
+            if key not in pending and (cache is None or key not in cache):
+                pending[key] = sentence
+
+        # LLM decode of the next sentences overlaps with flow/vocoder of this one
+        results = pipeline(
+            engine,
+            acoustic,
+            list(pending.values()),
+            prompt_text,
+            prompt_speech_16k,
+            seeds=[key_seed(k) for k in pending] if cache is not None else None,
         )
 
-        wav_dict = next(wav_iter)  # {'tts_speech': Tensor(1,T)}
-        dt = time.perf_counter() - t0
+    for idx, sentence in enumerate(sentences):
+        logger.info(f"[ {idx + 1:03d} ] \u270d︎ '{sentence[:30]}...' → synth...")
 
-        wav = wav_dict["tts_speech"]
-        trimmed = wav
+        t0 = time.perf_counter()
 
-        # Save synthesized file
-        out_path = out_dir / f"{idx + 1:03d}.wav"
-        torchaudio.save(
-            str(out_path), trimmed, cv2.sample_rate, format="wav", encoding="PCM_S"
-        )
+        key = keys[idx]
+        hit = cache.get(key) if cache is not None else None
+        tokens = None
+        if hit is None and cache is not None and key not in pending:
+            # Same result whatever was synthesized or served from the cache before
+            torch.manual_seed(key_seed(key))
+            np.random.seed(key_seed(key))
+        if hit is not None:
+            wav, dt = hit.wav, time.perf_counter() - t0
+        elif engine is not None and key in pending:
+            wav, dt, tokens = next(results)
+            del pending[key]
+        elif engine is not None:
+            # Expected from the cache but evicted since
+            wav = engine.synthesize(sentence, prompt_text, prompt_speech_16k)
+            dt = time.perf_counter() - t0
+        else:
+            wav_iter = cv2.inference_zero_shot(
+                tts_text=sentence,
+                prompt_text=prompt_text,
+                prompt_speech_16k=prompt_speech_16k,
+            )
+
+            # Stages are internal to CosyVoice here; only the total is traced
+            with tracer.span("cosyvoice.inference_zero_shot"):
+                wav_dict = next(wav_iter)  # {'tts_speech': Tensor(1,T)}
+            wav = wav_dict["tts_speech"]
+            dt = time.perf_counter() - t0
+
+        if cache is not None and hit is None:
+            cache.put(key, CachedResult(wav.cpu(), cv2.sample_rate, tokens))
+
+        # Save synthesized file (encoded and written in the background)
+        key = f"{idx + 1:03d}"
+        writer.write(key, wav, cv2.sample_rate, {"text": sentence})
         logger.info(
-            f"    saved → {out_path}  ({dt:.2f}s, {trimmed.shape[-1] / cv2.sample_rate:.2f}s)"
+            f"    queued → {key}  ({dt:.2f}s, {wav.shape[-1] / cv2.sample_rate:.2f}s)"
         )
 
         # [Optional] trim synthesized file
@@ -227,18 +497,25 @@ def main():
                 trimmed = trim_wav(wav, cv2.sample_rate)
 
                 if trimmed.shape[-1] > 0:
-                    out_path_trimmed = out_path.with_name(f"{idx + 1:03d}_trimmed.wav")
-                    torchaudio.save(
-                        str(out_path_trimmed),
-                        trimmed,
-                        cv2.sample_rate,
-                        format="wav",
-                        encoding="PCM_S",
+                    writer.write(
+                        f"{key}_trimmed", trimmed, cv2.sample_rate, {"text": sentence}
                     )
                     logger.info(
-                        f"    saved → {out_path_trimmed}  ({dt:.2f}s, {trimmed.shape[-1] / cv2.sample_rate:.2f}s)"
+                        f"    queued → {key}_trimmed  ({dt:.2f}s, {trimmed.shape[-1] / cv2.sample_rate:.2f}s)"
                     )
 
+    if engine is not None:
+        acoustic.close()
+        logger.info("Prefix cache: %s", engine.prefix_cache.stats())
+        logger.info("Decode stops: %s", dict(engine.stop_counts))
+    writer.close()
+    if cache is not None:
+        logger.info("Result cache: %s", cache.stats())
+    logger.info("Writer: %s", writer.stats())
+    if args.trace is not None:
+        tracer.write_chrome_trace(args.trace)
+        logger.info("Stage timings:\n%s", tracer.format_summary())
+        logger.info(f"Chrome trace → {args.trace}")
     logger.info("All sentences have been synthesised.")
 
 
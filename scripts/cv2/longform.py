@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+CosyVoice 2 + LoRA long-form synthesis
+======================================
+Split a document into sentence chunks, synthesize the chunks concurrently in a
+pool of worker processes (each holding its own model) and reassemble the audio
+in document order with a crossfade or inserted silence between chunks.
+
+Writes a single wav plus ``<out>.timing.tsv`` with per-chunk timing.
+
+Usage:
+    python -m scripts.cv2.longform \
+        --base_model pretrained_models/CosyVoice2-0.5B \
+        --lora_dir lora_weights/UtterTune-CosyVoice2-ja-JSUTJVS \
+        --document book.txt \
+        --prompt_wav prompts/wav/common_voice_ja_41758953.wav \
+        --prompt_text prompts/trans/common_voice_ja_41758953.txt \
+        --num_workers 4 \
+        --out wavs_out/book.wav
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import multiprocessing as mp
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+import torchaudio
+
+from scripts.cv2.infer import (
+    load_model,
+    load_phon_tokenizer,
+    load_wav,
+    read_prompt_text,
+    trim_wav,
+)
+from scripts.cv2.phon import parse_phon
+from scripts.cv2.split import TOKEN_BUDGETS, guess_lang, split_paragraph
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+PROMPT_SAMPLE_RATE = 16000
+
+
+@dataclass
+class ChunkResult:
+    idx: int
+    text: str
+    wav: np.ndarray  # (T,) float32
+    sample_rate: int
+    synth_s: float
+    pid: int
+
+
+def split_document(
+    document: str, tokenizer_encode, lang: Optional[str] = None
+) -> List[str]:
+    """Split every line of ``document`` into chunks; lines are never merged.
+
+    ``lang`` picks the token budget; by default it is guessed per line.
+    """
+    chunks: List[str] = []
+    for paragraph in document.splitlines():
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        parse_phon(paragraph)  # Fail on malformed spans before any synthesis
+        chunks.extend(
+            split_paragraph(
+                paragraph, tokenizer_encode, lang=lang or guess_lang(paragraph)
+            )
+        )
+    return chunks
+
+
+# Per-process state, filled once by _init_worker
+_worker: Dict[str, object] = {}
+
+
+def _init_worker(
+    base_model: str,
+    lora_dir: Optional[Path],
+    device: str,
+    prompt_wav: Path,
+    prompt_text: str,
+    num_threads: int,
+):
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    warnings.filterwarnings("ignore", category=torch.jit.TracerWarning)
+
+    _worker["cv2"] = load_model(base_model, lora_dir, torch.device(device))
+    prompt_speech_16k = load_wav(prompt_wav, PROMPT_SAMPLE_RATE)
+    _worker["prompt_speech_16k"] = trim_wav(prompt_speech_16k, PROMPT_SAMPLE_RATE)
+    # Normalized here (and each chunk in _synthesize_chunk) exactly as
+    # inference_zero_shot would, since that call runs with text_frontend=False
+    _worker["prompt_text"] = _worker["cv2"].frontend.text_normalize(
+        read_prompt_text(prompt_text), split=False
+    )
+
+
+def _synthesize_chunk(idx: int, text: str, seed: int) -> ChunkResult:
+    cv2 = _worker["cv2"]
+
+    # Seed per chunk so the result does not depend on which worker ran it
+    torch.manual_seed(seed + idx)
+    np.random.seed(seed + idx)
+
+    t0 = time.perf_counter()
+    # The chunk is already split to budget: normalize it without splitting and
+    # keep the frontend from splitting it again
+    tts_text = cv2.frontend.text_normalize(text, split=False)
+    wavs = [
+        out["tts_speech"]
+        for out in cv2.inference_zero_shot(
+            tts_text=tts_text,
+            prompt_text=_worker["prompt_text"],
+            prompt_speech_16k=_worker["prompt_speech_16k"],
+            text_frontend=False,
+        )
+    ]
+    wav = torch.cat(wavs, dim=-1)
+    dt = time.perf_counter() - t0
+
+    return ChunkResult(
+        idx=idx,
+        text=text,
+        wav=wav.squeeze(0).cpu().numpy().astype(np.float32),
+        sample_rate=cv2.sample_rate,
+        synth_s=dt,
+        pid=os.getpid(),
+    )
+
+
+def assemble(
+    wavs: List[np.ndarray], sample_rate: int, crossfade_ms: float, silence_ms: float
+) -> tuple:
+    """Concatenate ``wavs`` in order; returns (audio, start offset of every wav)."""
+    silence = np.zeros(int(sample_rate * silence_ms / 1000), dtype=np.float32)
+    n_fade = int(sample_rate * crossfade_ms / 1000) if silence.size == 0 else 0
+
+    out = np.zeros(0, dtype=np.float32)
+    starts = []
+    for i, wav in enumerate(wavs):
+        if i > 0:
+            out = np.concatenate([out, silence])
+        n = min(n_fade, out.size, wav.size) if i > 0 else 0
+        starts.append(out.size - n)
+        if n > 0:
+            # Linear crossfade over the last n samples of out
+            ramp = np.linspace(0.0, 1.0, n, dtype=np.float32)
+            overlap = out[-n:] * (1.0 - ramp) + wav[:n] * ramp
+            out = np.concatenate([out[:-n], overlap, wav[n:]])
+        else:
+            out = np.concatenate([out, wav])
+    return out, starts
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--base_model",
+        type=str,
+        required=True,
+        help="CosyVoice2 base model directory",
+    )
+    ap.add_argument("--lora_dir", type=Path, default=None, help="LoRA adapter directory")
+    ap.add_argument("--document", type=Path, required=True, help="UTF-8 text file")
+    ap.add_argument(
+        "--lang",
+        choices=sorted(TOKEN_BUDGETS),
+        default=None,
+        help="Language of the document for the split budget (default: per line guess)",
+    )
+    ap.add_argument("--prompt_wav", type=Path, required=True)
+    ap.add_argument("--prompt_text", required=True, help="Transcription or its file")
+    ap.add_argument("--out", type=Path, default=Path("wavs_out/longform.wav"))
+    ap.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Worker processes, each loading its own model (0 = in this process)",
+    )
+    ap.add_argument(
+        "--threads_per_worker", type=int, default=0, help="torch threads (0 = default)"
+    )
+    ap.add_argument("--crossfade_ms", type=float, default=20.0)
+    ap.add_argument(
+        "--silence_ms",
+        type=float,
+        default=0.0,
+        help="Silence inserted between chunks; disables the crossfade when > 0",
+    )
+    ap.add_argument("--cpu", action="store_true", help="Force CPU inference")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    device = "cpu" if args.cpu or not torch.cuda.is_available() else "cuda"
+
+    tok, _ = load_phon_tokenizer(args.base_model)
+    chunks = split_document(args.document.read_text("utf-8"), tok.encode, args.lang)
+    if not chunks:
+        raise ValueError(f"No text to synthesize in {args.document}")
+    logger.info("%d chunks from %s", len(chunks), args.document)
+
+    initargs = (
+        args.base_model,
+        args.lora_dir,
+        device,
+        args.prompt_wav,
+        args.prompt_text,
+        args.threads_per_worker,
+    )
+    results: Dict[int, ChunkResult] = {}
+    t0 = time.perf_counter()
+
+    if args.num_workers == 0:
+        _init_worker(*initargs)
+        for idx, text in enumerate(chunks):
+            results[idx] = _synthesize_chunk(idx, text, args.seed)
+            logger.info(f"[ {idx + 1:03d} / {len(chunks)} ] {results[idx].synth_s:.2f}s")
+    else:
+        with ProcessPoolExecutor(
+            max_workers=args.num_workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=initargs,
+        ) as pool:
+            futures = [
+                pool.submit(_synthesize_chunk, idx, text, args.seed)
+                for idx, text in enumerate(chunks)
+            ]
+            for future in as_completed(futures):
+                res = future.result()
+                results[res.idx] = res
+                logger.info(
+                    f"[ {res.idx + 1:03d} / {len(chunks)} ] {res.synth_s:.2f}s (pid {res.pid})"
+                )
+
+    wall = time.perf_counter() - t0
+    ordered = [results[i] for i in range(len(chunks))]
+    sample_rate = ordered[0].sample_rate
+    audio, starts = assemble(
+        [r.wav for r in ordered], sample_rate, args.crossfade_ms, args.silence_ms
+    )
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    torchaudio.save(
+        str(args.out),
+        torch.from_numpy(audio).unsqueeze(0),
+        sample_rate,
+        format="wav",
+        encoding="PCM_S",
+    )
+
+    timing_path = args.out.with_suffix(".timing.tsv")
+    with timing_path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(["idx", "start_s", "audio_s", "synth_s", "rtf", "pid", "text"])
+        for r, start in zip(ordered, starts):
+            audio_s = r.wav.size / sample_rate
+            writer.writerow(
+                [
+                    r.idx,
+                    f"{start / sample_rate:.3f}",
+                    f"{audio_s:.3f}",
+                    f"{r.synth_s:.3f}",
+                    f"{r.synth_s / audio_s:.3f}" if audio_s > 0 else "",
+                    r.pid,
+                    r.text,
+                ]
+            )
+
+    total_s = audio.size / sample_rate
+    logger.info(
+        f"saved → {args.out}  ({total_s:.2f}s audio in {wall:.2f}s, RTF {wall / max(total_s, 1e-9):.3f})"
+    )
+    logger.info(f"timing → {timing_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+onnxruntime LLM for CosyVoice 2
+===============================
+Drop-in replacement for ``CosyVoice2Model.llm`` backed by the graph written by
+``scripts.cv2.export_onnx``. ``inference`` has the signature and output of
+``Qwen2LM.inference`` (a generator of speech token ids), so the stock
+``inference_zero_shot`` path runs unchanged on top of it.
+
+``load_model`` builds CosyVoice2 with the upstream constructor, skipping
+``llm.pt``, and swaps this class in for its LLM.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+STEP_FILE = "llm_step.onnx"
+META_FILE = "llm_meta.json"
+
+
+def io_names(n_layers: int):
+    past, present = [], []
+    for i in range(n_layers):
+        past += [f"past_key_{i}", f"past_value_{i}"]
+        present += [f"present_key_{i}", f"present_value_{i}"]
+    return ["inputs_embeds"] + past, ["logp"] + present
+
+
+def export_fingerprint(onnx_dir: Path) -> str:
+    """Content hash of every exported file except the metadata."""
+    h = hashlib.sha256()
+    for path in sorted(Path(onnx_dir).iterdir()):
+        if path.name == META_FILE or not path.is_file():
+            continue
+        h.update(path.name.encode("utf-8"))
+        with path.open("rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()[:16]
+
+
+class OrtQwen2LM:
+    def __init__(
+        self,
+        onnx_dir: Path,
+        sampling: Optional[Callable] = None,
+        num_threads: int = 0,
+    ):
+        onnx_dir = Path(onnx_dir)
+        self.meta = json.loads((onnx_dir / META_FILE).read_text("utf-8"))
+        self.sos_eos = self.meta["sos_eos"]
+        self.task_id = self.meta["task_id"]
+        self.speech_token_size = self.meta["speech_token_size"]
+        missing = [k for k in ("adapter", "fingerprint") if k not in self.meta]
+        if missing:
+            raise ValueError(
+                f"{onnx_dir / META_FILE} has no {' or '.join(missing)}; re-export it "
+                "with scripts.cv2.export_onnx"
+            )
+        # Fingerprint of the LoRA adapter merged into the graph at export time
+        self.adapter_id = self.meta["adapter"]
+        # Content hash of the export itself (graph, weights, embedding tables)
+        self.fingerprint = self.meta["fingerprint"]
+        # ras_sampling of the PyTorch Qwen2LM: (logp, decoded_tokens, top_k) -> id
+        self.sampling = sampling
+
+        option = ort.SessionOptions()
+        option.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            option.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            str(onnx_dir / STEP_FILE), option, providers=["CPUExecutionProvider"]
+        )
+        self.input_names, self.output_names = io_names(self.meta["n_layers"])
+
+        # Memory-mapped: pages are only read for the rows that are looked up
+        self.embed_tokens = np.load(onnx_dir / "embed_tokens.npy", mmap_mode="r")
+        self.llm_embedding = np.load(onnx_dir / "llm_embedding.npy")
+        self.speech_embedding = np.load(onnx_dir / "speech_embedding.npy", mmap_mode="r")
+
+    def empty_cache(self) -> List[np.ndarray]:
+        shape = (1, self.meta["n_kv_heads"], 0, self.meta["head_dim"])
+        return [np.zeros(shape, dtype=np.float32)] * (2 * self.meta["n_layers"])
+
+    def step(self, inputs_embeds: np.ndarray, past: List[np.ndarray]):
+        """Returns ``(logp (1, V), present)`` for ``inputs_embeds`` (1, L, D)."""
+        feeds = dict(zip(self.input_names, [inputs_embeds, *past]))
+        logp, *present = self.session.run(self.output_names, feeds)
+        return logp, present
+
+    def sampling_ids(
+        self,
+        weighted_scores: torch.Tensor,
+        decoded_tokens: List[int],
+        sampling: int,
+        ignore_eos: bool = True,
+    ) -> int:
+        num_trials, max_trials = 0, 100
+        while True:
+            top_ids = self.sampling(weighted_scores, decoded_tokens, sampling)
+            if (not ignore_eos) or (self.speech_token_size not in top_ids):
+                break
+            num_trials += 1
+            if num_trials > max_trials:
+                raise RuntimeError(
+                    f"sampling reaches max_trials {max_trials} and still get eos "
+                    "when ignore_eos is True, check your input!"
+                )
+        return int(top_ids)
+
+    def inference(
+        self,
+        text: torch.Tensor,
+        text_len: torch.Tensor,
+        prompt_text: torch.Tensor,
+        prompt_text_len: torch.Tensor,
+        prompt_speech_token: torch.Tensor,
+        prompt_speech_token_len: torch.Tensor,
+        embedding: torch.Tensor,
+        sampling: int = 25,
+        max_token_text_ratio: float = 20,
+        min_token_text_ratio: float = 2,
+        **kwargs,
+    ):
+        text_ids = torch.concat([prompt_text, text], dim=1).cpu().numpy()[0]
+        speech_ids = prompt_speech_token.cpu().numpy()[0]
+        lm_input = np.concatenate(
+            [
+                self.llm_embedding[self.sos_eos][None],
+                self.embed_tokens[text_ids],
+                self.llm_embedding[self.task_id][None],
+                self.speech_embedding[speech_ids],
+            ]
+        )[None].astype(np.float32)
+
+        n_text = text.shape[1]
+        min_len = int(n_text * min_token_text_ratio)
+        max_len = int(n_text * max_token_text_ratio)
+
+        out_tokens: List[int] = []
+        past = self.empty_cache()
+        for i in range(max_len):
+            logp, past = self.step(lm_input, past)
+            top_id = self.sampling_ids(
+                torch.from_numpy(logp).squeeze(dim=0),
+                out_tokens,
+                sampling,
+                ignore_eos=i < min_len,
+            )
+            if top_id == self.speech_token_size:
+                break
+            if top_id > self.speech_token_size:
+                continue
+            yield top_id
+            out_tokens.append(top_id)
+            lm_input = self.speech_embedding[top_id][None, None].astype(np.float32)
+
+
+def load_model(
+    base_model_dir: str, onnx_dir: Path, device: torch.device, num_threads: int = 0
+):
+    """The upstream ``CosyVoice2`` with its LLM replaced by the ONNX session.
+
+    ``llm.pt`` is never read; the constructed ``Qwen2LM`` only lends its
+    ``sampling`` function and is dropped. Flow and HiFT are moved to ``device``;
+    onnxruntime decodes on the CPU.
+    """
+    from scripts.cv2.infer import load_base_model, load_phon_tokenizer
+
+    cv2 = load_base_model(base_model_dir, skip_weights=("llm",))
+    cv2.model.device = device
+    for module in (cv2.model.flow, cv2.model.hift):
+        module.to(device)
+    cv2.model.llm = OrtQwen2LM(
+        onnx_dir, sampling=cv2.model.llm.sampling, num_threads=num_threads
+    )
+    # The frontend tokenizer is the cached Qwen tokenizer: register PHON tokens
+    load_phon_tokenizer(base_model_dir)
+    return cv2
@@ -1,44 +1,40 @@
 from __future__ import annotations
-from typing import Callable, Any
+from typing import Dict, Optional
 
+from scripts.cv2.split import TOKEN_BUDGETS, TokenBudget, split_paragraph
 
-def apply_patch():
+
+def apply_patch(token_budgets: Optional[Dict[str, TokenBudget]] = None):
     try:
-        from submodules.CosyVoice.cosyvoice.utils import frontend_utils as fu
+        from cosyvoice.cli import frontend as cv_frontend
+        from cosyvoice.utils import frontend_utils as fu
     except Exception as e:
-        raise RuntimeError(f"[patch] failed to import cosyvoice frontend_utils: {e}")
+        raise RuntimeError(f"[patch] failed to import cosyvoice frontend: {e}")
 
     if getattr(fu, "_split_paragraph_patched", False):
         return
 
-    original: Callable[..., Any] = fu.split_paragraph
+    budgets = dict(TOKEN_BUDGETS, **(token_budgets or {}))
 
-    def split_paragraph_patched(
+    def split_paragraph_native(
         text,
         tokenizer_encode,
-        lang,
-        *,
+        lang="zh",
         token_max_n=80,
         token_min_n=60,
         merge_len=20,
         comma_split=False,
     ):
-        if lang == "zh":
-            token_max_n = 160
-            merge_len = 160
-        return original(
-            text,
-            tokenizer_encode,
-            lang,
-            token_max_n=token_max_n,
-            token_min_n=token_min_n,
-            merge_len=merge_len,
-            comma_split=comma_split,
+        # CosyVoice's hard-coded sizes are replaced by the per-language budgets
+        return split_paragraph(
+            text, tokenizer_encode, lang, budgets=budgets, comma_split=comma_split
         )
 
-    fu.split_paragraph = split_paragraph_patched
+    # The frontend imports split_paragraph by name, so rebind it there too
+    fu.split_paragraph = split_paragraph_native
+    cv_frontend.split_paragraph = split_paragraph_native
     fu._split_paragraph_patched = True
     print(
-        "[patch] Patched cosyvoice.utils.frontend_utils.split_paragraph for zh "
-        "(token_max_n=160, merge_len=160)"
+        "[patch] Replaced cosyvoice split_paragraph with the token-budget splitter "
+        f"({', '.join(f'{k}={v.max_n}' for k, v in budgets.items())})"
     )
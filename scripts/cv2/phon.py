@@ -0,0 +1,181 @@
+"""
+PHON tag frontend
+=================
+Parse ``<PHON_START>...<PHON_END>`` spans once into a structured form, validate
+that they are balanced, cache the token ids of every span and split text into
+sentences only at boundaries that lie outside the spans.
+
+```
+>>> doc = parse_phon("<PHON_START>チ'ミ/モーリョー<PHON_END>が跋扈する。")
+>>> [s.phon for s in doc.segments]
+[True, False]
+```
+"""
+
+from __future__ import annotations
+
+import itertools
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+PHON_START = "<PHON_START>"
+PHON_END = "<PHON_END>"
+PHON_TOKENS = [PHON_START, PHON_END]
+
+# Same sentence-final marks CosyVoice's split_paragraph cuts at
+SENTENCE_PUNCTUATION = ["。", "？", "！", "；", "：", "、", ".", "?", "!", ";"]
+CLOSING_QUOTES = ['"', "”"]
+
+# Separates candidate readings of one word inside a span: "hang4|hong4 sik6"
+ALTERNATIVE_SEP = "|"
+
+_tag_re = re.compile(f"({re.escape(PHON_START)}|{re.escape(PHON_END)})")
+
+
+@dataclass
+class Segment:
+    """Plain text, or the reading inside one PHON span (without the tags)."""
+
+    text: str
+    phon: bool = False
+    token_ids: Optional[List[int]] = field(default=None, repr=False)
+
+    def render(self) -> str:
+        if self.phon:
+            return f"{PHON_START}{self.text}{PHON_END}"
+        return self.text
+
+    def encode(self, tokenizer_encode: Callable[[str], List[int]]) -> List[int]:
+        # Tags are special tokens, so a span always tokenizes on its own
+        if self.token_ids is None:
+            self.token_ids = tokenizer_encode(self.render())
+        return self.token_ids
+
+
+@dataclass
+class PhonText:
+    segments: List[Segment]
+
+    @property
+    def text(self) -> str:
+        return "".join(s.render() for s in self.segments)
+
+    @property
+    def spans(self) -> List[Segment]:
+        return [s for s in self.segments if s.phon]
+
+    def encode(self, tokenizer_encode: Callable[[str], List[int]]) -> List[int]:
+        return [i for s in self.segments for i in s.encode(tokenizer_encode)]
+
+    def sentences(
+        self, punctuation: List[str] = SENTENCE_PUNCTUATION
+    ) -> List["PhonText"]:
+        """Split after ``punctuation`` in plain segments only.
+
+        Span segments are shared with the result, so their cached token ids
+        are reused by every sentence that contains them.
+        """
+        sentences: List[PhonText] = []
+        current: List[Segment] = []
+        for seg in self.segments:
+            if seg.phon:
+                current.append(seg)
+                continue
+
+            st = 0
+            text = seg.text
+            for i, c in enumerate(text):
+                if c not in punctuation:
+                    continue
+                end = i + 1
+                if end < len(text) and text[end] in CLOSING_QUOTES:
+                    end += 1
+                current.append(Segment(text[st:end]))
+                sentences.append(PhonText(current))
+                current = []
+                st = end
+            if st < len(text):
+                current.append(Segment(text[st:]))
+
+        if current:
+            sentences.append(PhonText(current))
+        return sentences
+
+
+def parse_phon(text: str) -> PhonText:
+    """Parse ``text`` into plain and PHON segments.
+
+    Raises ``ValueError`` on nested, unclosed, unopened or empty spans.
+    """
+    segments: List[Segment] = []
+    open_at = None
+    n_before_open = 0
+    pos = 0
+    for piece in _tag_re.split(text):
+        if piece == PHON_START:
+            if open_at is not None:
+                raise ValueError(f"Nested {PHON_START} at {pos} in: {text}")
+            open_at = pos
+            n_before_open = len(segments)
+        elif piece == PHON_END:
+            if open_at is None:
+                raise ValueError(f"{PHON_END} without {PHON_START} at {pos} in: {text}")
+            if len(segments) == n_before_open:
+                raise ValueError(f"Empty PHON span at {open_at} in: {text}")
+            open_at = None
+        elif piece:
+            segments.append(Segment(piece, phon=open_at is not None))
+        pos += len(piece)
+
+    if open_at is not None:
+        raise ValueError(f"Unclosed {PHON_START} at {open_at} in: {text}")
+
+    return PhonText(segments)
+
+
+def alternative_pieces(text: str) -> List[List[str]]:
+    """``text`` cut into pieces, each the list of its alternatives.
+
+    Span readings are split on whitespace and each word on ``|``: a word with
+    alternatives is one piece with several entries; plain text, tags, the
+    separating spaces and the other words are pieces with one. Joining any one
+    entry of every piece gives a variant; the first entries give the text with
+    the first readings. Raises ValueError on an empty alternative.
+    """
+    pieces: List[List[str]] = []
+    for seg in parse_phon(text).segments:
+        if not seg.phon or ALTERNATIVE_SEP not in seg.text:
+            pieces.append([seg.render()])
+            continue
+        words = [w.split(ALTERNATIVE_SEP) for w in seg.text.split()]
+        if any(not a for w in words for a in w if len(w) > 1):
+            raise ValueError(f"Empty alternative in span {seg.text!r} of: {text}")
+        pieces.append([PHON_START])
+        for i, word in enumerate(words):
+            if i:
+                pieces.append([" "])
+            pieces.append(word)
+        pieces.append([PHON_END])
+    return pieces
+
+
+def expand_alternatives(text: str, max_variants: int = 64) -> List[str]:
+    """Every reading variant of ``text`` with ``|`` alternatives in its spans.
+
+    The variants are the product over all words (``alternative_pieces``), in
+    order, so the first alternatives come first.
+    ``"<PHON_START>hang4|hong4 sik6<PHON_END>"`` gives two variants. Raises
+    ValueError on an empty alternative or when there would be more than
+    ``max_variants`` variants; they are never silently truncated.
+    """
+    pieces = alternative_pieces(text)
+    n_variants = 1
+    for piece in pieces:
+        n_variants *= len(piece)
+    if n_variants > max_variants:
+        raise ValueError(
+            f"{n_variants} reading variants exceed max_variants={max_variants}: {text}"
+        )
+    return ["".join(combo) for combo in itertools.product(*pieces)]
+
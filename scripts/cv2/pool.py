@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+CPU replica worker pool
+=======================
+One process with default torch threading scales poorly on many-core CPU hosts.
+This launcher runs ``--workers`` model replicas as separate processes instead:
+
+- each worker is pinned (``sched_setaffinity``) to its own block of
+  ``--threads`` CPUs, on separate physical cores while they last (SMT siblings
+  are read from sysfs), and sets ``torch.set_num_threads`` (and the onnxruntime
+  intra-op threads with ``--onnx_llm``) to the block size
+- sentences are handed out from one shared queue, so fast workers take more
+- outputs are written as ``<out_dir>/<NNN>.<ext>`` exactly like ``infer.py``
+
+``--autotune`` sweeps workers x threads on the first ``--autotune_sentences``
+sentences and reports sentences/sec for every combination that fits the CPUs.
+
+Replicas are always spawned, never forked from a process that has loaded a
+model or started OpenMP/onnxruntime thread pools. With ``--share_weights`` a
+helper process saves the LLM (adapter merged), flow and HiFT state dicts to one
+file. Every replica builds those modules without reading a checkpoint or
+initializing a weight and assigns the tensors of a memory map of the file
+(``torch.load(mmap=True)`` + ``load_state_dict(assign=True)``), so the replicas
+share those page-cache pages and never hold a private copy, not even while
+loading. The frontend's ``campplus.onnx`` and ``speech_tokenizer_v2.onnx`` are
+not shared: onnxruntime keeps their initializers inside each session, so every
+replica pays roughly their file size (logged at start) in private memory.
+Every replica reports its RSS, PSS and unique set size (USS, the private pages
+it alone would free), so the memory cost of one more replica is its USS.
+
+Usage:
+    python -m scripts.cv2.pool \
+        --base_model pretrained_models/CosyVoice2-0.5B \
+        --lora_dir lora_weights/UtterTune-CosyVoice2-ja-JSUTJVS \
+        --texts sentences.txt \
+        --prompt_wav prompts/wav/common_voice_ja_41758953.wav \
+        --prompt_text prompts/trans/common_voice_ja_41758953.txt \
+        --workers 8 --threads 8
+    python -m scripts.cv2.pool ... --autotune
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import tempfile
+import time
+from contextlib import contextmanager
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import torch
+
+from scripts.cv2.prefix_cache import adapter_fingerprint
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+PROMPT_SAMPLE_RATE = 16000
+CPU_SYSFS = Path("/sys/devices/system/cpu")
+SHARED_WEIGHTS_FILE = "replica_weights.pt"
+# Loaded by CosyVoiceFrontEnd into onnxruntime sessions
+FRONTEND_MODELS = ("campplus.onnx", "speech_tokenizer_v2.onnx")
+
+
+def available_cpus() -> List[int]:
+    return sorted(os.sched_getaffinity(0))
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """``"0-3,8,10-11"`` (sysfs CPU list format) -> ``[0, 1, 2, 3, 8, 10, 11]``."""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def physical_core_order(cpus: List[int], sysfs: Path = CPU_SYSFS) -> List[int]:
+    """``cpus`` with one hardware thread of every physical core first, then the
+    SMT siblings. The numbering alone does not tell: siblings are ``N`` and
+    ``N + cores`` on many x86 hosts but adjacent on others."""
+    first, rest, seen = [], [], set()
+    for cpu in sorted(cpus):
+        path = sysfs / f"cpu{cpu}" / "topology" / "thread_siblings_list"
+        try:
+            core = tuple(parse_cpu_list(path.read_text()))
+        except (OSError, ValueError):
+            core = (cpu,)
+        (rest if core in seen else first).append(cpu)
+        seen.add(core)
+    return first + rest
+
+
+def core_sets(
+    n_workers: int,
+    threads: int,
+    cpus: Optional[List[int]] = None,
+    sysfs: Path = CPU_SYSFS,
+) -> List[List[int]]:
+    """Disjoint blocks of ``threads`` CPUs, one per worker, taken in
+    ``physical_core_order``: no two workers share a physical core while
+    ``n_workers * threads`` fits the cores."""
+    cpus = physical_core_order(available_cpus() if cpus is None else cpus, sysfs)
+    if n_workers < 1 or threads < 1:
+        raise ValueError("workers and threads must be at least 1")
+    if n_workers * threads > len(cpus):
+        raise ValueError(
+            f"{n_workers} workers x {threads} threads needs {n_workers * threads} "
+            f"CPUs, only {len(cpus)} available"
+        )
+    return [cpus[i * threads : (i + 1) * threads] for i in range(n_workers)]
+
+
+def smaps_rollup(pid="self") -> Dict[str, int]:
+    """RSS, PSS, USS and shared bytes of a process (Linux 4.14+)."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+SHARED_MODULES = ("llm", "flow", "hift")
+
+
+def _modules(cv2) -> Dict[str, torch.nn.Module]:
+    return {name: getattr(cv2.model, name) for name in SHARED_MODULES}
+
+
+def _save_shared_weights(args, path: Path, results):
+    """Helper process: load the model once and save the weights replicas map.
+
+    The LLM is saved with its adapter merged, so replicas rebuild the plain
+    Qwen2 LLM (with the PHON rows) and need no PEFT wrapper."""
+    try:
+        from scripts.cv2.quantize import merge_lora
+
+        cv2, adapter_id = load_replica(args, len(available_cpus()))
+        llm = merge_lora(cv2)
+        state = {name: m.state_dict() for name, m in _modules(cv2).items()}
+        state["base_model"] = replica_base_model(args)
+        state["vocab_size"] = llm.llm.model.get_input_embeddings().num_embeddings
+        state["adapter"] = adapter_id
+        torch.save(state, path)
+    except Exception as e:
+        results.put(repr(e))
+        return
+    results.put(None)
+
+
+def save_shared_weights(args, path: Path):
+    """Write the replica weights file from a spawned process, so this launcher
+    never loads a model or starts its thread pools."""
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    p = ctx.Process(target=_save_shared_weights, args=(args, path, results))
+    p.start()
+    error = results.get()
+    p.join()
+    if error is not None:
+        raise RuntimeError(f"saving the shared weights failed: {error}")
+
+
+@contextmanager
+def _uninitialized_weights():
+    """Within the block modules are built without initializing their weights
+    (``no_init_weights``), so their pages are allocated but never touched, and
+    ``Qwen2ForCausalLM.from_pretrained`` builds the model from its config
+    instead of reading the checkpoint."""
+    from transformers import AutoConfig, Qwen2ForCausalLM
+    from transformers.modeling_utils import no_init_weights
+
+    own = Qwen2ForCausalLM.__dict__.get("from_pretrained")
+
+    def from_pretrained(cls, path, *args, **kwargs):
+        return cls._from_config(AutoConfig.from_pretrained(path))
+
+    Qwen2ForCausalLM.from_pretrained = classmethod(from_pretrained)
+    try:
+        with no_init_weights():
+            yield
+    finally:
+        if own is None:
+            del Qwen2ForCausalLM.from_pretrained
+        else:
+            Qwen2ForCausalLM.from_pretrained = own
+
+
+def load_shared_replica(path: Path):
+    """CPU model whose LLM, flow and HiFT weights are a read-only memory map of
+    ``path``; returns ``(cv2, adapter_id)``.
+
+    The modules are built by the upstream constructor without reading
+    ``llm.pt``/``flow.pt``/``hift.pt`` or the Qwen2 checkpoint and without
+    initializing any weight, then the mapped tensors become their parameters
+    (``load_state_dict(assign=True)``), so the replica never holds a private
+    copy of them. The pages stay shared with every process mapping the file.
+    """
+    from scripts.cv2.infer import load_base_model, load_phon_tokenizer
+    from scripts.cv2.snapshot import resize_uninitialized
+
+    state = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+    with _uninitialized_weights():
+        cv2 = load_base_model(state["base_model"], skip_weights=SHARED_MODULES)
+        qwen = cv2.model.llm.llm.model
+        if qwen.get_input_embeddings().num_embeddings != state["vocab_size"]:
+            # Same vocabulary as the helper: the PHON tokens on top of Qwen's
+            tok, _ = load_phon_tokenizer(state["base_model"])
+            if len(tok.tokenizer) != state["vocab_size"]:
+                raise ValueError(
+                    f"{path} has {state['vocab_size']} tokens, the tokenizer "
+                    f"has {len(tok.tokenizer)}"
+                )
+            resize_uninitialized(qwen, state["vocab_size"])
+    for name, module in _modules(cv2).items():
+        module.load_state_dict(state[name], assign=True)
+        module.eval()
+    return cv2, state["adapter"]
+
+
+def replica_base_model(args) -> str:
+    if args.snapshot is not None:
+        from scripts.cv2.snapshot import read_meta
+
+        return read_meta(args.snapshot)["base_model"]
+    return args.base_model
+
+
+def frontend_model_bytes(base_model: str) -> int:
+    """Size of the frontend's onnxruntime models, which every replica loads into
+    a session of its own."""
+    return sum(
+        os.path.getsize(os.path.join(base_model, name))
+        for name in FRONTEND_MODELS
+        if os.path.isfile(os.path.join(base_model, name))
+    )
+
+
+def load_replica(args, threads: int):
+    """CPU model as ``infer.py`` builds it; returns ``(cv2, adapter_id)``."""
+    from scripts.cv2.infer import load_model
+
+    device = torch.device("cpu")
+    if args.onnx_llm is not None:
+        from scripts.cv2.onnx_llm import load_model as load_onnx_model
+
+        cv2 = load_onnx_model(args.base_model, args.onnx_llm, device, threads)
+        return cv2, cv2.model.llm.adapter_id
+
+    if args.snapshot is not None:
+        from scripts.cv2.snapshot import load_snapshot, read_meta
+
+        cv2 = load_snapshot(args.snapshot, device)
+        adapter_id = read_meta(args.snapshot)["adapter"]
+    else:
+        cv2 = load_model(args.base_model, args.lora_dir, device)
+        adapter_id = adapter_fingerprint(args.lora_dir)
+
+    if args.int8:
+        from scripts.cv2.quantize import quantize_llm
+
+        quantize_llm(cv2)
+    return cv2, adapter_id
+
+
+def _worker(rank: int, cpus: List[int], args, warmup: str, tasks, results):
+    """Replica process; maps ``args.weights_file`` when it is set."""
+    try:
+        os.sched_setaffinity(0, cpus)
+        torch.set_num_threads(len(cpus))
+        torch.set_num_interop_threads(1)
+
+        from scripts.cv2.engine import Engine
+        from scripts.cv2.infer import load_wav, read_prompt_text, trim_wav
+        from scripts.cv2.writer import AudioWriter
+
+        if args.weights_file is not None:
+            cv2, adapter_id = load_shared_replica(args.weights_file)
+        else:
+            cv2, adapter_id = load_replica(args, len(cpus))
+        engine = None
+        if args.engine == "uttertune":
+            engine = Engine(cv2, adapter_id=adapter_id)
+
+        prompt_speech_16k = trim_wav(
+            load_wav(args.prompt_wav, PROMPT_SAMPLE_RATE), PROMPT_SAMPLE_RATE
+        )
+        prompt_text = read_prompt_text(args.prompt_text)
+
+        def synthesize(text: str) -> torch.Tensor:
+            if engine is not None:
+                return engine.synthesize(text, prompt_text, prompt_speech_16k)
+            wav_iter = cv2.inference_zero_shot(
+                tts_text=text,
+                prompt_text=prompt_text,
+                prompt_speech_16k=prompt_speech_16k,
+            )
+            return next(wav_iter)["tts_speech"]
+
+        synthesize(warmup)
+        writer = None
+        if args.out_dir is not None:
+            writer = AudioWriter(args.out_dir, fmt=args.out_format, num_workers=1)
+    except Exception as e:
+        results.put(("failed", rank, repr(e)))
+        return
+
+    results.put(("ready", rank, smaps_rollup()))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        idx, sentence = task
+        # Seeded per sentence so the output does not depend on the worker
+        torch.manual_seed(args.seed + idx)
+        t0 = time.perf_counter()
+        try:
+            wav = synthesize(sentence)
+        except Exception as e:
+            results.put(("error", rank, (idx, repr(e))))
+            continue
+        dt = time.perf_counter() - t0
+        if writer is not None:
+            writer.write(f"{idx + 1:03d}", wav, cv2.sample_rate, {"text": sentence})
+        results.put(("done", rank, (idx, wav.shape[-1] / cv2.sample_rate, dt)))
+
+    if writer is not None:
+        writer.close()
+    results.put(("exit", rank, smaps_rollup()))
+
+
+def _next_result(results, procs, exited):
+    """Next worker message; raises if a worker died without saying so."""
+    while True:
+        try:
+            return results.get(timeout=1.0)
+        except queue.Empty:
+            for rank, p in enumerate(procs):
+                if rank not in exited and not p.is_alive():
+                    raise RuntimeError(
+                        f"replica {rank} exited unexpectedly (code {p.exitcode})"
+                    )
+
+
+def run_pool(args, sentences: List[str], n_workers: int, threads: int) -> Dict:
+    """Synthesize ``sentences`` on ``n_workers`` pinned, spawned replicas.
+
+    Throughput is measured from the moment every replica is loaded and warmed
+    up until the last sentence is done.
+    """
+    ctx = mp.get_context("spawn")
+    tasks, results = ctx.Queue(), ctx.Queue()
+    procs = [
+        ctx.Process(
+            target=_worker,
+            args=(rank, cpus, args, sentences[0], tasks, results),
+            name=f"replica-{rank}",
+        )
+        for rank, cpus in enumerate(core_sets(n_workers, threads))
+    ]
+    for p in procs:
+        p.start()
+
+    try:
+        exited = set()
+        memory: Dict[str, List[Dict[str, int]]] = {
+            "ready": [{}] * n_workers,
+            "exit": [{}] * n_workers,
+        }
+        for _ in procs:
+            kind, rank, payload = _next_result(results, procs, exited)
+            if kind == "failed":
+                raise RuntimeError(f"replica {rank} failed to start: {payload}")
+            memory["ready"][rank] = payload
+
+        t0 = time.perf_counter()
+        for task in enumerate(sentences):
+            tasks.put(task)
+        for _ in procs:
+            tasks.put(None)
+
+        done, errors, audio_s, per_worker = 0, 0, 0.0, [0] * n_workers
+        while len(exited) < n_workers:
+            kind, rank, payload = _next_result(results, procs, exited)
+            if kind == "done":
+                idx, dur, dt = payload
+                done += 1
+                audio_s += dur
+                per_worker[rank] += 1
+                logger.info(
+                    f"[ {idx + 1:03d} ] replica {rank}: {dur:.2f}s in {dt:.2f}s"
+                )
+            elif kind == "error":
+                errors += 1
+                logger.warning(
+                    "[ %03d ] replica %d: %s", payload[0] + 1, rank, payload[1]
+                )
+            elif kind == "exit":
+                exited.add(rank)
+                memory["exit"][rank] = payload
+        wall = time.perf_counter() - t0
+    except BaseException:
+        for p in procs:
+            p.terminate()
+        raise
+    finally:
+        for p in procs:
+            p.join()
+
+    return {
+        "workers": n_workers,
+        "threads": threads,
+        "sentences": done,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "sentences_per_s": round(done / wall, 3),
+        "rtf": round(wall / max(audio_s, 1e-9), 3),
+        "per_worker": per_worker,
+        "shared_weights": args.weights_file is not None,
+        "memory": memory,
+    }
+
+
+def log_memory(report: Dict):
+    mib = 1 << 20
+    mems = report["memory"]["exit"]
+    for rank, mem in enumerate(mems):
+        logger.info(
+            f"replica {rank}: RSS {mem['rss'] / mib:.0f} MiB  "
+            f"PSS {mem['pss'] / mib:.0f} MiB  USS {mem['uss'] / mib:.0f} MiB  "
+            f"shared {mem['shared'] / mib:.0f} MiB"
+        )
+    total_pss = sum(m["pss"] for m in mems)
+    mean_uss = sum(m["uss"] for m in mems) / len(mems)
+    logger.info(
+        f"replicas total PSS {total_pss / mib:.0f} MiB; "
+        f"each extra replica costs ~{mean_uss / mib:.0f} MiB (mean USS)"
+    )
+
+
+def autotune(
+    args,
+    sentences: List[str],
+    workers_grid: List[int],
+    threads_grid: List[int],
+) -> List[Dict]:
+    n_cpus = len(available_cpus())
+    reports = []
+    for threads in threads_grid:
+        for n_workers in workers_grid:
+            if n_workers * threads > n_cpus:
+                continue
+            report = run_pool(args, sentences, n_workers, threads)
+            reports.append(report)
+            logger.info(
+                f"workers={n_workers:<3d} threads={threads:<3d} "
+                f"{report['sentences_per_s']:.3f} sentences/s  RTF {report['rtf']:.3f}"
+            )
+    if not reports:
+        raise ValueError(f"No workers x threads combination fits {n_cpus} CPUs")
+
+    reports.sort(key=lambda r: r["sentences_per_s"], reverse=True)
+    best = reports[0]
+    logger.info(
+        f"best: --workers {best['workers']} --threads {best['threads']} "
+        f"({best['sentences_per_s']:.3f} sentences/s)"
+    )
+    return reports
+
+
+def parse_grid(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def powers_of_two(limit: int) -> List[int]:
+    values, v = [], 1
+    while v <= limit:
+        values.append(v)
+        v *= 2
+    return values
+
+
+def main():
+    from scripts.cv2.infer import read_sentences
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base_model", type=str, required=True)
+    ap.add_argument("--lora_dir", type=Path, default=None)
+    ap.add_argument(
+        "--snapshot", type=Path, default=None, help="scripts.cv2.snapshot directory"
+    )
+    ap.add_argument(
+        "--onnx_llm",
+        type=Path,
+        default=None,
+        help="scripts.cv2.export_onnx directory (LoRA already merged)",
+    )
+    ap.add_argument("--int8", action="store_true", help="INT8 dynamic-quantized LLM")
+    ap.add_argument("--engine", choices=["cosyvoice", "uttertune"], default="cosyvoice")
+    ap.add_argument("--texts", required=True, help="Sentences separated by | or a file")
+    ap.add_argument("--prompt_wav", type=Path, required=True)
+    ap.add_argument("--prompt_text", required=True)
+    ap.add_argument("--out_dir", type=Path, default=Path("wavs_out"))
+    ap.add_argument("--out_format", choices=["wav", "flac", "opus"], default="wav")
+    ap.add_argument(
+        "--workers", type=int, default=0, help="Replicas (0 = CPUs // --threads)"
+    )
+    ap.add_argument("--threads", type=int, default=4, help="CPUs per replica")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--autotune", action="store_true")
+    ap.add_argument("--autotune_sentences", type=int, default=32)
+    ap.add_argument(
+        "--autotune_workers", type=parse_grid, default=None, help="e.g. 1,2,4,8"
+    )
+    ap.add_argument(
+        "--autotune_threads", type=parse_grid, default=None, help="e.g. 1,2,4,8"
+    )
+    ap.add_argument(
+        "--share_weights",
+        action="store_true",
+        help="Replicas memory-map one copy of the weights (not with --onnx_llm/--int8)",
+    )
+    ap.add_argument("--report", type=Path, default=None, help="Write results as JSON")
+    args = ap.parse_args()
+
+    if args.onnx_llm is not None and (args.int8 or args.engine != "cosyvoice"):
+        raise ValueError("--onnx_llm only works with --engine cosyvoice and fp32")
+    if args.onnx_llm is not None and args.lora_dir is not None:
+        raise ValueError("--onnx_llm already has its adapter merged; drop --lora_dir")
+    if args.share_weights and (args.onnx_llm is not None or args.int8):
+        # Neither the onnxruntime LLM nor packed INT8 weights are plain tensors
+        raise ValueError("--share_weights only works with the fp32 torch LLM")
+
+    sentences = read_sentences(args.texts)
+    n_cpus = len(available_cpus())
+
+    with tempfile.TemporaryDirectory(prefix="uttertune-pool-") as tmp:
+        args.weights_file = None
+        if args.share_weights:
+            args.weights_file = Path(tmp) / SHARED_WEIGHTS_FILE
+            t0 = time.perf_counter()
+            save_shared_weights(args, args.weights_file)
+            mib = args.weights_file.stat().st_size / (1 << 20)
+            logger.info(
+                f"Shared weights: {mib:.0f} MiB in {time.perf_counter() - t0:.1f}s"
+            )
+            frontend_mib = frontend_model_bytes(replica_base_model(args)) / (1 << 20)
+            logger.info(
+                f"Not shared: the frontend onnxruntime sessions, "
+                f"~{frontend_mib:.0f} MiB of model data per replica"
+            )
+
+        if args.autotune:
+            args.out_dir = None  # Throughput only
+            reports = autotune(
+                args,
+                sentences[: args.autotune_sentences],
+                args.autotune_workers or powers_of_two(n_cpus),
+                args.autotune_threads or powers_of_two(min(n_cpus, 16)),
+            )
+        else:
+            n_workers = args.workers or max(n_cpus // args.threads, 1)
+            reports = [run_pool(args, sentences, n_workers, args.threads)]
+            logger.info("%s", {k: v for k, v in reports[0].items() if k != "memory"})
+    log_memory(reports[0])
+
+    if args.report is not None:
+        args.report.write_text(json.dumps(reports, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Prompt prefix KV cache
+======================
+Every sentence synthesized with the same speaker prompt starts its LLM input
+with the same ``sos_eos`` + ``prompt_text`` embeddings. The attention keys and
+values of that prefix only depend on the adapter and the prompt text, so they
+are computed once and reused by every later request.
+
+Entries are keyed by ``(adapter fingerprint, prompt hash)`` and evicted least
+recently used first once their total size exceeds ``max_bytes``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import torch
+
+# Legacy cache layout: one (key, value) pair per layer, each (B, H, L, D)
+KVCache = Tuple[Tuple[torch.Tensor, torch.Tensor], ...]
+PrefixKey = Tuple[str, str]
+
+ADAPTER_FILES = [
+    "adapter_config.json",
+    "adapter_model.safetensors",
+    "adapter_model.bin",
+    "embed_patch.safetensors",
+]
+
+
+def adapter_fingerprint(lora_dir: Optional[Path]) -> str:
+    """Content hash of the adapter files (``"base"`` without an adapter)."""
+    if lora_dir is None:
+        return "base"
+
+    h = hashlib.sha256()
+    for name in ADAPTER_FILES:
+        path = Path(lora_dir) / name
+        if not path.is_file():
+            continue
+        h.update(name.encode("utf-8"))
+        with path.open("rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()[:16]
+
+
+def prompt_hash(prompt_text_ids: torch.Tensor) -> str:
+    ids = prompt_text_ids.detach().to("cpu", torch.int64).contiguous()
+    return hashlib.sha256(ids.numpy().tobytes()).hexdigest()[:16]
+
+
+def cache_nbytes(past: KVCache) -> int:
+    return sum(t.numel() * t.element_size() for layer in past for t in layer)
+
+
+class PrefixCache:
+    def __init__(self, max_bytes: int = 512 << 20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[PrefixKey, Tuple[KVCache, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: PrefixKey) -> Optional[KVCache]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: PrefixKey, past: KVCache):
+        nbytes = cache_nbytes(past)
+        if nbytes > self.max_bytes:
+            return  # Would evict everything and still not fit
+
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        self._entries[key] = (past, nbytes)
+        self.nbytes += nbytes
+
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "mbytes": self.nbytes / (1 << 20),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+INT8 dynamic quantization of the LoRA-adapted LLM
+=================================================
+Merge the LoRA adapter into the Qwen2 weights and quantize the decoder's
+``nn.Linear`` layers to INT8 for CPU inference. The token embeddings (including
+the PHON rows) and the speech heads stay in fp32.
+
+Running this module compares INT8 against fp32 on a fixed set of sentences,
+decoding greedily so both runs are deterministic:
+
+- free-running agreement of the generated speech tokens (exact, common prefix)
+- teacher-forced top-1 agreement: INT8 is fed the fp32 tokens and its argmax is
+  checked at every step, so one early flip does not derail the comparison
+- LLM RTF, decoder weight size and process RSS
+
+fp32 and INT8 each run in a fresh spawned process, so the RSS of one is not
+inflated by pages the other left behind.
+
+Usage:
+    python -m scripts.cv2.quantize \
+        --base_model pretrained_models/CosyVoice2-0.5B \
+        --lora_dir lora_weights/UtterTune-CosyVoice2-ja-JSUTJVS \
+        --texts sentences.txt \
+        --prompt_wav prompts/wav/common_voice_ja_41758953.wav \
+        --prompt_text prompts/trans/common_voice_ja_41758953.txt
+"""
+
+from __future__ import annotations
+
+import argparse
+import ctypes
+import gc
+import multiprocessing as mp
+import time
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+from peft import PeftModel
+
+from scripts.cv2.engine import Engine, qwen_model
+from scripts.cv2.guards import TOKEN_RATE
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+M_MMAP_THRESHOLD = -3  # mallopt parameter from glibc's malloc.h
+
+
+def merge_lora(cv2):
+    """Fold the LoRA weights into the base linears and drop the PEFT wrapper."""
+    if isinstance(cv2.model.llm, PeftModel):
+        cv2.model.llm = cv2.model.llm.merge_and_unload()
+    return cv2.model.llm
+
+
+def quantize_llm(cv2):
+    """Merge LoRA, then quantize the Qwen2 decoder linears to INT8 in place.
+
+    Only the decoder stack is quantized: ``embed_tokens`` is an ``nn.Embedding``
+    and is left as is, and the speech head ``llm_decoder`` lives outside it.
+    """
+    llm = merge_lora(cv2)
+    torch.ao.quantization.quantize_dynamic(
+        qwen_model(llm), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+    return llm
+
+
+def state_dict_nbytes(module: torch.nn.Module) -> int:
+    """Size of all weights, including packed INT8 params (not ``parameters()``)."""
+    total = 0
+    for value in module.state_dict().values():
+        tensors = value if isinstance(value, tuple) else (value,)
+        total += sum(
+            t.numel() * t.element_size() for t in tensors if isinstance(t, torch.Tensor)
+        )
+    return total
+
+
+def vm_bytes(field: str = "VmRSS") -> int:
+    """``VmRSS`` (resident) or ``VmHWM`` (peak resident) of this process."""
+    with open("/proc/self/status", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def mmap_large_allocations(threshold: int = 1 << 20):
+    """Give every allocation of at least ``threshold`` bytes its own mapping
+    (glibc only), so weights freed later, e.g. the fp32 linears replaced by
+    quantization, go back to the OS instead of staying in a fragmented heap."""
+    try:
+        ctypes.CDLL("libc.so.6").mallopt(M_MMAP_THRESHOLD, threshold)
+    except (OSError, AttributeError):
+        pass
+
+
+def generate_all(engine: Engine, model_inputs: List[Dict]):
+    """Speech tokens for every input, whether each stopped on EOS, and the LLM
+    time."""
+    tokens, eos, t_total = [], [], 0.0
+    for model_input in model_inputs:
+        t0 = time.perf_counter()
+        state = engine.prefill(model_input)
+        while not state.done:
+            engine.decode_step([state])
+        t_total += time.perf_counter() - t0
+        tokens.append(state.tokens)
+        eos.append(state.stop_reason == "eos")
+    return tokens, eos, t_total
+
+
+@torch.inference_mode()
+def teacher_forced_top1(
+    engine: Engine, model_input: Dict, tokens: List[int], eos: bool = True
+) -> float:
+    """Share of the steps of ``tokens`` (plus the final EOS if the reference
+    stopped on it) at which the model's argmax over speech tokens + EOS, EOS
+    masked as in decode, is the reference, feeding the reference tokens in one
+    forward pass."""
+    llm = engine.llm
+    lm_input, min_len, _ = engine.build_lm_input(model_input)
+    speech = torch.tensor(tokens, dtype=torch.long, device=engine.device)
+    x = torch.cat([lm_input, llm.speech_embedding(speech).unsqueeze(0)], dim=1)
+    hidden = qwen_model(llm)(inputs_embeds=x).last_hidden_state
+    # The last prompt position predicts tokens[0] and the position of
+    # tokens[i] predicts tokens[i + 1]; the last token's position predicts EOS
+    logits = llm.llm_decoder(hidden[0, lm_input.shape[1] - 1 :])
+    target = speech
+    if eos:
+        target = torch.cat([speech, speech.new_tensor([llm.speech_token_size])])
+    else:
+        logits = logits[:-1]
+    if not len(target):
+        return 1.0
+    scores = logits[:, : llm.speech_token_size + 1].clone()
+    scores[:min_len, llm.speech_token_size] = -float("inf")
+    return (scores.argmax(dim=-1) == target).float().mean().item()
+
+
+def compare_tokens(ref: List[int], hyp: List[int]) -> Dict[str, float]:
+    prefix = 0
+    for a, b in zip(ref, hyp):
+        if a != b:
+            break
+        prefix += 1
+    n = min(len(ref), len(hyp))
+    matches = sum(a == b for a, b in zip(ref[:n], hyp[:n]))
+    return {
+        "exact": float(ref == hyp),
+        "prefix": prefix / max(len(ref), 1),
+        "agreement": matches / max(len(ref), len(hyp), 1),
+        "len_ratio": len(hyp) / max(len(ref), 1),
+    }
+
+
+def _measure(
+    args: argparse.Namespace,
+    int8: bool,
+    ref: Optional[Tuple[List[List[int]], List[bool]]],
+    results,
+):
+    """Load, optionally quantize and decode in this (fresh) process; with
+    ``ref`` also score teacher-forced top-1 against it."""
+    from scripts.cv2.infer import (
+        load_model,
+        load_wav,
+        read_prompt_text,
+        read_sentences,
+        trim_wav,
+    )
+
+    mmap_large_allocations()
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    cv2 = load_model(args.base_model, args.lora_dir, torch.device("cpu"))
+    llm = quantize_llm(cv2) if int8 else merge_lora(cv2)
+    gc.collect()
+    engine = Engine(cv2, greedy=True)
+
+    prompt_speech_16k = trim_wav(load_wav(args.prompt_wav, 16000), 16000)
+    prompt_text = read_prompt_text(args.prompt_text)
+    model_inputs = [
+        model_input
+        for sentence in read_sentences(args.texts)
+        for model_input in engine.frontend(sentence, prompt_text, prompt_speech_16k)
+    ]
+
+    tokens, eos, t_llm = generate_all(engine, model_inputs)
+    result = {
+        "tokens": tokens,
+        "eos": eos,
+        "time": t_llm,
+        "size": state_dict_nbytes(qwen_model(llm)),
+        "rss": vm_bytes("VmRSS"),
+        "peak": vm_bytes("VmHWM"),
+    }
+    if ref is not None:
+        result["top1"] = [
+            teacher_forced_top1(engine, model_input, r, r_eos)
+            for model_input, r, r_eos in zip(model_inputs, *ref)
+        ]
+    results.put(result)
+
+
+def measure(args: argparse.Namespace, int8: bool, ref=None) -> Dict:
+    """Run ``_measure`` in a fresh spawned process and return its result."""
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(args, int8, ref, results))
+    proc.start()
+    result = results.get()
+    proc.join()
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base_model", type=str, required=True)
+    ap.add_argument("--lora_dir", type=Path, default=None)
+    ap.add_argument("--texts", required=True, help="Sentences separated by | or a file")
+    ap.add_argument("--prompt_wav", type=Path, required=True)
+    ap.add_argument("--prompt_text", required=True)
+    ap.add_argument("--threads", type=int, default=0, help="torch threads (0 = default)")
+    args = ap.parse_args()
+
+    fp32 = measure(args, int8=False)
+    int8 = measure(args, int8=True, ref=(fp32["tokens"], fp32["eos"]))
+    ref, hyp = fp32["tokens"], int8["tokens"]
+
+    scores = []
+    for idx, (r, h, top1) in enumerate(zip(ref, hyp, int8["top1"])):
+        s = compare_tokens(r, h)
+        s["top1"] = top1
+        scores.append(s)
+        logger.info(
+            f"[ {idx + 1:03d} ] exact={s['exact']:.0f} prefix={s['prefix']:.2f} "
+            f"agreement={s['agreement']:.2f} len_ratio={s['len_ratio']:.2f} "
+            f"top1={s['top1']:.3f}"
+        )
+
+    audio_fp32 = sum(len(t) for t in ref) / TOKEN_RATE
+    audio_int8 = sum(len(t) for t in hyp) / TOKEN_RATE
+    logger.info(
+        "exact %.2f  prefix %.3f  agreement %.3f  teacher-forced top-1 %.4f  "
+        "(mean over %d chunks)",
+        np.mean([s["exact"] for s in scores]),
+        np.mean([s["prefix"] for s in scores]),
+        np.mean([s["agreement"] for s in scores]),
+        np.mean([s["top1"] for s in scores]),
+        len(scores),
+    )
+    logger.info(
+        f"LLM RTF  fp32 {fp32['time'] / max(audio_fp32, 1e-9):.3f}  "
+        f"int8 {int8['time'] / max(audio_int8, 1e-9):.3f}"
+    )
+    logger.info(
+        f"decoder weights  fp32 {fp32['size'] / 2**20:.0f} MiB  "
+        f"int8 {int8['size'] / 2**20:.0f} MiB  ({int8['size'] / fp32['size']:.2f}x)"
+    )
+    # Peak includes the fp32 weights the INT8 process loads before quantizing
+    logger.info(
+        f"process RSS  fp32 {fp32['rss'] / 2**20:.0f} MiB  "
+        f"int8 {int8['rss'] / 2**20:.0f} MiB  "
+        f"(peak fp32 {fp32['peak'] / 2**20:.0f} MiB, "
+        f"int8 {int8['peak'] / 2**20:.0f} MiB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
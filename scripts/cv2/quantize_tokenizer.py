@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+INT8 speech tokenizer
+=====================
+Quantize ``speech_tokenizer_v2.onnx`` to INT8 with onnxruntime and measure how
+often its speech tokens agree with fp32 on a sample of the corpus.
+
+- ``dynamic``: INT8 weights, activations quantized on the fly. Only ``MatMul``
+  and ``Gemm`` by default, since the CPU provider has no signed INT8
+  ``ConvInteger`` kernel.
+- ``static``: QDQ model with activation ranges calibrated on
+  ``--calib_files`` sample wavs.
+
+The INT8 model is written as ``<stem>.int8.onnx`` next to the fp32 one, where
+``extract_speech_tokens.py --int8`` picks it up. The agreement report (token
+match rate, exact-file rate and speed) goes to ``<stem>.int8.json``.
+
+Usage:
+    python -m scripts.cv2.quantize_tokenizer \
+        --onnx_path pretrained_models/CosyVoice2-0.5B/speech_tokenizer_v2.onnx \
+        --wav_root corpus/wavs \
+        --mode dynamic
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from scripts.cv2.extract_speech_tokens import (
+    MAX_SECONDS,
+    SAMPLE_RATE,
+    int8_path,
+    load_audio_16k,
+    load_session,
+    tokenizer_inputs,
+)
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+
+def sample_wavs(wav_root: Path, n: int, seed: int = 0) -> List[Path]:
+    wavs = sorted(wav_root.rglob("*.wav"))
+    random.Random(seed).shuffle(wavs)
+    return wavs[:n]
+
+
+class WavCalibrationReader(CalibrationDataReader):
+    """Tokenizer inputs of the calibration wavs, one file per batch."""
+
+    def __init__(self, onnx_path: Path, wavs: List[Path]):
+        sess = load_session(onnx_path)
+        self._feeds = []
+        for wav in wavs:
+            audio = load_audio_16k(wav)
+            if audio.shape[1] / SAMPLE_RATE <= MAX_SECONDS:
+                self._feeds.append(tokenizer_inputs(sess, audio))
+        self._iter = iter(self._feeds)
+
+    def get_next(self):
+        return next(self._iter, None)
+
+    def rewind(self):
+        self._iter = iter(self._feeds)
+
+
+def quantize_tokenizer(
+    onnx_path: Path,
+    out_path: Path,
+    mode: str = "dynamic",
+    calib_wavs: Sequence[Path] = (),
+    op_types: Sequence[str] = ("MatMul", "Gemm"),
+):
+    if mode == "dynamic":
+        quantize_dynamic(
+            onnx_path,
+            out_path,
+            weight_type=QuantType.QInt8,
+            op_types_to_quantize=list(op_types),
+        )
+        return
+
+    if mode != "static":
+        raise ValueError(f"Unknown mode {mode!r}; choose dynamic or static")
+    if not calib_wavs:
+        raise ValueError("Static quantization needs calibration wavs")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Symbolic shape inference + optimization, as recommended for static
+        prepared = Path(tmp) / "prepared.onnx"
+        quant_pre_process(str(onnx_path), str(prepared))
+        quantize_static(
+            prepared,
+            out_path,
+            WavCalibrationReader(onnx_path, calib_wavs),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+
+
+def agreement_report(
+    fp32_path: Path, int8_model: Path, wavs: List[Path], num_threads: int = 0
+) -> Dict:
+    """Token-level agreement of the INT8 model with fp32 over ``wavs``."""
+    ref_sess = load_session(fp32_path, num_threads)
+    hyp_sess = load_session(int8_model, num_threads)
+
+    matched = total = exact = n_files = 0
+    t_ref = t_hyp = audio_s = 0.0
+    files = []
+    for wav in wavs:
+        audio = load_audio_16k(wav)
+        if audio.shape[1] / SAMPLE_RATE > MAX_SECONDS:
+            continue
+
+        feeds = tokenizer_inputs(ref_sess, audio)
+        t0 = time.perf_counter()
+        ref = ref_sess.run(None, feeds)[0].flatten()
+        t1 = time.perf_counter()
+        hyp = hyp_sess.run(None, feeds)[0].flatten()
+        t2 = time.perf_counter()
+
+        n = min(len(ref), len(hyp))
+        file_matched = int(np.sum(ref[:n] == hyp[:n]))
+        file_total = max(len(ref), len(hyp))
+        matched += file_matched
+        total += file_total
+        exact += int(len(ref) == len(hyp) and file_matched == n)
+        n_files += 1
+        t_ref += t1 - t0
+        t_hyp += t2 - t1
+        audio_s += audio.shape[1] / SAMPLE_RATE
+        files.append({"wav": str(wav), "agreement": file_matched / max(file_total, 1)})
+
+    if n_files == 0:
+        raise ValueError("No usable sample wavs (all missing or longer than 30 s)")
+
+    return {
+        "fp32_model": str(fp32_path),
+        "int8_model": str(int8_model),
+        "files": n_files,
+        "audio_s": round(audio_s, 1),
+        "token_agreement": matched / max(total, 1),
+        "exact_files": exact / n_files,
+        "fp32_s": round(t_ref, 3),
+        "int8_s": round(t_hyp, 3),
+        "speedup": round(t_ref / max(t_hyp, 1e-9), 2),
+        "fp32_mb": round(fp32_path.stat().st_size / 2**20, 1),
+        "int8_mb": round(int8_model.stat().st_size / 2**20, 1),
+        "worst": sorted(files, key=lambda f: f["agreement"])[:10],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--onnx_path",
+        type=Path,
+        required=True,
+        help="speech_tokenizer_v2.onnx from CosyVoice2 release",
+    )
+    ap.add_argument("--wav_root", type=Path, required=True, help="Sample corpus")
+    ap.add_argument("--mode", choices=["dynamic", "static"], default="dynamic")
+    ap.add_argument(
+        "--op_types",
+        default="MatMul,Gemm",
+        help="Op types to quantize in dynamic mode",
+    )
+    ap.add_argument("--calib_files", type=int, default=64)
+    ap.add_argument("--eval_files", type=int, default=200)
+    ap.add_argument("--threads", type=int, default=0)
+    ap.add_argument(
+        "--min_agreement",
+        type=float,
+        default=0.95,
+        help="Exit with an error below this token agreement",
+    )
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    out_path = int8_path(args.onnx_path)
+    n_calib = args.calib_files if args.mode == "static" else 0
+    wavs = sample_wavs(args.wav_root, n_calib + args.eval_files, args.seed)
+    # Calibrate and evaluate on disjoint files
+    calib_wavs, eval_wavs = wavs[:n_calib], wavs[n_calib:]
+
+    t0 = time.perf_counter()
+    quantize_tokenizer(
+        args.onnx_path,
+        out_path,
+        mode=args.mode,
+        calib_wavs=calib_wavs,
+        op_types=[t for t in args.op_types.split(",") if t],
+    )
+    logger.info(
+        f"{args.mode} INT8 model → {out_path}  ({time.perf_counter() - t0:.1f}s)"
+    )
+
+    report = agreement_report(args.onnx_path, out_path, eval_wavs, args.threads)
+    report["mode"] = args.mode
+    report_path = out_path.with_suffix(".json")
+    report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    logger.info(
+        f"token agreement {report['token_agreement']:.4f}  "
+        f"exact files {report['exact_files']:.3f}  ({report['files']} files)"
+    )
+    logger.info(
+        f"speed {report['speedup']:.2f}x  "
+        f"size {report['fp32_mb']:.0f} → {report['int8_mb']:.0f} MB"
+    )
+    logger.info(f"report → {report_path}")
+    if report["token_agreement"] < args.min_agreement:
+        raise SystemExit(
+            f"token agreement {report['token_agreement']:.4f} is below "
+            f"--min_agreement {args.min_agreement}; keep the fp32 tokenizer"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Continuous-batching scheduler for CosyVoice 2 + LoRA
+====================================================
+An asyncio front for ``Engine`` that keeps one decode batch in flight: new
+requests are prefilled and admitted at step boundaries, every step advances all
+active requests by one speech token in a single batched forward (each request
+keeps its own KV cache), and finished requests leave the batch immediately.
+
+All LLM work runs on one dedicated thread so the event loop stays free to
+accept requests. Flow matching and the vocoder run on that thread too, or on an
+``AcousticStage`` worker when one is given so they do not stall decode steps.
+
+Usage (load test):
+    python -m scripts.cv2.scheduler \
+        --base_model pretrained_models/CosyVoice2-0.5B \
+        --lora_dir lora_weights/UtterTune-CosyVoice2-ja-JSUTJVS \
+        --texts sentences.txt \
+        --prompt_wav prompts/wav/common_voice_ja_41758953.wav \
+        --prompt_text prompts/trans/common_voice_ja_41758953.txt \
+        --max_batch_size 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+from scripts.cv2.acoustic import AcousticStage
+from scripts.cv2.engine import DecodeState, Engine
+from scripts.cv2.prefix_cache import PrefixCache, adapter_fingerprint
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+
+class ContinuousBatchScheduler:
+    def __init__(
+        self,
+        engine: Engine,
+        max_batch_size: int = 8,
+        acoustic: Optional[AcousticStage] = None,
+    ):
+        self.engine = engine
+        self.acoustic = acoustic
+        self.max_batch_size = max_batch_size
+        self.steps = 0
+        self.tokens_generated = 0
+        self._pending: Optional[asyncio.Queue] = None
+        self._active: List[Tuple[DecodeState, asyncio.Future]] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm")
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._pending = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def _in_model_thread(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def prompt_features(
+        self, prompt_text: str, prompt_speech_16k: torch.Tensor
+    ) -> Dict[str, torch.Tensor]:
+        return await self._in_model_thread(
+            self.engine.prompt_features, prompt_text, prompt_speech_16k
+        )
+
+    async def generate_tokens(self, model_input: Dict[str, torch.Tensor]) -> List[int]:
+        """Queue one frontend chunk; resolves when its speech tokens are done."""
+        future = asyncio.get_running_loop().create_future()
+        await self._pending.put((model_input, future))
+        return await future
+
+    async def synthesize(
+        self,
+        text: str,
+        prompt_text: str,
+        prompt_speech_16k: torch.Tensor,
+        prompt_features: Optional[Dict[str, torch.Tensor]] = None,
+    ) -> torch.Tensor:
+        model_inputs = await self._in_model_thread(
+            self.engine.frontend, text, prompt_text, prompt_speech_16k, prompt_features
+        )
+        token_lists = await asyncio.gather(
+            *(self.generate_tokens(m) for m in model_inputs)
+        )
+        if self.acoustic is not None:
+            wavs = await asyncio.gather(
+                *(
+                    asyncio.wrap_future(self.acoustic.submit(tokens, m))
+                    for tokens, m in zip(token_lists, model_inputs)
+                )
+            )
+        else:
+            wavs = [
+                await self._in_model_thread(self.engine.token2wav, tokens, m)
+                for tokens, m in zip(token_lists, model_inputs)
+            ]
+        return torch.cat(wavs, dim=-1)
+
+    async def _admit(self):
+        """Prefill waiting requests until the batch is full."""
+        while len(self._active) < self.max_batch_size:
+            if self._active or not self._pending.empty():
+                try:
+                    model_input, future = self._pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+            else:
+                # Idle: block until the next request arrives
+                model_input, future = await self._pending.get()
+
+            if future.cancelled():
+                continue
+            try:
+                state = await self._in_model_thread(self.engine.prefill, model_input)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            self._active.append((state, future))
+            self._retire()
+
+    def _retire(self):
+        still_active = []
+        for state, future in self._active:
+            if not state.done:
+                still_active.append((state, future))
+            elif not future.cancelled():
+                self.tokens_generated += len(state.tokens)
+                future.set_result(state.tokens)
+        self._active = still_active
+
+    async def _run(self):
+        while True:
+            await self._admit()
+            if not self._active:
+                continue
+
+            states = [state for state, _ in self._active]
+            try:
+                await self._in_model_thread(self.engine.decode_step, states)
+            except Exception as e:
+                for _, future in self._active:
+                    if not future.done():
+                        future.set_exception(e)
+                self._active = []
+                continue
+            self.steps += 1
+            self._retire()
+
+
+async def _load_test(engine: Engine, sentences, prompt_text, prompt_speech_16k, args):
+    acoustic = None
+    if args.acoustic_batch_size > 0:
+        acoustic = AcousticStage(engine, max_batch_size=args.acoustic_batch_size)
+    scheduler = ContinuousBatchScheduler(
+        engine, max_batch_size=args.max_batch_size, acoustic=acoustic
+    )
+    scheduler.start()
+
+    t0 = time.perf_counter()
+    wavs = await asyncio.gather(
+        *(scheduler.synthesize(s, prompt_text, prompt_speech_16k) for s in sentences)
+    )
+    dt = time.perf_counter() - t0
+    await scheduler.stop()
+    if acoustic is not None:
+        acoustic.close()
+
+    audio_s = sum(w.shape[-1] for w in wavs) / engine.cv2.sample_rate
+    logger.info(
+        f"{len(sentences)} requests in {dt:.2f}s: {len(sentences) / dt:.2f} req/s, "
+        f"{scheduler.tokens_generated / dt:.1f} tokens/s over {scheduler.steps} steps, "
+        f"RTF {dt / audio_s:.3f}"
+    )
+    return wavs
+
+
+def main():
+    from scripts.cv2.infer import (
+        load_model,
+        load_wav,
+        read_prompt_text,
+        read_sentences,
+        trim_wav,
+    )
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base_model", type=str, required=True)
+    ap.add_argument("--lora_dir", type=Path, default=None)
+    ap.add_argument("--texts", required=True, help="Sentences separated by | or a file")
+    ap.add_argument("--prompt_wav", type=Path, required=True)
+    ap.add_argument("--prompt_text", required=True)
+    ap.add_argument("--max_batch_size", type=int, default=8)
+    ap.add_argument("--prefix_cache_mb", type=int, default=512, help="0 disables it")
+    ap.add_argument(
+        "--acoustic_batch_size",
+        type=int,
+        default=4,
+        help="Vocoder batch size on a separate worker (0 = on the LLM thread)",
+    )
+    ap.add_argument("--cpu", action="store_true")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    device = torch.device(
+        "cpu" if args.cpu or not torch.cuda.is_available() else "cuda"
+    )
+    torch.manual_seed(args.seed)
+
+    cv2 = load_model(args.base_model, args.lora_dir, device)
+    prompt_speech_16k = trim_wav(load_wav(args.prompt_wav, 16000), 16000)
+    prompt_text = read_prompt_text(args.prompt_text)
+    sentences = read_sentences(args.texts)
+
+    prefix_cache = None
+    if args.prefix_cache_mb > 0:
+        prefix_cache = PrefixCache(max_bytes=args.prefix_cache_mb << 20)
+    engine = Engine(
+        cv2, prefix_cache=prefix_cache, adapter_id=adapter_fingerprint(args.lora_dir)
+    )
+
+    asyncio.run(_load_test(engine, sentences, prompt_text, prompt_speech_16k, args))
+    if prefix_cache is not None:
+        logger.info("Prefix cache: %s", prefix_cache.stats())
+    logger.info("Decode stops: %s", dict(engine.stop_counts))
+
+
+if __name__ == "__main__":
+    main()
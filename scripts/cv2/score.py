@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Pronunciation scoring
+=====================
+Pick between candidate readings without synthesizing them. Variants of a text
+with ``|`` alternatives in its PHON spans are scored by the teacher-forced
+log-likelihood of a reference speech token sequence under the LoRA LLM, all
+variants in one batched forward: every variant (``rank``), or each word's
+alternatives with the other words held at their first reading (``resolve``),
+which grows with the sum of the alternatives instead of their product.
+
+The input is the unistream sequence ``Qwen2LM.forward`` trains on (the loss
+``CV2Trainer.compute_loss`` optimizes), built directly so that the random
+bistream mixing of training does not apply:
+
+    sos_eos, text, task_id, speech  ->  targets speech + EOS
+
+Running this module resolves every row of a training manifest
+(``spk_id  text  token.npy  wav``) whose text has alternatives, e.g. from
+``extract_jyutping.py --candidates``, with ``resolve``.
+
+Usage:
+    python -m scripts.cv2.score \
+        --base_model pretrained_models/CosyVoice2-0.5B \
+        --lora_dir lora_weights/UtterTune-CosyVoice2-ja-JSUTJVS \
+        --manifest data/manifest_candidates.tsv \
+        --out data/manifest_scored.tsv
+"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import torch
+from torch.nn.utils.rnn import pad_sequence
+
+from scripts.cv2.engine import qwen_model
+from scripts.cv2.phon import alternative_pieces, expand_alternatives
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+
+@dataclass
+class ReadingScore:
+    text: str
+    log_likelihood: float  # Sum over the speech tokens and EOS
+
+
+class PronunciationScorer:
+    def __init__(self, cv2, batch_size: int = 16):
+        self.cv2 = cv2
+        self.llm = cv2.model.llm
+        self.device = cv2.model.device
+        self.batch_size = batch_size
+
+    def _text_ids(self, text: str) -> torch.Tensor:
+        text_token, _ = self.cv2.frontend._extract_text_token(text)
+        return text_token[0].to(self.device)
+
+    @torch.inference_mode()
+    def log_likelihoods(
+        self, texts: List[str], speech_tokens: Sequence[int]
+    ) -> List[float]:
+        """``log p(speech_tokens, EOS | text)`` for every text."""
+        scores: List[float] = []
+        for i in range(0, len(texts), self.batch_size):
+            scores.extend(
+                self._score_batch(texts[i : i + self.batch_size], speech_tokens)
+            )
+        return scores
+
+    def _score_batch(self, texts: List[str], speech_tokens: Sequence[int]):
+        llm = self.llm
+        speech = torch.as_tensor(speech_tokens, dtype=torch.long, device=self.device)
+        n_speech = speech.shape[0]
+
+        sos_eos_emb = llm.llm_embedding.weight[llm.sos_eos].reshape(1, -1)
+        task_id_emb = llm.llm_embedding.weight[llm.task_id].reshape(1, -1)
+        speech_emb = llm.speech_embedding(speech)
+        embed_tokens = qwen_model(llm).embed_tokens
+
+        rows, task_pos = [], []
+        for text in texts:
+            text_emb = embed_tokens(self._text_ids(text))
+            rows.append(torch.cat([sos_eos_emb, text_emb, task_id_emb, speech_emb]))
+            task_pos.append(1 + text_emb.shape[0])
+        lengths = torch.tensor([r.shape[0] for r in rows], dtype=torch.int32)
+
+        # Right-padded and masked by length, as in training
+        hidden, _ = llm.llm(
+            pad_sequence(rows, batch_first=True), lengths.to(self.device)
+        )
+
+        # Outputs at task_id .. last speech token predict speech[0..] and EOS;
+        # only those positions go through the speech head
+        positions = torch.stack(
+            [torch.arange(p, p + n_speech + 1, device=self.device) for p in task_pos]
+        )
+        hidden = hidden.gather(
+            1, positions.unsqueeze(-1).expand(-1, -1, hidden.shape[-1])
+        )
+        logp = llm.llm_decoder(hidden).log_softmax(dim=-1)
+
+        eos = torch.tensor([llm.speech_token_size], device=self.device)
+        target = torch.cat([speech, eos]).expand(len(texts), -1)
+        return logp.gather(2, target.unsqueeze(-1)).squeeze(-1).sum(dim=-1).tolist()
+
+    def rank(
+        self, text: str, speech_tokens: Sequence[int], max_variants: int = 64
+    ) -> List[ReadingScore]:
+        """All reading variants of ``text`` (their product over the words), most
+        likely first."""
+        variants = expand_alternatives(text, max_variants)
+        scores = self.log_likelihoods(variants, speech_tokens)
+        return sorted(
+            (ReadingScore(v, s) for v, s in zip(variants, scores)),
+            key=lambda r: r.log_likelihood,
+            reverse=True,
+        )
+
+    def resolve(
+        self, text: str, speech_tokens: Sequence[int], max_variants: int = 64
+    ) -> Tuple[str, List[ReadingScore]]:
+        """Best reading of ``text``, choosing for every word with alternatives
+        on its own.
+
+        The variants hold every word at its first reading except one, which
+        takes one of its other alternatives, so a text costs 1 + sum(alternatives
+        - 1) variants, not their product; all are scored in one batch. Each
+        word then takes its best-scoring alternative. Returns the resolved text
+        and the scored variants, most likely first. Raises ValueError when there
+        would be more than ``max_variants`` variants.
+        """
+        pieces = alternative_pieces(text)
+        first = [piece[0] for piece in pieces]
+        substitutions = [
+            (i, alt) for i, piece in enumerate(pieces) for alt in piece[1:]
+        ]
+        if 1 + len(substitutions) > max_variants:
+            raise ValueError(
+                f"{1 + len(substitutions)} reading variants exceed "
+                f"max_variants={max_variants}: {text}"
+            )
+        variants = ["".join(first)] + [
+            "".join(first[:i] + [alt] + first[i + 1 :]) for i, alt in substitutions
+        ]
+        scores = self.log_likelihoods(variants, speech_tokens)
+
+        best = {i: (scores[0], first[i]) for i, _ in substitutions}
+        for (i, alt), score in zip(substitutions, scores[1:]):
+            if score > best[i][0]:
+                best[i] = (score, alt)
+        resolved = "".join(best[i][1] if i in best else p for i, p in enumerate(first))
+        ranked = sorted(
+            (ReadingScore(v, s) for v, s in zip(variants, scores)),
+            key=lambda r: r.log_likelihood,
+            reverse=True,
+        )
+        return resolved, ranked
+
+
+def main():
+    from scripts.cv2.infer import load_model
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base_model", type=str, required=True)
+    ap.add_argument("--lora_dir", type=Path, required=True)
+    ap.add_argument(
+        "--manifest",
+        type=Path,
+        required=True,
+        help="spk_id, text with | alternatives, token.npy, wav (TSV)",
+    )
+    ap.add_argument(
+        "--out", type=Path, required=True, help="Same manifest with the best reading"
+    )
+    ap.add_argument(
+        "--scores", type=Path, default=None, help="Also write every variant's score"
+    )
+    ap.add_argument("--batch_size", type=int, default=16)
+    ap.add_argument(
+        "--max_variants",
+        type=int,
+        default=64,
+        help="Rows needing more scored variants are skipped with a warning",
+    )
+    ap.add_argument("--cpu", action="store_true")
+    args = ap.parse_args()
+
+    device = torch.device(
+        "cpu" if args.cpu or not torch.cuda.is_available() else "cuda"
+    )
+    cv2 = load_model(args.base_model, args.lora_dir, device)
+    scorer = PronunciationScorer(cv2, batch_size=args.batch_size)
+
+    rows = [
+        ln.split("\t")
+        for ln in args.manifest.read_text(encoding="utf-8").splitlines()
+        if ln.strip()
+    ]
+    n_ambiguous = n_changed = n_skipped = 0
+    out_rows, score_rows = [], []
+    for spk, text, npy, wav in rows:
+        try:
+            pieces = alternative_pieces(text)
+        except ValueError as e:
+            logger.warning(f"Skipping {npy}: {e}")
+            n_skipped += 1
+            continue
+        first = "".join(piece[0] for piece in pieces)
+        if any(len(piece) > 1 for piece in pieces):
+            try:
+                resolved, ranked = scorer.resolve(
+                    text, np.load(npy).tolist(), args.max_variants
+                )
+            except ValueError as e:
+                logger.warning(f"Skipping {npy}: {e}")
+                n_skipped += 1
+                continue
+            n_ambiguous += 1
+            n_changed += resolved != first
+            score_rows.extend(
+                [Path(npy).stem, r.text, f"{r.log_likelihood:.3f}"] for r in ranked
+            )
+            first = resolved
+        out_rows.append([spk, first, npy, wav])
+
+    args.out.write_text(
+        "".join("\t".join(r) + "\n" for r in out_rows), encoding="utf-8"
+    )
+    if args.scores is not None:
+        args.scores.write_text(
+            "".join("\t".join(r) + "\n" for r in score_rows), encoding="utf-8"
+        )
+
+    logger.info(
+        f"{n_ambiguous}/{len(rows)} rows had alternatives; "
+        f"{n_changed} resolved to a reading other than the first"
+    )
+    if n_skipped:
+        logger.warning(f"{n_skipped}/{len(rows)} rows skipped (see warnings above)")
+    logger.info(f"→ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
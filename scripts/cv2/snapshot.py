@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Pre-assembled model snapshot
+============================
+``load_model`` rebuilds the UtterTune model on every start: CosyVoice2 load,
+``resize_token_embeddings``, PEFT load and the ``embed_rows`` write, and then
+decodes through the unmerged LoRA wrappers. ``compile`` does the adapter work
+once and saves the result:
+
+    <snapshot>/llm.safetensors   merged, resized Qwen2LM state dict
+    <snapshot>/snapshot.json     provenance (base model, adapter fingerprint)
+
+``load_snapshot`` builds the base model with the upstream ``CosyVoice2``
+constructor without reading ``llm.pt``, resizes the embeddings for the PHON
+tokens and makes the memory-mapped snapshot tensors the LLM's parameters, so
+its weights are paged in from the snapshot on first use and never copied.
+
+Usage:
+    python -m scripts.cv2.snapshot compile \
+        --base_model pretrained_models/CosyVoice2-0.5B \
+        --lora_dir lora_weights/UtterTune-CosyVoice2-ja-JSUTJVS \
+        --out_dir snapshots/UtterTune-CosyVoice2-ja-JSUTJVS
+    python -m scripts.cv2.snapshot benchmark \
+        --base_model pretrained_models/CosyVoice2-0.5B \
+        --lora_dir lora_weights/UtterTune-CosyVoice2-ja-JSUTJVS \
+        --out_dir snapshots/UtterTune-CosyVoice2-ja-JSUTJVS
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import time
+from logging import getLogger, StreamHandler, INFO
+from pathlib import Path
+from typing import Optional
+
+import safetensors.torch as st
+import torch
+
+from scripts.cv2.prefix_cache import adapter_fingerprint
+
+logger = getLogger(__name__)
+handler = StreamHandler()
+handler.setLevel(INFO)
+logger.setLevel(INFO)
+logger.addHandler(handler)
+logger.propagate = False
+
+WEIGHTS_FILE = "llm.safetensors"
+META_FILE = "snapshot.json"
+
+
+def compile_snapshot(base_model_dir: str, lora_dir: Optional[Path], out_dir: Path):
+    from scripts.cv2.infer import load_model
+    from scripts.cv2.quantize import merge_lora
+
+    cv2 = load_model(base_model_dir, lora_dir, torch.device("cpu"))
+    llm = merge_lora(cv2)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # save_model de-duplicates the tied embedding / LM head weights
+    st.save_model(llm, str(out_dir / WEIGHTS_FILE))
+
+    meta = {
+        "base_model": str(Path(base_model_dir).resolve()),
+        "lora_dir": str(Path(lora_dir).resolve()) if lora_dir is not None else None,
+        "adapter": adapter_fingerprint(lora_dir),
+        "vocab_size": llm.llm.model.config.vocab_size,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    (out_dir / META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return meta
+
+
+def read_meta(snapshot_dir: Path) -> dict:
+    return json.loads((Path(snapshot_dir) / META_FILE).read_text("utf-8"))
+
+
+def assign_state_dict(module: torch.nn.Module, state_dict: dict):
+    """``load_state_dict(strict=True, assign=True)`` for a file written by
+    ``st.save_model``: the tensors become the parameters without a copy, and
+    the names ``save_model`` dropped as aliases of a tied weight are tied to the
+    loaded tensor again."""
+    aliases = {}
+    for name, tensor in module.state_dict().items():
+        if tensor.numel():
+            aliases.setdefault(tensor.data_ptr(), []).append(name)
+
+    missing, unexpected = module.load_state_dict(state_dict, strict=False, assign=True)
+    if unexpected:
+        raise ValueError(f"Unexpected keys in the snapshot: {unexpected}")
+    for name in missing:
+        loaded = [
+            other
+            for group in aliases.values()
+            if name in group
+            for other in group
+            if other in state_dict
+        ]
+        if not loaded:
+            raise ValueError(f"Missing key in the snapshot: {name}")
+        owner, _, attr = name.rpartition(".")
+        setattr(module.get_submodule(owner), attr, module.get_parameter(loaded[0]))
+
+
+def resize_uninitialized(model, n_tokens: int):
+    """``resize_token_embeddings`` without initializing any rows (neither torch's
+    nor the model's own init), for embeddings that are replaced right after."""
+    from transformers.modeling_utils import no_init_weights
+
+    model._init_weights = lambda module: None
+    try:
+        with no_init_weights():
+            model.resize_token_embeddings(n_tokens, mean_resizing=False)
+    finally:
+        del model._init_weights
+
+
+def load_snapshot(snapshot_dir: Path, device: torch.device):
+    """CosyVoice2 from the upstream constructor (``llm.pt`` not read) with the
+    snapshot's merged LLM weights mapped in."""
+    from scripts.cv2.infer import load_base_model, load_phon_tokenizer
+
+    d = Path(snapshot_dir)
+    meta = read_meta(d)
+    cv2 = load_base_model(meta["base_model"], skip_weights=("llm",))
+
+    # Same vocabulary as load_model: the PHON tokens on top of the Qwen tokenizer
+    tok, _ = load_phon_tokenizer(meta["base_model"])
+    if len(tok.tokenizer) != meta["vocab_size"]:
+        raise ValueError(
+            f"{d} was compiled for {meta['vocab_size']} tokens, the tokenizer "
+            f"has {len(tok.tokenizer)}"
+        )
+    llm = cv2.model.llm
+    resize_uninitialized(llm.llm.model, len(tok.tokenizer))
+    # load_file maps the file; assign keeps those tensors instead of copying
+    assign_state_dict(llm, st.load_file(str(d / WEIGHTS_FILE)))
+    llm.to(device).eval()
+    return cv2
+
+
+def _timed_load(kind: str, base_model: str, lora_dir, snapshot_dir, queue):
+    t0 = time.perf_counter()
+    if kind == "snapshot":
+        load_snapshot(snapshot_dir, torch.device("cpu"))
+    else:
+        from scripts.cv2.infer import load_model
+
+        load_model(base_model, lora_dir, torch.device("cpu"))
+    queue.put(time.perf_counter() - t0)
+
+
+def benchmark(base_model: str, lora_dir, snapshot_dir: Path, repeats: int = 3):
+    """Load time of both paths, each in a fresh process."""
+    ctx = mp.get_context("spawn")
+    results = {}
+    for kind in ("load_model", "snapshot"):
+        times = []
+        for _ in range(repeats):
+            queue = ctx.Queue()
+            p = ctx.Process(
+                target=_timed_load,
+                args=(kind, base_model, lora_dir, snapshot_dir, queue),
+            )
+            p.start()
+            times.append(queue.get())
+            p.join()
+        results[kind] = times
+        logger.info(
+            f"{kind:>10}: " + "  ".join(f"{t:.2f}s" for t in times)
+            + f"  (min {min(times):.2f}s)"
+        )
+    speedup = min(results["load_model"]) / min(results["snapshot"])
+    logger.info(f"snapshot load is {speedup:.2f}x faster")
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("command", choices=["compile", "benchmark"])
+    ap.add_argument("--base_model", type=str, required=True)
+    ap.add_argument("--lora_dir", type=Path, default=None)
+    ap.add_argument("--out_dir", type=Path, required=True, help="Snapshot directory")
+    ap.add_argument("--repeats", type=int, default=3)
+    args = ap.parse_args()
+
+    if args.command == "compile" or not (args.out_dir / META_FILE).is_file():
+        meta = compile_snapshot(args.base_model, args.lora_dir, args.out_dir)
+        logger.info("snapshot → %s  (%s)", args.out_dir, meta)
+    if args.command == "benchmark":
+        benchmark(args.base_model, args.lora_dir, args.out_dir, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
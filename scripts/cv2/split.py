@@ -0,0 +1,113 @@
+"""
+Token-budget paragraph splitter
+===============================
+Drop-in replacement for CosyVoice's ``split_paragraph``:
+
+- **Per-language budgets**: Japanese and Cantonese get their own token budgets
+  instead of falling back to the ``zh``/``en`` defaults.
+- **One tokenization pass**: every sentence is encoded once and the chunks are
+  assembled from those counts, never re-encoding a growing utterance.
+- **Balanced chunks**: a paragraph is cut into as few chunks as the budget
+  allows, and the cuts minimize the largest chunk so LLM decode time stays even
+  across work units. No chunk exceeds the budget unless a single sentence does.
+- **PHON safe**: cuts only fall outside ``<PHON_START>...<PHON_END>`` spans.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from scripts.cv2.phon import SENTENCE_PUNCTUATION, Segment, parse_phon
+
+
+@dataclass(frozen=True)
+class TokenBudget:
+    max_n: int  # Upper bound on text tokens per chunk
+
+
+TOKEN_BUDGETS: Dict[str, TokenBudget] = {
+    "zh": TokenBudget(max_n=160),
+    "yue": TokenBudget(max_n=160),
+    "ja": TokenBudget(max_n=120),
+    "en": TokenBudget(max_n=80),
+}
+
+COMMA_PUNCTUATION = ["，", ","]
+
+_han_re = re.compile(r"[\u4e00-\u9fff]")
+_kana_re = re.compile(r"[\u3040-\u30ff]")
+_cantonese_re = re.compile(r"[嘅咗冇佢嘢喺啲唔哋嚟咁噉乜嗰]")
+
+
+def detect_lang(text: str, lang: str) -> str:
+    """Refine CosyVoice's ``zh``/``en`` guess into ``ja`` or ``yue`` when evident."""
+    if _kana_re.search(text):
+        return "ja"
+    if _cantonese_re.search(text):
+        return "yue"
+    return lang
+
+
+def guess_lang(text: str) -> str:
+    """CosyVoice's own ``zh``/``en`` choice (Han characters or not), refined."""
+    return detect_lang(text, "zh" if _han_re.search(text) else "en")
+
+
+def _pack(lengths: List[int], capacity: int) -> List[int]:
+    """Greedy cut indices; yields the fewest groups whose sums fit ``capacity``."""
+    cuts, total = [], 0
+    for i, n in enumerate(lengths):
+        if total + n > capacity and total > 0:
+            cuts.append(i)
+            total = 0
+        total += n
+    return cuts
+
+
+def _balanced_cuts(lengths: List[int], n_chunks: int) -> List[int]:
+    """Indices that cut ``lengths`` into at most ``n_chunks`` contiguous groups
+    with the smallest possible maximum group sum."""
+    lo, hi = max(lengths), sum(lengths)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if len(_pack(lengths, mid)) + 1 <= n_chunks:
+            hi = mid
+        else:
+            lo = mid + 1
+    return _pack(lengths, lo)
+
+
+def split_paragraph(
+    text: str,
+    tokenizer_encode: Callable[[str], List[int]],
+    lang: str = "zh",
+    budgets: Optional[Dict[str, TokenBudget]] = None,
+    comma_split: bool = False,
+) -> List[str]:
+    budgets = budgets or TOKEN_BUDGETS
+    lang = detect_lang(text, lang)
+    budget = budgets.get(lang, budgets["zh"])
+
+    doc = parse_phon(text)
+    if not doc.segments:
+        return []
+
+    last = doc.segments[-1]
+    if last.phon or last.text[-1] not in SENTENCE_PUNCTUATION:
+        doc.segments.append(Segment("。" if lang != "en" else "."))
+
+    punctuation = SENTENCE_PUNCTUATION + (COMMA_PUNCTUATION if comma_split else [])
+    sentences = doc.sentences(punctuation)
+    lengths = [len(s.encode(tokenizer_encode)) for s in sentences]
+
+    # Fewest chunks that fit the budget, then even them out. Any two adjacent
+    # chunks of the greedy packing overflow it, so there are no short chunks
+    # left to merge (as CosyVoice's token_min_n/merge_len do)
+    n_chunks = len(_pack(lengths, max(budget.max_n, max(lengths)))) + 1
+    bounds = [0] + _balanced_cuts(lengths, n_chunks) + [len(sentences)]
+    return [
+        "".join(s.text for s in sentences[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
@@ -0,0 +1,162 @@
+"""
+Per-stage tracing
+=================
+Spans around the synthesis stages (frontend, LLM prefill, each decode step,
+flow, vocoder), collected by the module-level ``tracer``:
+
+    from scripts.cv2.trace import tracer
+
+    with tracer.span("llm.prefill", tokens=n):
+        ...
+
+Tracing is off by default and ``span`` then returns a shared no-op context, so
+instrumented code pays one method call per span. ``tracer.enable()`` turns it
+on; the spans can then be written as a Chrome trace (``chrome://tracing`` or
+Perfetto) and summarized as per-stage percentiles.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, args: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        if self.tracer.cuda_sync:
+            torch.cuda.synchronize()
+        end = time.perf_counter_ns()
+        self.tracer.record(self.name, self.start, end - self.start, self.args)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.cuda_sync = False
+        # (name, start_ns, dur_ns, thread id, args); list.append is atomic
+        self._events: List[Tuple[str, int, int, int, Dict]] = []
+        self._threads: Dict[int, str] = {}
+
+    def enable(self, cuda_sync: bool = False):
+        """Start collecting. ``cuda_sync`` synchronizes at every span end so GPU
+        stages are timed instead of their kernel launches."""
+        self.enabled = True
+        self.cuda_sync = cuda_sync and torch.cuda.is_available()
+
+    def disable(self):
+        self.enabled = False
+        self.cuda_sync = False
+
+    def clear(self):
+        self._events = []
+
+    def span(self, name: str, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name: str, start_ns: int, dur_ns: int, args: Dict):
+        tid = threading.get_native_id()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        self._events.append((name, start_ns, dur_ns, tid, args))
+
+    def chrome_trace(self) -> Dict:
+        pid = os.getpid()
+        t0 = min((e[1] for e in self._events), default=0)
+        events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self._threads.items()
+        ]
+        events.extend(
+            {
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - t0) / 1000,
+                "dur": dur / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            }
+            for name, start, dur, tid, args in self._events
+        )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: Path):
+        Path(path).write_text(json.dumps(self.chrome_trace()), encoding="utf-8")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per span name: count, total and p50/p90/p99/max in milliseconds."""
+        durations: Dict[str, List[int]] = defaultdict(list)
+        for name, _, dur, _, _ in self._events:
+            durations[name].append(dur)
+
+        summary = {}
+        for name, values in sorted(durations.items()):
+            ms = np.asarray(values, dtype=np.float64) / 1e6
+            p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+            summary[name] = {
+                "count": len(ms),
+                "total_ms": float(ms.sum()),
+                "p50_ms": float(p50),
+                "p90_ms": float(p90),
+                "p99_ms": float(p99),
+                "max_ms": float(ms.max()),
+            }
+        return summary
+
+    def format_summary(self) -> str:
+        lines = [
+            f"{'span':<24}{'count':>8}{'total ms':>12}"
+            f"{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"
+        ]
+        for name, s in self.summary().items():
+            lines.append(
+                f"{name:<24}{s['count']:>8d}{s['total_ms']:>12.1f}"
+                f"{s['p50_ms']:>10.2f}{s['p90_ms']:>10.2f}"
+                f"{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}"
+            )
+        return "\n".join(lines)
+
+
+tracer = Tracer()
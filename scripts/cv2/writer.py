@@ -0,0 +1,225 @@
+"""
+Background audio writer
+=======================
+Moves encoding and file I/O off the synthesis loop:
+
+- ``write`` hands the waveform to a thread pool and returns immediately; it
+  only blocks when ``max_pending`` writes are already queued, which bounds the
+  memory held by audio waiting to be written.
+- Formats: 16-bit PCM ``wav``, ``flac`` and ``opus`` (Ogg).
+- Files mode writes one file per utterance. Shard mode appends to
+  WebDataset-style tar shards (``<key>.<ext>`` + ``<key>.json`` members,
+  ``shard-000000.tar``, ...) and records every member in ``index.jsonl`` with
+  the byte offset and size of its data, so single utterances can be read back
+  with one seek (``read_member``). A later run into the same directory adds
+  new shards after the existing ones and appends to the index.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import torch
+import torchaudio
+
+from scripts.cv2.trace import tracer
+
+FORMATS = {
+    "wav": dict(format="wav", encoding="PCM_S", bits_per_sample=16),
+    "flac": dict(format="flac"),
+    "opus": dict(format="ogg", encoding="opus"),
+}
+EXTENSIONS = {"wav": "wav", "flac": "flac", "opus": "opus"}
+INDEX_FILE = "index.jsonl"
+SHARD_PATTERN = "shard-{:06d}.tar"
+
+
+def encode_audio(wav: torch.Tensor, sr: int, fmt: str = "wav") -> bytes:
+    buf = io.BytesIO()
+    torchaudio.save(buf, wav.detach().cpu(), sr, **FORMATS[fmt])
+    return buf.getvalue()
+
+
+def read_member(root: Path, entry: Dict) -> bytes:
+    """Bytes of one indexed shard member."""
+    with open(Path(root) / entry["shard"], "rb") as f:
+        f.seek(entry["offset"])
+        return f.read(entry["size"])
+
+
+class _ShardSink:
+    """Appends members to rotating tar shards; callers hold the writer lock."""
+
+    def __init__(self, out_dir: Path, shard_size: int, shard_max_bytes: int):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.shard_max_bytes = shard_max_bytes
+        self.n_shards = 0
+        # Never reuse a shard name: index entries of earlier runs point into them
+        existing = [
+            int(p.stem.split("-")[1])
+            for p in out_dir.glob("shard-*.tar")
+            if p.stem.split("-")[1].isdigit()
+        ]
+        self._first_shard = max(existing, default=-1) + 1
+        self._tar: Optional[tarfile.TarFile] = None
+        self._shard_name = ""
+        self._n_members = 0
+        self._index = open(out_dir / INDEX_FILE, "a", encoding="utf-8")
+
+    def _rotate(self):
+        if self._tar is not None:
+            self._tar.close()
+        self._shard_name = SHARD_PATTERN.format(self._first_shard + self.n_shards)
+        self._tar = tarfile.open(self.out_dir / self._shard_name, "x")
+        self.n_shards += 1
+        self._n_members = 0
+
+    def _add(self, name: str, data: bytes) -> int:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        header = info.tobuf(self._tar.format, self._tar.encoding, self._tar.errors)
+        offset = self._tar.offset + len(header)
+        self._tar.addfile(info, io.BytesIO(data))
+        return offset
+
+    def add(self, key: str, ext: str, data: bytes, meta: Dict):
+        if (
+            self._tar is None
+            or self._n_members >= self.shard_size
+            or self._tar.offset >= self.shard_max_bytes
+        ):
+            self._rotate()
+
+        offset = self._add(f"{key}.{ext}", data)
+        self._add(f"{key}.json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+        self._n_members += 1
+        # The member reaches the file before its index entry does, so a crash
+        # never leaves an entry pointing at data that was not written
+        self._tar.fileobj.flush()
+
+        entry = dict(
+            meta, key=key, shard=self._shard_name, offset=offset, size=len(data)
+        )
+        self._index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._index.flush()
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+        self._index.close()
+
+
+class AudioWriter:
+    def __init__(
+        self,
+        out_dir: Path,
+        fmt: str = "wav",
+        num_workers: int = 4,
+        shard_size: int = 0,
+        shard_max_bytes: int = 1 << 30,
+        max_pending: int = 64,
+    ):
+        if fmt not in FORMATS:
+            raise ValueError(
+                f"Unknown audio format {fmt!r}; choose from {list(FORMATS)}"
+            )
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.fmt = fmt
+        self.ext = EXTENSIONS[fmt]
+        self.files = 0
+        self.bytes = 0
+        self.encode_s = 0.0
+        self.wait_s = 0.0
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="writer"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._sink = (
+            _ShardSink(self.out_dir, shard_size, shard_max_bytes)
+            if shard_size > 0
+            else None
+        )
+
+    def path_for(self, key: str) -> Path:
+        """Output path of ``key`` in files mode."""
+        return self.out_dir / f"{key}.{self.ext}"
+
+    def write(
+        self, key: str, wav: torch.Tensor, sr: int, meta: Optional[Dict] = None
+    ) -> Future:
+        t0 = time.perf_counter()
+        self._slots.acquire()
+        self.wait_s += time.perf_counter() - t0
+
+        if self._error is not None:
+            self._slots.release()
+            raise self._error
+
+        future = self._pool.submit(self._write, key, wav.detach().cpu(), sr, meta or {})
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future):
+        self._slots.release()
+        if future.exception() is not None and self._error is None:
+            self._error = future.exception()
+
+    def _write(self, key: str, wav: torch.Tensor, sr: int, meta: Dict):
+        t0 = time.perf_counter()
+        with tracer.span("writer.encode", format=self.fmt):
+            data = encode_audio(wav, sr, self.fmt)
+        dt = time.perf_counter() - t0
+        meta = dict(
+            meta, duration=round(wav.shape[-1] / sr, 3), sample_rate=sr, format=self.fmt
+        )
+
+        if self._sink is None:
+            path = self.path_for(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._sink is not None:
+                self._sink.add(key, self.ext, data, meta)
+            self.files += 1
+            self.bytes += len(data)
+            self.encode_s += dt
+
+    def close(self):
+        """Wait for every queued write; re-raises the first failure."""
+        self._pool.shutdown(wait=True)
+        if self._sink is not None:
+            self._sink.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "files": self.files,
+            "mbytes": self.bytes / (1 << 20),
+            "encode_s": self.encode_s,
+            "blocked_s": self.wait_s,
+            "shards": self._sink.n_shards if self._sink is not None else 0,
+        }
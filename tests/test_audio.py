@@ -0,0 +1,65 @@
+import pytest
+import torch
+
+pytest.importorskip("torchaudio")
+
+from scripts.cv2.audio import find_bounds, trim_batch, trim_wav  # noqa: E402
+
+SR = 16000
+
+
+def utterance(lead_s=0.5, speech_s=1.0, tail_s=0.5, seed=0):
+    """Quiet noise, a 200 Hz tone with harmonics, quiet noise; (1, T)."""
+    g = torch.Generator().manual_seed(seed)
+    t = torch.arange(int(SR * speech_s)) / SR
+    speech = 0.3 * sum(torch.sin(2 * torch.pi * 200 * k * t) / k for k in (1, 2, 3))
+    noise = lambda s: 1e-4 * torch.randn(int(SR * s), generator=g)  # noqa: E731
+    return torch.cat([noise(lead_s), speech, noise(tail_s)])[None]
+
+
+def ms(samples):
+    return 1000 * samples / SR
+
+
+def test_bounds_around_speech():
+    (start,), (end,) = find_bounds(utterance(), SR, pad_ms=0)
+    assert abs(ms(start) - 500) <= 30
+    assert abs(ms(end) - 1500) <= 30
+
+
+def test_pad_is_kept_and_clamped():
+    (start,), (end,) = find_bounds(utterance(lead_s=0.05, tail_s=0.05), SR, pad_ms=100)
+    assert start == 0
+    assert end == utterance(lead_s=0.05, tail_s=0.05).shape[-1]
+
+
+def test_click_before_speech_is_ignored():
+    wav = utterance()
+    wav[0, 1600:1760] = 0.5  # 10 ms click at 100 ms
+    (start,), _ = find_bounds(wav, SR, pad_ms=0)
+    assert abs(ms(start) - 500) <= 30
+
+
+def test_silence_is_trimmed_to_nothing():
+    wav = 1e-4 * torch.randn(1, SR, generator=torch.Generator().manual_seed(0))
+    start, end = find_bounds(wav, SR)
+    assert start.tolist() == end.tolist() == [0]
+    assert trim_wav(wav, SR).shape == (1, 0)
+
+
+def test_batch_matches_single_with_padding():
+    wavs = [
+        utterance(0.2, 0.6, 0.05, seed=0),
+        utterance(0.5, 1.0, 0.8, seed=1),
+        torch.cat([utterance(0.3, 0.4, 0.3, seed=2)] * 2),  # Stereo
+    ]
+    for batched, wav in zip(trim_batch(wavs, SR), wavs):
+        assert torch.equal(batched, trim_wav(wav, SR))
+
+    # The pad of the shortest row stops at its own end, not in the batch padding
+    lengths = torch.tensor([w.shape[-1] for w in wavs])
+    mono = torch.nn.utils.rnn.pad_sequence(
+        [w.mean(dim=0) for w in wavs], batch_first=True
+    )
+    _, ends = find_bounds(mono, SR, lengths=lengths)
+    assert ends[0] == lengths[0]
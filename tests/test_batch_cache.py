@@ -0,0 +1,71 @@
+import torch
+
+from scripts.cv2.batch_cache import BatchKV
+
+
+def make_past(length, n_layers=2, heads=2, dim=4, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    return tuple(
+        (
+            torch.randn(1, heads, length, dim, generator=g),
+            torch.randn(1, heads, length, dim, generator=g),
+        )
+        for _ in range(n_layers)
+    )
+
+
+def assert_rows(kv, pasts):
+    for i, past in enumerate(pasts):
+        for (k, v), (k_ref, v_ref) in zip(kv.row(i), past):
+            assert torch.equal(k, k_ref)
+            assert torch.equal(v, v_ref)
+
+
+def test_build_right_aligns_rows():
+    pasts = [make_past(3, seed=0), make_past(5, seed=1)]
+    kv = BatchKV.build(pasts, reserve=2)
+    assert kv.length == 5
+    assert kv.capacity == 7
+    assert kv.past_lens == [3, 5]
+    assert_rows(kv, pasts)
+    assert kv.attention_mask("cpu").tolist() == [[0, 0, 1, 1, 1, 1], [1] * 6]
+    assert kv.position_ids("cpu").tolist() == [[3], [5]]
+
+
+def test_write_in_place_and_advance():
+    pasts = [make_past(3, seed=0), make_past(5, seed=1)]
+    kv = BatchKV.build(pasts, reserve=2)
+    storage = kv.keys[0].data_ptr()
+
+    new_k = torch.ones(2, 2, 1, 4)
+    new_v = torch.full((2, 2, 1, 4), 2.0)
+    k, v = kv.write(0, new_k, new_v)
+    assert k.shape[2] == 6
+    assert torch.equal(k[:, :, 5:], new_k)
+    assert torch.equal(v[:, :, 5:], new_v)
+    assert kv.keys[0].data_ptr() == storage
+
+    kv.advance()
+    assert kv.length == 6
+    assert kv.past_lens == [4, 6]
+    assert torch.equal(kv.row(0)[0][0][0, :, -1:], new_k[0])
+
+
+def test_reserve_grows_and_keeps_rows():
+    pasts = [make_past(2, seed=0), make_past(4, seed=1)]
+    kv = BatchKV.build(pasts, reserve=1)
+    kv.advance()  # Pretend a token was written at column 4
+    assert kv.length == kv.capacity
+    kv.reserve(1)
+    assert kv.capacity > kv.length
+    for (k, _), (k_ref, _) in zip(kv.row(1), pasts[1]):
+        assert torch.equal(k[:, :, :4], k_ref)
+
+
+def test_rebuild_from_rows_compacts():
+    pasts = [make_past(3, seed=0), make_past(8, seed=1), make_past(5, seed=2)]
+    kv = BatchKV.build(pasts)
+    # The longest request leaves; the rest move into a narrower batch
+    kept = BatchKV.build([kv.row(0), kv.row(2), make_past(4, seed=3)])
+    assert kept.length == 5
+    assert_rows(kept, [pasts[0], pasts[2], make_past(4, seed=3)])
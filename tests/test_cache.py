@@ -0,0 +1,107 @@
+import torch
+
+from scripts.cv2.cache import (
+    CachedResult,
+    ResultCache,
+    cache_key,
+    key_seed,
+    normalize_text,
+    prompt_hash,
+)
+
+PROMPT = prompt_hash("こんにちは", torch.zeros(1, 160))
+
+
+def result(n=100, tokens=None, value=0.5):
+    return CachedResult(torch.full((1, n), value), 24000, tokens)
+
+
+def test_normalize_text_strips_only_the_ends():
+    text = "  ｈｅｌｌｏ　 world <PHON_START> a  b <PHON_END> "
+    assert normalize_text(text) == text.strip()
+
+
+def test_key_ignores_outer_whitespace_only():
+    key = cache_key("hello world", PROMPT, "base", 42)
+    assert cache_key("  hello world\n", PROMPT, "base", 42) == key
+    assert cache_key("hello world", PROMPT, "base", 42, {}) == key
+    # These tokenize differently, so they must not share a result
+    for text in [
+        "hello  world",
+        "ｈｅｌｌｏ world",
+        "hello <PHON_START>a<PHON_END>",
+        "hello<PHON_START>a<PHON_END>",
+    ]:
+        assert cache_key(text, PROMPT, "base", 42) != key
+    assert cache_key("hello <PHON_START>a<PHON_END>", PROMPT, "base", 42) != (
+        cache_key("hello<PHON_START>a<PHON_END>", PROMPT, "base", 42)
+    )
+
+
+def test_key_covers_everything_that_changes_the_output():
+    params = {"engine": "uttertune", "onnx_llm": None}
+    key = cache_key("hello <PHON_START>a<PHON_END>", PROMPT, "base", 42, params)
+    other_prompt = prompt_hash("こんにちは", torch.ones(1, 160))
+    variants = [
+        cache_key("hello <PHON_START>b<PHON_END>", PROMPT, "base", 42, params),
+        cache_key("hello <PHON_START>a<PHON_END>", other_prompt, "base", 42, params),
+        cache_key("hello <PHON_START>a<PHON_END>", PROMPT, "0123abcd", 42, params),
+        cache_key("hello <PHON_START>a<PHON_END>", PROMPT, "base", 43, params),
+        cache_key(
+            "hello <PHON_START>a<PHON_END>",
+            PROMPT,
+            "base",
+            42,
+            dict(params, onnx_llm="fedcba98"),
+        ),
+    ]
+    assert len({key, *variants}) == len(variants) + 1
+    # Parameter order does not matter
+    reordered = dict(reversed(list(params.items())))
+    assert (
+        cache_key("hello <PHON_START>a<PHON_END>", PROMPT, "base", 42, reordered) == key
+    )
+
+
+def test_key_seed_is_stable():
+    key = cache_key("hello", PROMPT, "base", 42)
+    assert key_seed(key) == key_seed(key) == int(key[:8], 16)
+    assert 0 <= key_seed(key) < 2**32
+
+
+def test_memory_lru_evicts_oldest():
+    one = result().nbytes
+    cache = ResultCache(memory_bytes=2 * one)
+    cache.put("a", result())
+    cache.put("b", result())
+    cache.get("a")  # "b" is now the oldest
+    cache.put("c", result())
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_disk_round_trip_with_tokens(tmp_path):
+    cache = ResultCache(tmp_path, memory_bytes=0)
+    cache.put("ab" * 32, result(tokens=[3, 1, 4, 1, 5]))
+    cache.put("cd" * 32, result(value=0.25))
+
+    reopened = ResultCache(tmp_path, memory_bytes=0)
+    hit = reopened.get("ab" * 32)
+    assert hit.tokens == [3, 1, 4, 1, 5]
+    assert hit.sample_rate == 24000
+    assert torch.equal(hit.wav, result().wav)
+    assert reopened.get("cd" * 32).tokens is None
+    assert reopened.stats()["disk_hits"] == 2
+
+
+def test_disk_lru_is_bounded(tmp_path):
+    cache = ResultCache(tmp_path, memory_bytes=0)
+    cache.put("00" * 32, result())
+    size = cache.stats()["disk_mb"] * (1 << 20)
+
+    cache = ResultCache(tmp_path, memory_bytes=0, disk_bytes=int(2.5 * size))
+    cache.put("11" * 32, result())
+    cache.put("22" * 32, result())
+    assert "00" * 32 not in cache
+    assert cache.get("00" * 32) is None
+    assert cache.get("22" * 32) is not None
@@ -0,0 +1,41 @@
+import importlib
+import os
+
+import pytest
+
+# Importing any text.* module runs text/__init__, which loads every g2p
+for name in ["pycantonese", "ToJyutping", "pypinyin", "g2p_en"]:
+    pytest.importorskip(name)
+
+
+@pytest.fixture
+def g2p(tmp_path, monkeypatch):
+    monkeypatch.setenv("UTTERTUNE_CACHE_DIR", str(tmp_path))
+    import text.cantonese.g2p as module
+
+    return importlib.reload(module)
+
+
+def test_syllable_table_is_cached_outside_the_package(g2p, tmp_path):
+    path = g2p.syllable_table_path()
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.path.exists(path)
+    assert not os.path.exists(
+        os.path.join(os.path.dirname(g2p.__file__), "jyutping_cache.pickle")
+    )
+
+
+def test_cache_file_is_keyed_on_library_versions(g2p):
+    from importlib import metadata
+
+    name = os.path.basename(g2p.syllable_table_path())
+    assert metadata.version("pycantonese") in name
+    assert metadata.version("ToJyutping") in name
+
+
+def test_table_matches_pycantonese(g2p):
+    import pycantonese
+
+    for syllable in ["gwong2", "dung1", "waa6", "m4", "ngo5"]:
+        x = pycantonese.parse_jyutping(syllable)[0]
+        assert g2p.parse_jyutping(syllable) == (x.onset, x.nucleus, x.coda, x.tone)
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+# Importing any text.* module runs text/__init__, which loads every g2p
+for name in ["pycantonese", "ToJyutping", "pypinyin", "g2p_en"]:
+    pytest.importorskip(name)
+
+from text.cache import cache_dir  # noqa: E402
+from text.english.cmudict import VERSION, CMUDict, write_dict  # noqa: E402
+
+ENTRIES = {
+    "HELLO": [["HH", "AH0"], ["L", "OW1"]],
+    "A": [["AH0"]],
+    "WORLD": [["W", "ER1", "L", "D"]],
+    "NAÏVE": [["N", "AY0"], ["IY1", "V"]],
+    "READ": [["R", "IY1", "D"]],
+}
+
+
+@pytest.fixture
+def cmudict(tmp_path):
+    path = tmp_path / "cmudict.bin"
+    write_dict(ENTRIES, str(path))
+    return CMUDict(str(path))
+
+
+def test_round_trip(cmudict):
+    assert len(cmudict) == len(ENTRIES)
+    for word, syllables in ENTRIES.items():
+        assert word in cmudict
+        assert cmudict[word] == syllables
+
+
+def test_missing_words(cmudict):
+    for word in ["", "HELL", "HELLOS", "Z", "hello"]:
+        assert word not in cmudict
+        assert cmudict.get(word) is None
+    with pytest.raises(KeyError):
+        cmudict["WORLDS"]
+
+
+def test_entries_are_copies(cmudict):
+    cmudict["HELLO"][0].append("X")
+    assert cmudict["HELLO"] == ENTRIES["HELLO"]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "cmudict.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        CMUDict(str(path))
+
+
+def test_no_temporary_file_left(tmp_path):
+    write_dict(ENTRIES, str(tmp_path / "cmudict.bin"))
+    assert [p.name for p in tmp_path.iterdir()] == ["cmudict.bin"]
+
+
+def test_stale_cache_is_rebuilt(tmp_path, monkeypatch):
+    import text.english.g2p as g2p
+
+    path = tmp_path / "cmudict.bin"
+    path.write_bytes(b"CMUB" + b"\0" * 60)  # Right magic, wrong version
+    monkeypatch.setattr(g2p, "CACHE_PATH", str(path))
+    monkeypatch.setattr(g2p, "read_dict", lambda: ENTRIES)
+    assert g2p.get_dict()["HELLO"] == ENTRIES["HELLO"]
+    assert CMUDict(str(path))["WORLD"] == ENTRIES["WORLD"]
+
+
+def test_cache_lives_outside_the_package():
+    import text.english.g2p as g2p
+
+    assert os.path.dirname(g2p.CACHE_PATH) == cache_dir()
+    assert os.path.basename(g2p.CACHE_PATH) == f"cmudict_v{VERSION}.bin"
@@ -0,0 +1,134 @@
+import os
+
+import pytest
+
+# Importing any text.* module runs text/__init__, which loads every g2p
+for name in ["pycantonese", "ToJyutping", "pypinyin", "g2p_en"]:
+    pytest.importorskip(name)
+
+from text.english.g2p import (  # noqa: E402
+    LOCAL_PATH,
+    g2p,
+    regex_tokenize,
+    text_to_words,
+)
+from text.symbols import punctuations  # noqa: E402
+
+CORPUS = [
+    (
+        "In this paper, we propose 1 DSPGAN, a GAN-based universal vocoder.",
+        [
+            ["In"],
+            ["this"],
+            ["paper"],
+            [","],
+            ["we"],
+            ["propose"],
+            ["1"],
+            ["DSPGAN"],
+            [","],
+            ["a"],
+            ["GAN", "-", "based"],
+            ["universal"],
+            ["vocoder"],
+            ["."],
+        ],
+    ),
+    (
+        "Don't stop, it's fine!",
+        [["Don", "'", "t"], ["stop"], [","], ["it", "'", "s"], ["fine"], ["!"]],
+    ),
+    (
+        "'Quoted' words, and GAN-based ones.",
+        [
+            ["'", "Quoted"],
+            ["'"],
+            ["words"],
+            [","],
+            ["and"],
+            ["GAN", "-", "based"],
+            ["ones"],
+            ["."],
+        ],
+    ),
+    (
+        "Hello... world - again?",
+        [["Hello"], ["…"], ["world"], ["-"], ["again"], ["?"]],
+    ),
+    (
+        'He said "no" (twice): once; twice.',
+        [
+            ["He"],
+            ["said"],
+            ["'", "no"],
+            ["'"],
+            ["'", "twice"],
+            ["'"],
+            [","],
+            ["once"],
+            [","],
+            ["twice"],
+            ["."],
+        ],
+    ),
+    ("Wait...what?!", [["Wait", "…", "what"], ["?"], ["!"]]),
+    ("Go!..", [["Go"], ["!"], ["…"]]),
+    ("(aside)", [["'", "aside"], ["'"]]),
+]
+
+
+@pytest.mark.parametrize("text, words", CORPUS)
+def test_regex_words(text, words):
+    assert text_to_words(text, "regex") == words
+
+
+@pytest.mark.parametrize(
+    "piece, mapped",
+    [('"', "'"), ("(", "'"), (")", "'"), (":", ","), (";", ","), ("...", "…")],
+)
+def test_marks_outside_the_phone_set_are_mapped(piece, mapped):
+    assert regex_tokenize(f"a{piece}b") == ["▁a", mapped, "b"]
+
+
+def test_single_period_is_kept():
+    assert regex_tokenize("a.b") == ["▁a", ".", "b"]
+
+
+# Only letters, digits and marks of the phone set: the regex splitter maps other
+# marks to these, the DeBERTa tokenizer does not
+PARITY = [
+    "In this paper, we propose 1 DSPGAN, a GAN-based universal vocoder.",
+    "Don't stop, it's fine!",
+    "'Quoted' words, and GAN-based ones.",
+    "Is it ready? Yes! Not yet, though.",
+    "The state-of-the-art model runs 24 hours a day.",
+    "We'll see - maybe.",
+]
+
+
+@pytest.fixture(scope="module")
+def deberta():
+    pytest.importorskip("transformers")
+    if not os.path.isdir(LOCAL_PATH):
+        pytest.skip(f"DeBERTa checkpoint not found at {LOCAL_PATH}")
+
+
+def pieces_joined(words):
+    return ["".join(w) for w in words]
+
+
+@pytest.mark.parametrize("text", PARITY)
+def test_word_boundaries_match_deberta(deberta, text):
+    # DeBERTa may split a word into subword pieces; the words and the
+    # punctuation attached to them must be the same
+    assert pieces_joined(text_to_words(text, "regex")) == pieces_joined(
+        text_to_words(text, "deberta")
+    )
+
+
+@pytest.mark.parametrize("text", PARITY)
+def test_phones_match_deberta_on_whole_words(deberta, text):
+    words = text_to_words(text, "deberta")
+    if any(len([p for p in w if p not in punctuations]) > 1 for w in words):
+        pytest.skip("DeBERTa splits a word into subword pieces")
+    assert g2p(text, splitter="regex") == g2p(text, splitter="deberta")
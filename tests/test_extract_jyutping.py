@@ -0,0 +1,43 @@
+import pytest
+
+ToJyutping = pytest.importorskip("ToJyutping")
+
+from scripts.cv2.extract_jyutping import poly2jyut  # noqa: E402
+from scripts.cv2.phon import expand_alternatives  # noqa: E402
+
+
+def baseline_poly2jyut(text):
+    """The two-lookup annotator this module replaced."""
+    kinds = []
+    for _, jyut in ToJyutping.get_jyutping_candidates(text):
+        kinds.append("poly" if len(jyut) > 1 else "mono" if jyut else "punc")
+
+    final_text = []
+    for kind, (char, jyutping) in zip(kinds, ToJyutping.get_jyutping_list(text)):
+        if kind == "poly":
+            final_text += ["<PHON_START>", jyutping, "<PHON_END>"]
+        else:
+            final_text.append(char)
+    return "".join(final_text).replace("<PHON_END><PHON_START>", " ")
+
+
+SENTENCES = [
+    "我哋去銀行行街，好唔好？",
+    "佢行得好快，一行人都跟唔上。",
+    "今日天氣好好，我好鍾意。",
+    "重新嚟過，呢個問題好重要。",
+    "Hello，今日去邊度？",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", SENTENCES)
+def test_matches_baseline(text):
+    assert poly2jyut(text) == baseline_poly2jyut(text)
+
+
+@pytest.mark.parametrize("text", SENTENCES)
+def test_candidates_start_with_the_chosen_reading(text):
+    assert expand_alternatives(poly2jyut(text, candidates=True), 10**9)[0] == (
+        poly2jyut(text)
+    )
@@ -0,0 +1,69 @@
+import random
+
+from scripts.cv2.guards import TOKEN_RATE, DecodeGuards, LoopDetector
+
+GUARDS = DecodeGuards()
+
+
+def feed(detector, stream):
+    """Push ``stream`` token by token; returns (reason, tokens pushed)."""
+    tokens = []
+    for token in stream:
+        tokens.append(token)
+        reason = detector.push(tokens)
+        if reason:
+            return reason, tokens
+    return "", tokens
+
+
+def test_budget_counts_characters_not_tags_or_spaces():
+    assert GUARDS.budget("") == 5 * TOKEN_RATE
+    assert GUARDS.budget("ab c d e") == GUARDS.budget("abcde") == 6 * TOKEN_RATE
+    assert GUARDS.budget("<PHON_START>ab cde<PHON_END>") == 6 * TOKEN_RATE
+
+
+def test_diverse_stream_is_not_a_loop():
+    stream = [(7 * i) % 101 for i in range(1000)]
+    assert feed(LoopDetector(GUARDS), stream) == ("", stream)
+
+
+def test_repetition_keeps_one_cycle():
+    prefix = list(range(100, 110))
+    detector = LoopDetector(GUARDS)
+    reason, tokens = feed(detector, prefix + [1, 2, 3] * 100)
+    assert reason == "repetition"
+    # The first cycle is not a repeat; loop_tokens repeats after it
+    assert len(tokens) == len(prefix) + 3 + GUARDS.loop_tokens
+    assert tokens[: detector.loop_start(reason, len(tokens))] == prefix + [1, 2, 3]
+
+
+def test_repetition_of_one_token():
+    detector = LoopDetector(GUARDS)
+    reason, tokens = feed(detector, [9, 8] + [5] * 100)
+    assert reason == "repetition"
+    assert tokens[: detector.loop_start(reason, len(tokens))] == [9, 8, 5]
+
+
+def test_longest_period_is_detected_but_not_longer():
+    period = list(range(GUARDS.max_period))
+    assert feed(LoopDetector(GUARDS), period * 20)[0] == "repetition"
+    longer = list(range(GUARDS.max_period + 1))
+    assert feed(LoopDetector(GUARDS), longer * 20)[0] == ""
+
+
+def test_low_diversity_drops_the_window():
+    rng = random.Random(0)
+    prefix = list(range(100, 120))
+    stream = prefix + [rng.choice([5, 6]) for _ in range(200)]
+    detector = LoopDetector(GUARDS)
+    reason, tokens = feed(detector, stream)
+    assert reason == "low_diversity"
+    # Flagged once the whole window is past the prefix
+    assert len(tokens) == len(prefix) + GUARDS.diversity_window
+    assert tokens[: detector.loop_start(reason, len(tokens))] == prefix
+
+
+def test_min_distinct_in_window_is_not_a_loop():
+    rng = random.Random(0)
+    stream = [rng.choice([5, 6, 7]) for _ in range(500)]
+    assert feed(LoopDetector(GUARDS), stream)[0] == ""
@@ -0,0 +1,58 @@
+import pytest
+
+# Importing any text.* module runs text/__init__, which loads every g2p
+for name in ["pycantonese", "ToJyutping", "pypinyin", "g2p_en"]:
+    pytest.importorskip(name)
+
+from text.number_utils import (  # noqa: E402
+    _normalize_numbers_sequential,
+    normalize_numbers,
+    normalize_numbers_chinese,
+)
+
+ENGLISH = [
+    "I have 2 cats and 13 dogs.",
+    "It costs $5.50, or £1,200 in 1999.",
+    "The 21st and 3rd of 2,000,000 entries",
+    "Pi is 3.14159 and e is 2.718",
+    "Call 0800 123 456 before 2005",
+    "$1 $0.01 $.5 $1.2.3 $0",
+    "1,2,3 and 1.2.3 and 12th3",
+    "No digits here.",
+]
+
+
+@pytest.mark.parametrize("text", ENGLISH)
+def test_matches_sequential_passes(text):
+    assert normalize_numbers(text) == _normalize_numbers_sequential(text)
+
+
+@pytest.mark.parametrize(
+    "text, zh, yue",
+    [
+        ("2024", "两千零二十四", "兩千零二十四"),
+        ("2024年", "二零二四年", "二零二四年"),
+        ("12", "十二", "十二"),
+        ("200", "二百", "二百"),
+        ("1002", "一千零二", "一千零二"),
+        ("22000", "两万两千", "兩萬兩千"),
+        ("200000000", "两亿", "兩億"),
+        ("3.14", "三点一四", "三點一四"),
+        ("0755", "零七五五", "零七五五"),
+    ],
+)
+def test_chinese_numbers(text, zh, yue):
+    assert normalize_numbers_chinese(text, "zh") == zh
+    assert normalize_numbers_chinese(text, "yue") == yue
+
+
+def test_phon_spans_are_left_alone():
+    text = "<PHON_START>gwong2 dung1<PHON_END>有2个"
+    assert normalize_numbers_chinese(text) == "<PHON_START>gwong2 dung1<PHON_END>有二个"
+    text = "<PHON_START>HH AH0 L OW1<PHON_END> 2"
+    assert normalize_numbers(text) == "<PHON_START>HH AH0 L OW1<PHON_END> two"
+
+
+def test_unknown_language():
+    with pytest.raises(ValueError):
+        normalize_numbers_chinese("2", "ja")
@@ -0,0 +1,60 @@
+import multiprocessing as mp
+
+import pytest
+
+# Importing any text.* module runs text/__init__, which loads every g2p
+for name in ["pycantonese", "ToJyutping", "pypinyin", "g2p_en"]:
+    pytest.importorskip(name)
+
+from text.english.g2p import OOVLexicon  # noqa: E402
+
+
+class CountingPredictor:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, word):
+        self.calls.append(word)
+        return list(word.upper()) + [" "]
+
+
+def test_predicts_each_word_once(tmp_path):
+    predictor = CountingPredictor()
+    lexicon = OOVLexicon(tmp_path / "oov.tsv", predictor)
+    assert lexicon.lookup(["abc", "xy", "abc"]) == {
+        "abc": ["A", "B", "C"],
+        "xy": ["X", "Y"],
+    }
+    lexicon.lookup(["xy"])
+    assert predictor.calls == ["abc", "xy"]
+
+
+def test_persists_across_instances(tmp_path):
+    path = tmp_path / "oov.tsv"
+    OOVLexicon(path, CountingPredictor()).lookup(["abc"])
+    predictor = CountingPredictor()
+    assert OOVLexicon(path, predictor).lookup(["abc"]) == {"abc": ["A", "B", "C"]}
+    assert predictor.calls == []
+
+
+def test_in_memory(tmp_path):
+    OOVLexicon(None, CountingPredictor()).lookup(["abc"])
+    assert list(tmp_path.iterdir()) == []
+
+
+def _append(path, words):
+    OOVLexicon(path, CountingPredictor()).lookup(words)
+
+
+def test_concurrent_appends_keep_whole_lines(tmp_path):
+    path = tmp_path / "oov.tsv"
+    words = [[f"w{i}x{j}" for j in range(200)] for i in range(4)]
+    procs = [mp.Process(target=_append, args=(path, w)) for w in words]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    lexicon = OOVLexicon(path, CountingPredictor())
+    assert len(lexicon.entries) == 800
+    assert all(p == list(w.upper()) for w, p in lexicon.entries.items())
@@ -0,0 +1,120 @@
+import pytest
+
+from scripts.cv2.phon import (
+    PHON_END,
+    PHON_START,
+    alternative_pieces,
+    expand_alternatives,
+    parse_phon,
+)
+
+
+def phon(reading):
+    return f"{PHON_START}{reading}{PHON_END}"
+
+
+def test_segments_round_trip():
+    text = f"{phon('hang4 sik6')}好。{phon('gwong2')}"
+    doc = parse_phon(text)
+    assert [(s.text, s.phon) for s in doc.segments] == [
+        ("hang4 sik6", True),
+        ("好。", False),
+        ("gwong2", True),
+    ]
+    assert [s.text for s in doc.spans] == ["hang4 sik6", "gwong2"]
+    assert doc.text == text
+
+
+def test_plain_text():
+    doc = parse_phon("No spans here.")
+    assert doc.spans == []
+    assert doc.text == "No spans here."
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        f"{PHON_START}a{PHON_START}b{PHON_END}",
+        f"a{PHON_END}",
+        f"{PHON_START}a",
+        f"x{PHON_START}{PHON_END}y",
+    ],
+)
+def test_rejects_unbalanced_or_empty_spans(text):
+    with pytest.raises(ValueError):
+        parse_phon(text)
+
+
+def test_sentences_never_cut_inside_spans():
+    doc = parse_phon(f"前。{phon('a. b?')}後！尾")
+    assert [s.text for s in doc.sentences()] == [
+        "前。",
+        f"{phon('a. b?')}後！",
+        "尾",
+    ]
+
+
+def test_closing_quote_stays_with_its_sentence():
+    doc = parse_phon("「好。”下一句")
+    assert [s.text for s in doc.sentences()] == ["「好。”", "下一句"]
+
+
+def test_span_token_ids_are_encoded_once():
+    calls = []
+
+    def encode(text):
+        calls.append(text)
+        return [len(text)]
+
+    doc = parse_phon(f"a{phon('x')}b。{phon('y')}")
+    sentences = doc.sentences()
+    for s in sentences:
+        s.encode(encode)
+    doc.encode(encode)
+    assert calls.count(phon("x")) == 1
+    assert calls.count(phon("y")) == 1
+
+
+def test_alternatives_expand_in_order():
+    text = f"{phon('hang4|hong4 sik6')}好{phon('gwong2|gwong1')}"
+    assert expand_alternatives(text) == [
+        f"{phon('hang4 sik6')}好{phon('gwong2')}",
+        f"{phon('hang4 sik6')}好{phon('gwong1')}",
+        f"{phon('hong4 sik6')}好{phon('gwong2')}",
+        f"{phon('hong4 sik6')}好{phon('gwong1')}",
+    ]
+
+
+def test_alternative_pieces():
+    text = f"{phon('hang4|hong4 sik6')}好"
+    assert alternative_pieces(text) == [
+        [PHON_START],
+        ["hang4", "hong4"],
+        [" "],
+        ["sik6"],
+        [PHON_END],
+        ["好"],
+    ]
+
+
+def test_alternatives_split_on_any_whitespace():
+    text = phon(" hang4|hong4\t sik6 ")
+    assert expand_alternatives(text) == [phon("hang4 sik6"), phon("hong4 sik6")]
+
+
+def test_text_without_alternatives_is_unchanged():
+    text = f"{phon('hang4  sik6')}好。"
+    assert expand_alternatives(text) == [text]
+
+
+@pytest.mark.parametrize("reading", ["hang4| sik6", "|hong4 sik6", "hang4||hong4"])
+def test_rejects_empty_alternatives(reading):
+    with pytest.raises(ValueError, match="Empty alternative"):
+        expand_alternatives(phon(reading))
+
+
+def test_rejects_too_many_variants():
+    text = phon("a|b c|d e|f")
+    assert len(expand_alternatives(text, max_variants=8)) == 8
+    with pytest.raises(ValueError, match="max_variants=7"):
+        expand_alternatives(text, max_variants=7)
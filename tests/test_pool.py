@@ -0,0 +1,48 @@
+import pytest
+
+from scripts.cv2.pool import core_sets, parse_cpu_list, physical_core_order
+
+
+def fake_sysfs(root, siblings):
+    for cpu, text in siblings.items():
+        topology = root / f"cpu{cpu}" / "topology"
+        topology.mkdir(parents=True)
+        (topology / "thread_siblings_list").write_text(text + "\n")
+    return root
+
+
+def test_parse_cpu_list():
+    assert parse_cpu_list("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpu_list("5") == [5]
+
+
+def test_siblings_numbered_after_all_cores(tmp_path):
+    # 4 cores x 2 threads: cpu N and N + 4 share a core
+    sysfs = fake_sysfs(tmp_path, {c: f"{c % 4},{c % 4 + 4}" for c in range(8)})
+    assert physical_core_order(list(range(8)), sysfs) == list(range(8))
+
+
+def test_adjacent_siblings(tmp_path):
+    # 4 cores x 2 threads: cpus 2k and 2k + 1 share a core
+    sysfs = fake_sysfs(tmp_path, {c: f"{c - c % 2}-{c - c % 2 + 1}" for c in range(8)})
+    order = physical_core_order(list(range(8)), sysfs)
+    assert order == [0, 2, 4, 6, 1, 3, 5, 7]
+
+
+def test_only_allowed_cpus_are_used(tmp_path):
+    sysfs = fake_sysfs(tmp_path, {c: f"{c - c % 2}-{c - c % 2 + 1}" for c in range(8)})
+    # Affinity mask without cpu 0: cpu 1 is the only thread of its core left
+    assert physical_core_order([1, 2, 3, 5, 7], sysfs) == [1, 2, 5, 7, 3]
+
+
+def test_missing_topology_counts_every_cpu_as_a_core(tmp_path):
+    assert physical_core_order([3, 1, 2], tmp_path) == [1, 2, 3]
+
+
+def test_core_sets_use_separate_cores_first(tmp_path):
+    sysfs = fake_sysfs(tmp_path, {c: f"{c - c % 2}-{c - c % 2 + 1}" for c in range(8)})
+    assert core_sets(2, 2, list(range(8)), sysfs) == [[0, 2], [4, 6]]
+    # Beyond the physical cores the siblings are used
+    assert core_sets(3, 2, list(range(8)), sysfs) == [[0, 2], [4, 6], [1, 3]]
+    with pytest.raises(ValueError):
+        core_sets(3, 3, list(range(8)), sysfs)
@@ -0,0 +1,76 @@
+import torch
+
+from scripts.cv2.prefix_cache import (
+    PrefixCache,
+    adapter_fingerprint,
+    cache_nbytes,
+    prompt_hash,
+)
+
+
+def make_past(length, n_layers=2):
+    return tuple(
+        (torch.zeros(1, 2, length, 4), torch.zeros(1, 2, length, 4))
+        for _ in range(n_layers)
+    )
+
+
+def test_cache_nbytes():
+    assert cache_nbytes(make_past(3)) == 2 * 2 * (2 * 3 * 4) * 4
+
+
+def test_hit_and_miss():
+    cache = PrefixCache()
+    past = make_past(3)
+    assert cache.get(("a", "p")) is None
+    cache.put(("a", "p"), past)
+    assert cache.get(("a", "p")) is past
+    assert cache.get(("b", "p")) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+
+
+def test_evicts_least_recently_used():
+    entry = cache_nbytes(make_past(4))
+    cache = PrefixCache(max_bytes=2 * entry)
+    cache.put(("a", "1"), make_past(4))
+    cache.put(("a", "2"), make_past(4))
+    cache.get(("a", "1"))  # "2" is now the oldest
+    cache.put(("a", "3"), make_past(4))
+    assert cache.get(("a", "2")) is None
+    assert cache.get(("a", "1")) is not None
+    assert cache.get(("a", "3")) is not None
+    assert cache.nbytes == 2 * entry
+    assert cache.evictions == 1
+
+
+def test_replacing_a_key_keeps_the_size_right():
+    cache = PrefixCache()
+    cache.put(("a", "1"), make_past(4))
+    cache.put(("a", "1"), make_past(2))
+    assert len(cache) == 1
+    assert cache.nbytes == cache_nbytes(make_past(2))
+
+
+def test_oversized_entry_is_not_cached():
+    cache = PrefixCache(max_bytes=cache_nbytes(make_past(2)))
+    cache.put(("a", "1"), make_past(2))
+    cache.put(("a", "2"), make_past(8))
+    assert cache.get(("a", "2")) is None
+    assert cache.get(("a", "1")) is not None
+
+
+def test_prompt_hash_depends_on_ids_only():
+    ids = torch.tensor([[1, 2, 3]])
+    assert prompt_hash(ids) == prompt_hash(ids.to(torch.int32))
+    assert prompt_hash(ids) != prompt_hash(torch.tensor([[1, 2, 4]]))
+
+
+def test_adapter_fingerprint(tmp_path):
+    assert adapter_fingerprint(None) == "base"
+    (tmp_path / "adapter_config.json").write_text("{}")
+    (tmp_path / "adapter_model.safetensors").write_bytes(b"weights")
+    first = adapter_fingerprint(tmp_path)
+    assert first == adapter_fingerprint(tmp_path)
+    (tmp_path / "adapter_model.safetensors").write_bytes(b"other weights")
+    assert adapter_fingerprint(tmp_path) != first
@@ -0,0 +1,51 @@
+import pytest
+
+from scripts.cv2.phon import PHON_END, PHON_START
+
+pytest.importorskip("transformers")
+
+from scripts.cv2.score import PronunciationScorer  # noqa: E402
+
+
+def phon(reading):
+    return f"{PHON_START}{reading}{PHON_END}"
+
+
+class PreferringScorer(PronunciationScorer):
+    """Scores a variant by how many of the preferred readings it contains."""
+
+    def __init__(self, preferred):
+        self.preferred = preferred
+        self.scored = []
+
+    def log_likelihoods(self, texts, speech_tokens):
+        self.scored.append(texts)
+        scores = []
+        for text in texts:
+            words = text.replace(PHON_START, " ").replace(PHON_END, " ").split()
+            scores.append(float(sum(p in words for p in self.preferred)))
+        return scores
+
+
+def test_resolve_scores_each_word_on_its_own():
+    text = phon("a1|a2|a3 b1|b2 c1|c2 d1|d2 e1")
+    scorer = PreferringScorer(["a3", "c2"])
+    resolved, ranked = scorer.resolve(text, [1, 2, 3])
+    assert resolved == phon("a3 b1 c2 d1 e1")
+    # One batch of 1 + (2 + 1 + 1 + 1) variants instead of 3 * 2 * 2 * 2
+    assert [len(batch) for batch in scorer.scored] == [6]
+    assert len(ranked) == 6
+    assert ranked[0].log_likelihood == 1.0
+
+
+def test_resolve_keeps_the_first_reading_on_ties():
+    text = f"{phon('hang4|hong4 sik6')}好{phon('gwong2|gwong1')}"
+    resolved, _ = PreferringScorer([]).resolve(text, [1])
+    assert resolved == f"{phon('hang4 sik6')}好{phon('gwong2')}"
+
+
+def test_resolve_limits_the_variants():
+    text = phon("a|b c|d e|f")
+    assert len(PreferringScorer([]).resolve(text, [1], max_variants=4)[1]) == 4
+    with pytest.raises(ValueError, match="max_variants=3"):
+        PreferringScorer([]).resolve(text, [1], max_variants=3)
@@ -0,0 +1,44 @@
+import pytest
+import torch
+
+st = pytest.importorskip("safetensors.torch")
+
+from scripts.cv2.snapshot import assign_state_dict  # noqa: E402
+
+
+class Tied(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.embed = torch.nn.Embedding(10, 4)
+        self.proj = torch.nn.Linear(4, 4)
+        self.head = torch.nn.Linear(4, 10, bias=False)
+        self.head.weight = self.embed.weight
+
+
+@pytest.fixture
+def saved(tmp_path):
+    torch.manual_seed(0)
+    path = str(tmp_path / "llm.safetensors")
+    st.save_model(Tied(), path)
+    return path
+
+
+def test_assigns_without_copy_and_reties(saved):
+    torch.manual_seed(1)
+    model = Tied()
+    state = st.load_file(saved)
+    assign_state_dict(model, state)
+
+    for name, tensor in state.items():
+        assert model.get_parameter(name).data_ptr() == tensor.data_ptr()
+    assert model.head.weight is model.embed.weight
+    torch.manual_seed(0)
+    assert torch.equal(model.proj.weight, Tied().proj.weight)
+
+
+def test_rejects_missing_and_unexpected_keys(saved):
+    state = st.load_file(saved)
+    with pytest.raises(ValueError, match="Missing key"):
+        assign_state_dict(Tied(), {k: v for k, v in state.items() if "proj" not in k})
+    with pytest.raises(ValueError, match="Unexpected keys"):
+        assign_state_dict(Tied(), dict(state, extra=torch.zeros(1)))
@@ -0,0 +1,89 @@
+import pytest
+
+from scripts.cv2.phon import PHON_END, PHON_START
+from scripts.cv2.split import (
+    TOKEN_BUDGETS,
+    TokenBudget,
+    detect_lang,
+    guess_lang,
+    split_paragraph,
+)
+
+
+def encode(text):
+    # One token per character; the PHON tags count as one each
+    text = text.replace(PHON_START, "<").replace(PHON_END, ">")
+    return list(text)
+
+
+def lengths(chunks):
+    return [len(encode(c)) for c in chunks]
+
+
+def test_short_paragraph_is_one_chunk():
+    assert split_paragraph("你好。世界。", encode) == ["你好。世界。"]
+
+
+def test_appends_final_punctuation():
+    assert split_paragraph("你好", encode) == ["你好。"]
+    assert split_paragraph("Hello", encode, lang="en") == ["Hello."]
+
+
+def test_empty_paragraph():
+    assert split_paragraph("", encode) == []
+
+
+@pytest.mark.parametrize("lang", ["zh", "en"])
+@pytest.mark.parametrize("n_sentences", [2, 3, 7, 20])
+def test_chunks_fit_the_budget(lang, n_sentences):
+    sentence = "一二三四五六七八九十一二三四五六七八九十一二三四五六七八九。"
+    text = sentence * n_sentences
+    chunks = split_paragraph(text, encode, lang=lang)
+    max_n = TOKEN_BUDGETS[lang].max_n
+    assert "".join(chunks) == text
+    assert max(lengths(chunks)) <= max_n
+    # Fewest chunks: no two neighbours would fit together
+    assert all(a + b > max_n for a, b in zip(lengths(chunks), lengths(chunks)[1:]))
+
+
+def test_chunks_are_balanced():
+    text = "一二三四五六七八九。" * 17  # 170 tokens, zh budget 160
+    assert lengths(split_paragraph(text, encode)) == [90, 80]
+
+
+def test_oversized_sentence_stays_whole():
+    long_sentence = "长" * 200 + "。"
+    chunks = split_paragraph(long_sentence + "短。", encode)
+    assert chunks == [long_sentence, "短。"]
+
+
+def test_never_cuts_inside_phon():
+    span = f"{PHON_START}a. b. c.{PHON_END}"
+    text = "一二三。" + span + "四五六。"
+    budgets = {"zh": TokenBudget(max_n=8)}
+    chunks = split_paragraph(text, encode, budgets=budgets)
+    assert "".join(chunks) == text
+    assert any(span in c for c in chunks)
+
+
+def test_comma_split():
+    budgets = {"zh": TokenBudget(max_n=4)}
+    assert split_paragraph("一二，三四。", encode, budgets=budgets) == ["一二，三四。"]
+    assert split_paragraph(
+        "一二，三四。", encode, budgets=budgets, comma_split=True
+    ) == ["一二，", "三四。"]
+
+
+def test_language_specific_budgets():
+    assert detect_lang("これはテスト。", "zh") == "ja"
+    assert detect_lang("佢唔喺度。", "zh") == "yue"
+    assert detect_lang("你好。", "zh") == "zh"
+    text = "あいうえおかきくけこ。" * 13  # 143 tokens, ja budget 120
+    assert len(split_paragraph(text, encode)) == 2
+
+
+def test_guess_lang():
+    assert guess_lang("你好。") == "zh"
+    assert guess_lang("佢唔喺度。") == "yue"
+    assert guess_lang("これはテスト。") == "ja"
+    assert guess_lang("Hello there.") == "en"
@@ -0,0 +1,95 @@
+import json
+import tarfile
+
+import pytest
+
+pytest.importorskip("torchaudio")
+
+from scripts.cv2.writer import INDEX_FILE, _ShardSink, read_member  # noqa: E402
+
+
+def read_index(out_dir):
+    lines = (out_dir / INDEX_FILE).read_text(encoding="utf-8").splitlines()
+    return [json.loads(line) for line in lines]
+
+
+def fill(out_dir, members, shard_size=100, shard_max_bytes=1 << 30):
+    sink = _ShardSink(out_dir, shard_size, shard_max_bytes)
+    for key, data in members:
+        sink.add(key, "wav", data, {"text": key})
+    sink.close()
+    return sink
+
+
+MEMBERS = [
+    ("001", b"RIFF" + bytes(range(256)) * 3),
+    ("002", b""),
+    ("x" * 150, b"long name needs a pax header"),  # > 100 chars
+    ("日本語", "non-ascii name".encode("utf-8")),
+    ("003", bytes(511)),  # Ends one byte short of a tar block
+]
+
+
+def test_offsets_read_back_every_member(tmp_path):
+    fill(tmp_path, MEMBERS)
+    index = read_index(tmp_path)
+    assert [e["key"] for e in index] == [key for key, _ in MEMBERS]
+    for entry, (_, data) in zip(index, MEMBERS):
+        assert entry["size"] == len(data)
+        assert read_member(tmp_path, entry) == data
+
+
+def test_offsets_match_tarfile(tmp_path):
+    fill(tmp_path, MEMBERS)
+    with tarfile.open(tmp_path / "shard-000000.tar") as tar:
+        members = {m.name: m for m in tar.getmembers()}
+        for entry in read_index(tmp_path):
+            member = members[f"{entry['key']}.wav"]
+            assert member.offset_data == entry["offset"]
+            meta = json.load(tar.extractfile(f"{entry['key']}.json"))
+            assert meta == {"text": entry["key"]}
+
+
+def test_rotates_by_count_and_bytes(tmp_path):
+    by_count = tmp_path / "count"
+    by_count.mkdir()
+    assert fill(by_count, MEMBERS, shard_size=2).n_shards == 3
+    index = read_index(by_count)
+    assert [e["shard"] for e in index] == [
+        "shard-000000.tar",
+        "shard-000000.tar",
+        "shard-000001.tar",
+        "shard-000001.tar",
+        "shard-000002.tar",
+    ]
+    for entry, (_, data) in zip(index, MEMBERS):
+        assert read_member(by_count, entry) == data
+
+    by_bytes = tmp_path / "bytes"
+    by_bytes.mkdir()
+    # Every shard is full after its first member
+    assert fill(by_bytes, MEMBERS, shard_max_bytes=1).n_shards == len(MEMBERS)
+    for entry, (_, data) in zip(read_index(by_bytes), MEMBERS):
+        assert read_member(by_bytes, entry) == data
+
+
+def test_second_run_appends_without_overwriting(tmp_path):
+    first = [("k1", b"A" * 10), ("k2", b"AA")]
+    second = [("k1", b"B" * 12), ("k3", b"BBB")]
+    fill(tmp_path, first, shard_size=1)
+    fill(tmp_path, second, shard_size=1)
+
+    index = read_index(tmp_path)
+    assert [e["shard"] for e in index] == [f"shard-00000{i}.tar" for i in range(4)]
+    for entry, (key, data) in zip(index, first + second):
+        assert entry["key"] == key
+        assert read_member(tmp_path, entry) == data
+
+
+def test_index_entries_are_flushed(tmp_path):
+    sink = _ShardSink(tmp_path, 100, 1 << 30)
+    sink.add("k1", "wav", b"data", {})
+    # Readable before close, as after a crash
+    (entry,) = read_index(tmp_path)
+    assert read_member(tmp_path, entry) == b"data"
+    sink.close()
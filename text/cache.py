@@ -0,0 +1,33 @@
+"""Location of derived data built at runtime (lookup tables, lexicons).
+
+Kept outside the source tree so installs stay read-only and nothing shows up
+as untracked: ``$UTTERTUNE_CACHE_DIR``, else ``$XDG_CACHE_HOME/uttertune``,
+else ``~/.cache/uttertune``.
+"""
+
+import os
+from importlib import metadata
+
+
+def cache_dir():
+    path = os.environ.get("UTTERTUNE_CACHE_DIR")
+    if not path:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        path = os.path.join(base, "uttertune")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def package_versions(*names):
+    """``name-version`` tags for cache file names, so a cache built by one
+    library version is never read by another."""
+    tags = []
+    for name in names:
+        try:
+            version = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            version = "unknown"
+        tags.append(f"{name}-{version}")
+    return "_".join(tags)
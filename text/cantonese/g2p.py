@@ -1,9 +1,16 @@
+import os
+import pickle
 import re
 import unicodedata
+from itertools import product
 from typing import Optional
 import pycantonese
 import ToJyutping
+from text.cache import cache_dir, package_versions
 from text.symbols import punctuations
+from text.cantonese.symbols import ONSETS, NUCLEUSES, CODAS
+
+TONES = "123456"
 
 
 def word2jyutping(word):
@@ -84,14 +91,70 @@ def get_jyutping(text):
     return jyutping_array
 
 
+def build_syllable_table():
+    """Decompose every onset/nucleus/coda/tone combination with pycantonese."""
+    table = {}
+    for onset, nucleus, coda, tone in product(
+        [""] + ONSETS.split(), NUCLEUSES.split(), [""] + CODAS.split(), TONES
+    ):
+        syllable = onset + nucleus + coda + tone
+        try:
+            x = pycantonese.parse_jyutping(syllable)
+        except ValueError:
+            continue
+        if len(x) == 1:
+            table[syllable] = (x[0].onset, x[0].nucleus, x[0].coda, x[0].tone)
+
+    return table
+
+
+def syllable_table_path():
+    # The decompositions come from pycantonese, so a table built by another
+    # version is stale
+    name = f"jyutping_table_{package_versions('pycantonese', 'ToJyutping')}.pickle"
+    return os.path.join(cache_dir(), name)
+
+
+def cache_syllable_table(table, file_path):
+    # Rename into place so a concurrent import never reads a partial file
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as pickle_file:
+        pickle.dump(table, pickle_file)
+    os.replace(tmp_path, file_path)
+
+
+def get_syllable_table():
+    file_path = syllable_table_path()
+    if os.path.exists(file_path):
+        with open(file_path, "rb") as pickle_file:
+            table = pickle.load(pickle_file)
+    else:
+        table = build_syllable_table()
+        cache_syllable_table(table, file_path)
+
+    return table
+
+
+syllable_table = get_syllable_table()
+
+
 def parse_jyutping(jyutping: str):
+    parsed = syllable_table.get(jyutping)
+    if parsed is not None:
+        return parsed
+
+    # Fall back to pycantonese for anything outside the table (e.g. upper case
+    # or multi-syllable strings) and remember the result for the next call
     x = pycantonese.parse_jyutping(jyutping)
 
     if not x or len(x) == 0:
         raise ValueError(f"Failed to parse jyutping: {jyutping}")
     x = x[0]  # Take the first parsed result
 
-    return x.onset, x.nucleus, x.coda, x.tone
+    parsed = (x.onset, x.nucleus, x.coda, x.tone)
+    syllable_table[jyutping] = parsed
+
+    return parsed
 
 
 def g2p(
@@ -3,6 +3,7 @@ from text.mandarin.g2p import g2p as mandarin_g2p
 from text.cantonese.g2p import g2p as cantonese_g2p
 from text.english.g2p import g2p as english_g2p
 from text.multilingual import g2p as multilingual_g2p
+from text.number_utils import normalize_numbers_chinese
 from text.symbols import punctuations
 
 rep_map = {
@@ -90,6 +91,9 @@ def replace_punctuation(text: str, lang="yue") -> str:
 
 def text_normalize(text: str, lang="yue") -> str:
     text = text.strip()
+    if lang in ["yue", "zh"]:
+        # Spell out digits before they are dropped as non-Chinese characters
+        text = normalize_numbers_chinese(text, lang=lang)
     text = replace_punctuation(text, lang=lang)
     return text
 
@@ -0,0 +1,154 @@
+"""Compact binary CMU dictionary backed by a read-only memory map.
+
+Layout (native byte order, every section 4-byte aligned)::
+
+    header       magic, version, n_words, n_phones, key_bytes, value_bytes
+    phone table  n_phones x (uint8 length + ascii name)
+    key offsets  (n_words + 1) x uint32
+    value offsets (n_words + 1) x uint32
+    keys         utf-8 words, sorted bytewise
+    values       uint8 phone ids, SYLLABLE_SEP between syllables
+
+Every process maps the same file, so the pages are shared through the page
+cache instead of each worker unpickling its own copy of the dictionary.
+"""
+
+import mmap
+import os
+import struct
+from array import array
+from functools import lru_cache
+
+MAGIC = b"CMUB"
+VERSION = 1
+SYLLABLE_SEP = 0xFF
+_HEADER = struct.Struct("=4sIIIII")
+
+
+def _pad(n):
+    return (-n) % 4
+
+
+def write_dict(g2p_dict, file_path):
+    """Serialize ``{word: [[phone, ...], ...]}`` into the binary layout."""
+    phones = sorted({p for syllables in g2p_dict.values() for s in syllables for p in s})
+    if len(phones) >= SYLLABLE_SEP:
+        raise ValueError(f"Too many distinct phones for uint8 ids: {len(phones)}")
+    phone_to_id = {p: i for i, p in enumerate(phones)}
+
+    entries = sorted((w.encode("utf-8"), syllables) for w, syllables in g2p_dict.items())
+    key_offsets = array("I", [0])
+    value_offsets = array("I", [0])
+    keys = bytearray()
+    values = bytearray()
+    for key, syllables in entries:
+        keys += key
+        key_offsets.append(len(keys))
+        for i, syllable in enumerate(syllables):
+            if i > 0:
+                values.append(SYLLABLE_SEP)
+            values += bytes(phone_to_id[p] for p in syllable)
+        value_offsets.append(len(values))
+
+    phone_table = bytearray()
+    for p in phones:
+        name = p.encode("ascii")
+        phone_table.append(len(name))
+        phone_table += name
+
+    # Write next to the target and rename, so concurrent builders never
+    # expose a half-written file to readers
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(entries), len(phones), len(keys), len(values)))
+        for section in (phone_table, key_offsets.tobytes(), value_offsets.tobytes(), keys):
+            f.write(section)
+            f.write(b"\0" * _pad(len(section)))
+        f.write(values)
+    os.replace(tmp_path, file_path)
+
+
+class CMUDict:
+    """Read-only mapping from upper-case word to its syllabified phones."""
+
+    def __init__(self, file_path):
+        with open(file_path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buf) < _HEADER.size:
+            raise ValueError(f"Not a CMU dictionary cache (v{VERSION}): {file_path}")
+
+        magic, version, n_words, n_phones, key_bytes, value_bytes = _HEADER.unpack_from(
+            self._buf, 0
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a CMU dictionary cache (v{VERSION}): {file_path}")
+        self._n_words = n_words
+
+        pos = _HEADER.size
+        self._phones = []
+        for _ in range(n_phones):
+            length = self._buf[pos]
+            self._phones.append(self._buf[pos + 1 : pos + 1 + length].decode("ascii"))
+            pos += 1 + length
+        pos += _pad(pos - _HEADER.size)
+
+        view = memoryview(self._buf)
+        offsets_size = (n_words + 1) * 4
+        self._key_offsets = view[pos : pos + offsets_size].cast("I")
+        pos += offsets_size
+        self._value_offsets = view[pos : pos + offsets_size].cast("I")
+        pos += offsets_size
+        self._keys_start = pos
+        pos += key_bytes + _pad(key_bytes)
+        self._values_start = pos
+
+    def __len__(self):
+        return self._n_words
+
+    def _key(self, i):
+        start = self._keys_start
+        return self._buf[start + self._key_offsets[i] : start + self._key_offsets[i + 1]]
+
+    def _find(self, word):
+        key = word.encode("utf-8")
+        lo, hi = 0, self._n_words
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._n_words and self._key(lo) == key:
+            return lo
+        return -1
+
+    @lru_cache(maxsize=4096)
+    def _lookup(self, word):
+        i = self._find(word)
+        if i < 0:
+            return None
+        start = self._values_start
+        ids = self._buf[start + self._value_offsets[i] : start + self._value_offsets[i + 1]]
+        syllables = [[]]
+        for phone_id in ids:
+            if phone_id == SYLLABLE_SEP:
+                syllables.append([])
+            else:
+                syllables[-1].append(self._phones[phone_id])
+        return syllables
+
+    def __contains__(self, word):
+        return self._lookup(word) is not None
+
+    def __getitem__(self, word):
+        syllables = self._lookup(word)
+        if syllables is None:
+            raise KeyError(word)
+        # Hand out copies so callers cannot mutate the cached entry
+        return [list(s) for s in syllables]
+
+    def get(self, word, default=None):
+        try:
+            return self[word]
+        except KeyError:
+            return default
@@ -1,17 +1,27 @@
-import pickle
 import os
 import re
 from g2p_en import G2p
-from transformers import DebertaV2Tokenizer
+from text.cache import cache_dir
 from text.symbols import punctuations
 from text.english.symbols import symbols
+from text.english.cmudict import VERSION as CMUDICT_VERSION, CMUDict, write_dict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 current_file_path = os.path.dirname(__file__)
 CMU_DICT_PATH = os.path.join(current_file_path, "cmudict.rep")
-CACHE_PATH = os.path.join(current_file_path, "cmudict_cache.pickle")
+CACHE_PATH = os.path.join(cache_dir(), f"cmudict_v{CMUDICT_VERSION}.bin")
+# Shared by every process that synthesizes English; set the env var to keep
+# separate lexicons (e.g. per experiment)
+OOV_LEXICON_PATH = os.environ.get("UTTERTUNE_OOV_LEXICON") or os.path.join(
+    cache_dir(), "oov_lexicon.tsv"
+)
 _g2p = G2p()
 LOCAL_PATH = "./bert/deberta-v3-large"
-tokenizer = DebertaV2Tokenizer.from_pretrained(LOCAL_PATH)
+_tokenizer = None
 
 arpa = {
     "AH0",
@@ -138,24 +148,75 @@ def read_dict():
 
 
 def cache_dict(g2p_dict, file_path):
-    with open(file_path, "wb") as pickle_file:
-        pickle.dump(g2p_dict, pickle_file)
+    write_dict(g2p_dict, file_path)
 
 
 def get_dict():
     if os.path.exists(CACHE_PATH):
-        with open(CACHE_PATH, "rb") as pickle_file:
-            g2p_dict = pickle.load(pickle_file)
-    else:
-        g2p_dict = read_dict()
-        cache_dict(g2p_dict, CACHE_PATH)
+        try:
+            return CMUDict(CACHE_PATH)
+        except ValueError:
+            pass  # Stale or damaged cache; rebuild it
 
-    return g2p_dict
+    g2p_dict = read_dict()
+    cache_dict(g2p_dict, CACHE_PATH)
+    return CMUDict(CACHE_PATH)
 
 
 eng_dict = get_dict()
 
 
+def _lock(f, shared=False):
+    """Advisory lock held until ``f`` is closed (no-op without fcntl)."""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+
+class OOVLexicon:
+    """Persistent memo of neural G2P predictions for words outside ``eng_dict``.
+
+    Entries are stored one per line as ``word<TAB>phones`` and appended as new
+    words are predicted, so the lexicon grows across runs and processes. Reads
+    and appends hold an advisory lock on the file, so concurrent workers never
+    see or write interleaved lines. ``file_path=None`` keeps it in memory.
+    """
+
+    def __init__(self, file_path=OOV_LEXICON_PATH, predictor=None):
+        self.file_path = file_path
+        self.predictor = predictor
+        self.entries = {}
+
+        if file_path is not None and os.path.exists(file_path):
+            with open(file_path, encoding="utf-8") as f:
+                _lock(f, shared=True)
+                for line in f:
+                    word, _, phones = line.rstrip("\n").partition("\t")
+                    if word:
+                        self.entries[word] = phones.split()
+
+    def lookup(self, words):
+        """Return ``{word: phones}``, predicting each unseen word only once."""
+        result = {}
+        new_entries = {}
+        for w in words:
+            if w not in self.entries and w not in new_entries:
+                predictor = self.predictor or _g2p
+                new_entries[w] = list(filter(lambda p: p != " ", predictor(w)))
+            result[w] = new_entries[w] if w in new_entries else self.entries[w]
+
+        if new_entries:
+            self.entries.update(new_entries)
+            if self.file_path is not None:
+                lines = "".join(f"{w}\t{' '.join(p)}\n" for w, p in new_entries.items())
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    _lock(f)
+                    f.write(lines)
+
+        return result
+
+oov_lexicon = OOVLexicon()
+
+
 def refine_ph(phn):
     tone = 0
     if re.search(r"\d$", phn):
@@ -187,8 +248,56 @@ def distribute_phone(n_phone, n_word):
     return phones_per_word
 
 
-def text_to_words(text):
-    tokens = tokenizer.tokenize(text)
+def get_tokenizer():
+    # Loaded on first use so the regex splitter never pays for it
+    global _tokenizer
+    if _tokenizer is None:
+        from transformers import DebertaV2Tokenizer
+
+        _tokenizer = DebertaV2Tokenizer.from_pretrained(LOCAL_PATH)
+    return _tokenizer
+
+
+# Marks outside the phone set are split off like punctuation and mapped to the
+# nearest one, as text.cleaners.rep_map does; a run of dots is a single "…"
+_split_map = {'"': "'", "(": "'", ")": "'", ":": ",", ";": ","}
+_punctuation_class = "".join(re.escape(p) for p in punctuations + list(_split_map))
+_piece_re = re.compile(rf"\.{{2,}}|[{_punctuation_class}]|[^\s{_punctuation_class}]+")
+
+
+def deberta_tokenize(text):
+    return get_tokenizer().tokenize(text)
+
+
+def _split_piece(piece):
+    if len(piece) > 1 and piece[0] == ".":
+        return "…"
+    return _split_map.get(piece, piece)
+
+
+def regex_tokenize(text):
+    """SentencePiece-style pieces: each punctuation mark on its own, ``▁`` on
+    the first piece of every whitespace-separated chunk."""
+    tokens = []
+    for chunk in text.split():
+        for i, m in enumerate(_piece_re.finditer(chunk)):
+            piece = _split_piece(m.group())
+            tokens.append(f"▁{piece}" if i == 0 else piece)
+    return tokens
+
+
+word_splitters = {
+    "deberta": deberta_tokenize,
+    "regex": regex_tokenize,
+}
+# DeBERTa matches the word grouping the frontend was trained on (words it splits
+# into subword pieces are pronounced piece by piece); UTTERTUNE_EN_SPLITTER=regex
+# or splitter="regex" avoids loading transformers and the checkpoint
+DEFAULT_SPLITTER = os.environ.get("UTTERTUNE_EN_SPLITTER", "deberta")
+
+
+def text_to_words(text, splitter=None):
+    tokens = word_splitters[splitter or DEFAULT_SPLITTER](text)
     words = []
     for idx, t in enumerate(tokens):
         if t.startswith("▁"):
@@ -214,23 +323,40 @@ def text_to_words(text):
     return words
 
 
-def g2p(text, phoneme=None, padding=True):
+def merge_apostrophes(word):
+    if len(word) > 1:
+        if "'" in word:
+            word = ["".join(word)]
+    return word
+
+
+def collect_oov(words):
+    return [
+        w
+        for word in words
+        for w in merge_apostrophes(word)
+        if w not in punctuations and w.upper() not in eng_dict
+    ]
+
+
+def g2p(text, phoneme=None, padding=True, splitter=None):
     phones = []
     tones = []
     syllable_pos = []
     word_pos = []
     ws_labels = []
     phone_len = []
-    words = text_to_words(text)
+    words = text_to_words(text, splitter)
 
     if phoneme is not None:
         raise NotImplementedError("Phoneme input is not supported yet.")
 
+    # Resolve every OOV word of the sentence in one batch
+    oov_phones = oov_lexicon.lookup(collect_oov(words))
+
     for word in words:
         temp_phones, temp_tones = [], []
-        if len(word) > 1:
-            if "'" in word:
-                word = ["".join(word)]
+        word = merge_apostrophes(word)
         for w in word:
             if w in punctuations:
                 temp_phones.append(w)
@@ -241,7 +367,7 @@ def g2p(text, phoneme=None, padding=True):
                 temp_phones += [post_replace_ph(i) for i in phns]
                 temp_tones += tns
             else:
-                phone_list = list(filter(lambda p: p != " ", _g2p(w)))
+                phone_list = oov_phones[w]
                 phns = []
                 tns = []
                 for ph in phone_list:
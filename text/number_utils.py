@@ -1,6 +1,7 @@
 """ from https://github.com/keithito/tacotron """
 
 import re
+from functools import lru_cache
 
 import inflect
 
@@ -12,6 +13,18 @@ _dollars_re = re.compile(r"\$([0-9\.\,]*[0-9]+)")
 _ordinal_re = re.compile(r"[0-9]+(st|nd|rd|th)")
 _number_re = re.compile(r"[0-9]+")
 
+# A maximal run of currency signs, digits and separators (plus an ordinal
+# suffix). None of the patterns above can match across the edge of such a run,
+# so expanding each run on its own gives the same result as running the six
+# passes over the whole text.
+_numeric_token_re = re.compile(r"[£$0-9\.\,]*[0-9][£$0-9\.\,]*(?:st|nd|rd|th)?")
+_token_types = [
+    ("number", re.compile(r"[0-9]+")),
+    ("grouped", re.compile(r"[0-9]{1,3}(?:,[0-9]{3})+")),
+    ("decimal", re.compile(r"[0-9]+\.[0-9]+")),
+    ("ordinal", re.compile(r"[0-9]+(?:st|nd|rd|th)")),
+]
+
 
 def _remove_commas(m):
     return m.group(1).replace(",", "")
@@ -46,8 +59,8 @@ def _expand_ordinal(m):
     return _inflect.number_to_words(m.group(0))
 
 
-def _expand_number(m):
-    num = int(m.group(0))
+@lru_cache(maxsize=4096)
+def _number_to_words(num):
     if num > 1000 and num < 3000:
         if num == 2000:
             return "two thousand"
@@ -61,7 +74,11 @@ def _expand_number(m):
         return _inflect.number_to_words(num, andword="")
 
 
-def normalize_numbers(text):
+def _expand_number(m):
+    return _number_to_words(int(m.group(0)))
+
+
+def _normalize_numbers_sequential(text):
     text = re.sub(_comma_number_re, _remove_commas, text)
     text = re.sub(_pounds_re, r"\1 pounds", text)
     text = re.sub(_dollars_re, _expand_dollars, text)
@@ -69,3 +86,134 @@ def normalize_numbers(text):
     text = re.sub(_ordinal_re, _expand_ordinal, text)
     text = re.sub(_number_re, _expand_number, text)
     return text
+
+
+@lru_cache(maxsize=4096)
+def _normalize_token(token):
+    for kind, pattern in _token_types:
+        if pattern.fullmatch(token):
+            break
+    else:
+        # Currency and unusual mixes of separators take the original passes
+        return _normalize_numbers_sequential(token)
+
+    if kind == "number":
+        return _number_to_words(int(token))
+    elif kind == "grouped":
+        return _number_to_words(int(token.replace(",", "")))
+    elif kind == "decimal":
+        integer, fraction = token.split(".")
+        return f"{_number_to_words(int(integer))} point {_number_to_words(int(fraction))}"
+    else:
+        return _inflect.number_to_words(token)
+
+
+# Readings inside PHON spans are verbatim (jyutping and pinyin carry tone
+# digits), so numbers are only expanded outside them
+_phon_span_re = re.compile(r"(<PHON_START>.*?<PHON_END>)", re.S)
+
+
+def _outside_phon(text, normalize):
+    parts = _phon_span_re.split(text)
+    return "".join(p if i % 2 else normalize(p) for i, p in enumerate(parts))
+
+
+def normalize_numbers(text):
+    return _outside_phon(
+        text,
+        lambda t: _numeric_token_re.sub(lambda m: _normalize_token(m.group(0)), t),
+    )
+
+
+_zh_digits = "零一二三四五六七八九"
+_zh_small_units = ["", "十", "百", "千"]
+_zh_large_units = {
+    "zh": ["", "万", "亿", "万亿"],
+    "yue": ["", "萬", "億", "萬億"],
+}
+_zh_two = {"zh": "两", "yue": "兩"}
+_zh_point = {"zh": "点", "yue": "點"}
+# Years (2024年) are read digit by digit
+_zh_number_re = re.compile(
+    r"(?P<year>[0-9]{4}(?=年))|[0-9]+(?:,[0-9]{3})*(?:\.[0-9]+)?"
+)
+
+
+def _read_digits_zh(digits):
+    return "".join(_zh_digits[int(d)] for d in digits)
+
+
+@lru_cache(maxsize=4096)
+def _number_to_chinese(num, lang):
+    if num == 0:
+        return _zh_digits[0]
+
+    groups = []
+    while num > 0:
+        groups.append(num % 10000)
+        num //= 10000
+    if len(groups) > len(_zh_large_units[lang]):
+        return None
+
+    words = ""
+    need_zero = False
+    for i in reversed(range(len(groups))):
+        group = groups[i]
+        if group == 0:
+            need_zero = bool(words)
+            continue
+        if need_zero or (words and group < 1000):
+            words += _zh_digits[0]
+        need_zero = False
+
+        group_words = ""
+        group_zero = False
+        for j in reversed(range(4)):
+            d = group // 10**j % 10
+            if d == 0:
+                group_zero = bool(group_words)
+                continue
+            if group_zero:
+                group_words += _zh_digits[0]
+                group_zero = False
+            # 两千, 两万, 两亿 but 二百, 二十, 十二
+            if d == 2 and (j == 3 or (group == 2 and i > 0)):
+                group_words += _zh_two[lang] + _zh_small_units[j]
+                continue
+            group_words += _zh_digits[d] + _zh_small_units[j]
+        words += group_words + _zh_large_units[lang][i]
+
+    # 一十二 -> 十二
+    if words.startswith(_zh_digits[1] + _zh_small_units[1]):
+        words = words[1:]
+    return words
+
+
+@lru_cache(maxsize=4096)
+def _normalize_token_chinese(token, lang):
+    integer, _, fraction = token.replace(",", "").partition(".")
+
+    # Leading zeros (phone numbers, codes) are read digit by digit
+    if len(integer) > 1 and integer.startswith("0"):
+        words = _read_digits_zh(integer)
+    else:
+        words = _number_to_chinese(int(integer), lang)
+        if words is None:
+            words = _read_digits_zh(integer)
+
+    if fraction:
+        words += _zh_point[lang] + _read_digits_zh(fraction)
+    return words
+
+
+def normalize_numbers_chinese(text, lang="zh"):
+    """Spell out Arabic numerals as Chinese numerals for the ``zh``/``yue`` G2P."""
+    if lang not in _zh_large_units:
+        raise ValueError(f"Language {lang} not supported for number normalization.")
+
+    def expand(m):
+        if m.group("year"):
+            return _read_digits_zh(m.group("year"))
+        return _normalize_token_chinese(m.group(0), lang)
+
+    return _outside_phon(text, lambda t: _zh_number_re.sub(expand, t))